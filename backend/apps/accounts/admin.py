@@ -30,7 +30,7 @@ class UserAdmin(BaseUserAdmin, ModelAdmin):
     readonly_fields = ['created_at', 'updated_at', 'get_prescriptions', 'latest_prescription', 'create_prescription_button']
     fieldsets = (
         ('Personal Info', {
-            'fields': ('phone_number', 'first_name', 'last_name', 'email', 'age', 'birth_date')
+            'fields': ('phone_number', 'first_name', 'last_name', 'email', 'age', 'birth_date', 'preferred_language')
         }),
         ('Prescriptions', {
             'fields': ('get_prescriptions', 'latest_prescription', 'create_prescription_button')
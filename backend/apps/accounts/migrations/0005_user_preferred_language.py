@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_is_student'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='preferred_language',
+            field=models.CharField(choices=[('en', 'English'), ('hi', 'Hindi'), ('mr', 'Marathi')], default='en', max_length=5),
+        ),
+    ]
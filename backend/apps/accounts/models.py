@@ -24,9 +24,17 @@ class UserManager(BaseUserManager):
         return self.get(phone_number=phone_number)
 
 class User(AbstractBaseUser, PermissionsMixin):
+    LANGUAGE_CHOICES = [
+        ("en", "English"),
+        ("hi", "Hindi"),
+        ("mr", "Marathi"),
+    ]
+
     phone_number = models.CharField(max_length=15, unique=True)
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
+    # Language of WhatsApp messages sent to the patient
+    preferred_language = models.CharField(max_length=5, choices=LANGUAGE_CHOICES, default="en")
     
     email = models.EmailField(unique=True, null=True, blank=True)
     age = models.PositiveSmallIntegerField(null=True, blank=True)
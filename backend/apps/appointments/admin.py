@@ -3,19 +3,43 @@ from unfold.admin import ModelAdmin
 from django.utils.html import format_html
 from django.urls import reverse, path
 from django.shortcuts import redirect
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, HttpResponseNotModified, JsonResponse
+from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from django.db import models
 from django import forms
-from django.db.models import F
 from django.template.response import TemplateResponse
 from django.forms import DateTimeInput
-from .models import AppointmentRequest, Appointment, TreatmentSession, TreatmentPlan
-from .notification_service import send_notification_on_whatsapp
+from .models import AppointmentRequest, Appointment, AppointmentSeries, TreatmentSession, TreatmentPlan, Payment, OVERLAP_MESSAGE, database_enforces_overlap
+from .availability import SLOT_DURATION
+from .calendar_feed import window_etag, get_calendar_events
+from .recurrence import plan_series, book_series, exceeds_max_occurrences, MAX_OCCURRENCES
+from .notification_service import send_notification_on_whatsapp, send_notifications, TreatmentSessionEvent
+from .payments import record_payment
 from ..prescriptions.models import Prescription
 
+class AppointmentAdminForm(forms.ModelForm):
+    class Meta:
+        model = Appointment
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Model.clean() leaves overlaps to the database constraint on PostgreSQL.
+        # Check here as well so staff get a form error instead of a failed save.
+        scheduled_at = cleaned_data.get('scheduled_at')
+        if scheduled_at and cleaned_data.get('status') != 'canceled' and database_enforces_overlap():
+            qs = Appointment.overlapping(scheduled_at, scheduled_at + SLOT_DURATION)
+            if self.instance.pk:
+                qs = qs.exclude(pk=self.instance.pk)
+            if qs.exists():
+                raise forms.ValidationError(OVERLAP_MESSAGE)
+        return cleaned_data
+
+
 @admin.register(Appointment)
 class AppointmentAdmin(ModelAdmin):
+    form = AppointmentAdminForm
     list_display = ['get_user_full_name', 'get_user_phone_number', 'get_prescriptions','latest_prescription', 'create_prescription_button', 'scheduled_at', 'end_time', 'status', 'payment_method', 'created_at']
     list_filter = ['status', 'scheduled_at', 'created_at']
     search_fields = ['user__phone_number', 'user__first_name', 'user__last_name']
@@ -94,34 +118,42 @@ class AppointmentAdmin(ModelAdmin):
                 self.admin_site.admin_view(self.calender_view),
                 name="appointments-calender",
             ),
+            path(
+                "calender/events/",
+                self.admin_site.admin_view(self.calender_events_view),
+                name="appointments-calender-events",
+            ),
         ]
         return custom_urls + urls
     
     def calender_view(self, request):
-        appointments = Appointment.objects.all().values(
-            'id', 
-            'scheduled_at',
-            'end_time',
-            'status',
-            user_name = F('user__first_name')
-        )
-
-        events = [
-            {            
-            'id': apt['id'],
-            'title': f"{apt['user_name']} - {apt['status']}",
-            'start': apt['scheduled_at'].isoformat(),
-            'end': apt['end_time'].isoformat() if apt['end_time'] else None,
-            'backgroundColor': '#0275d8' if apt['status'] == 'confirmed' else '#ffc107',
-            }
-            for apt in appointments
-            if apt['scheduled_at']
-        ]
+        # Events are fetched per visible range from calender_events_view
         return TemplateResponse(
             request,
             "admin/appointments_calender.html",
-            {'events': events}
+            {'events_url': reverse('admin:appointments-calender-events')}
         )
+
+    def calender_events_view(self, request):
+        """JSON feed for FullCalendar, scoped to the visible `start`/`end` range"""
+        start = parse_datetime(request.GET.get('start', ''))
+        end = parse_datetime(request.GET.get('end', ''))
+        if not start or not end or end <= start:
+            return JsonResponse({'error': '`start` and `end` must be ISO 8601 datetimes'}, status=400)
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+
+        etag = window_etag(start, end)
+        quoted_etag = f'"{etag}"'
+        if quoted_etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(get_calendar_events(start, end, etag), safe=False)
+        response['ETag'] = quoted_etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     def get_user_full_name(self, obj):
         if obj.user:
@@ -151,6 +183,10 @@ class AppointmentAdmin(ModelAdmin):
         
         if request_id:
             request.session['appointment_request_id'] = request_id
+            # Pre-fill a slot that was offered to this request after a cancellation
+            offered_slot = AppointmentRequest.objects.filter(pk=request_id).values_list('offered_slot', flat=True).first()
+            if offered_slot:
+                initial['scheduled_at'] = timezone.localtime(offered_slot)
         
         return initial
 
@@ -183,12 +219,104 @@ class AppointmentAdmin(ModelAdmin):
         js = ('admin/js/appointment_admin.js',)
 
 
+class AppointmentSeriesAdminForm(forms.ModelForm):
+    class Meta:
+        model = AppointmentSeries
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('count') and not cleaned_data.get('until'):
+            raise forms.ValidationError("Set either a number of visits or an end date.")
+        if cleaned_data.get('count') and cleaned_data['count'] > MAX_OCCURRENCES:
+            raise forms.ValidationError(f"A series can have at most {MAX_OCCURRENCES} visits.")
+        if cleaned_data.get('starts_at') and cleaned_data.get('frequency') and exceeds_max_occurrences(
+            cleaned_data['starts_at'], cleaned_data['frequency'], cleaned_data.get('interval') or 1,
+            cleaned_data.get('count'), cleaned_data.get('until'),
+        ):
+            raise forms.ValidationError(
+                f"A series can have at most {MAX_OCCURRENCES} visits. Choose an earlier end date."
+            )
+
+        if not self.errors:
+            series = AppointmentSeries(**{
+                field: cleaned_data.get(field)
+                for field in ('user', 'starts_at', 'frequency', 'interval', 'count', 'until', 'notes')
+            })
+            _, conflicts = plan_series(series)
+            if conflicts:
+                raise forms.ValidationError(
+                    "These visits overlap existing appointments: "
+                    + ", ".join(timezone.localtime(start).strftime('%d %b %Y %H:%M') for start in conflicts)
+                )
+        return cleaned_data
+
+    def _post_clean(self):
+        super()._post_clean()
+        # A new series is booked while validating, so a booking that fails
+        # (e.g. a visit taken since clean() checked) re-renders the form with
+        # the error instead of reaching save_model with an unsaved series
+        self.booking = None
+        if self.errors or not self.instance._state.adding:
+            return
+        result = book_series(self.instance)
+        if result.get('error'):
+            self.add_error(None, result['error'])
+        elif result['conflicts'] or not result['created']:
+            self.add_error(None, "Some of these visits were booked in the meantime. Check the times and try again.")
+        else:
+            self.booking = result
+
+
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(ModelAdmin):
+    form = AppointmentSeriesAdminForm
+    list_display = ['user', 'starts_at', 'frequency', 'interval', 'count', 'until', 'get_appointments_count', 'created_at']
+    list_filter = ['frequency', 'created_at']
+    search_fields = ['user__phone_number', 'user__first_name', 'user__last_name']
+    autocomplete_fields = ['user']
+    ordering = ['-created_at']
+
+    formfield_overrides = AppointmentAdmin.formfield_overrides
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').annotate(
+            appointments_count=models.Count('appointments')
+        )
+
+    def get_readonly_fields(self, request, obj=None):
+        # A booked series is edited through its individual appointments
+        if obj:
+            return ['user', 'starts_at', 'frequency', 'interval', 'count', 'until', 'notes', 'created_at']
+        return ['created_at']
+
+    def get_appointments_count(self, obj):
+        url = reverse('admin:appointments_appointment_changelist')
+        return format_html(
+            '<a href="{}?series__id__exact={}">{} appointments</a>',
+            url,
+            obj.pk,
+            obj.appointments_count
+        )
+    get_appointments_count.short_description = 'Appointments'
+
+    def save_model(self, request, obj, form, change):
+        """A new series and its visits were already booked by the form"""
+        if change:
+            return super().save_model(request, obj, form, change)
+        self.message_user(
+            request,
+            f"Booked {form.booking['created']} appointments for {obj.user.first_name} {obj.user.last_name}.",
+        )
+
+
 @admin.register(TreatmentPlan)
 class TreatmentPlanAdmin(ModelAdmin):
-    list_display = ['get_full_name', 'treatment_type', 'get_prescriptions', 'get_latest_prescription', 'create_prescription_button', 'total_amount', 'amount_paid', 'estimated_duration_months', 'is_completed', 'created_at']
+    list_display = ['get_full_name', 'treatment_type', 'get_prescriptions', 'get_latest_prescription', 'create_prescription_button', 'total_amount', 'amount_paid', 'balance', 'estimated_duration_months', 'is_completed', 'created_at']
     list_filter = ['treatment_type', 'is_completed', 'created_at']
     search_fields = ['user__phone_number', 'user__first_name', 'user__last_name']
-    readonly_fields = [ 'get_prescriptions', 'get_latest_prescription', 'created_at']
+    # Totals follow the payment ledger
+    readonly_fields = [ 'get_prescriptions', 'get_latest_prescription', 'amount_paid', 'balance', 'created_at']
     ordering = ['-created_at']
     autocomplete_fields = ['user', 'initial_appointment']
 
@@ -238,12 +366,44 @@ class TreatmentPlanAdmin(ModelAdmin):
     create_prescription_button.short_description = 'Create Prescription'
 
 
+@admin.register(Payment)
+class PaymentAdmin(ModelAdmin):
+    """Payments are append-only: add corrections as new entries"""
+    list_display = ['treatment_plan', 'session', 'amount', 'method', 'received_at', 'notes']
+    list_filter = ['method', 'received_at']
+    search_fields = ['treatment_plan__user__phone_number', 'treatment_plan__user__first_name', 'treatment_plan__user__last_name']
+    list_select_related = ['treatment_plan__user', 'session']
+    autocomplete_fields = ['treatment_plan']
+    raw_id_fields = ['session']
+    date_hierarchy = 'received_at'
+    ordering = ['-received_at']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        # Through the payments module so the plan's totals move with the entry
+        obj.pk = record_payment(
+            obj.treatment_plan_id,
+            obj.amount,
+            method=obj.method,
+            session=obj.session,
+            notes=obj.notes,
+            received_at=obj.received_at,
+        ).pk
+
+
 @admin.register(TreatmentSession)
 class TreatmentSessionAdmin(ModelAdmin):
     list_display = ['get_user_name', 'get_treatment_type', 'session_number', 'scheduled_at', 'notification_status', 'notify_button']
     list_filter = ['treatment_plan__treatment_type', 'scheduled_at', 'notification_sent']
     search_fields = ['treatment_plan__user__phone_number', 'treatment_plan__user__first_name', 'treatment_plan__user__last_name']
     readonly_fields = ['session_number', 'created_at', 'updated_at', 'notification_sent', 'notified_at']
+    list_select_related = ['treatment_plan__user']
+    actions = ['notify_selected_on_whatsapp']
 
     fieldsets = (
         ('Treatment Session Info', {
@@ -315,19 +475,50 @@ class TreatmentSessionAdmin(ModelAdmin):
         ]
         return custom_urls + urls
     
+    @admin.action(description="Notify selected on WhatsApp")
+    def notify_selected_on_whatsapp(self, request, queryset):
+        """Send the scheduled-session message for the selected sessions concurrently"""
+        sessions = list(queryset.select_related('treatment_plan__user'))
+        due = [s for s in sessions if not s.notification_sent and s.scheduled_at]
+        skipped = len(sessions) - len(due)
+
+        sent, failed = send_notifications(due, TreatmentSessionEvent.CREATED)
+        # One UPDATE for the batch; a queryset update doesn't re-trigger the notify signal
+        TreatmentSession.objects.filter(pk__in=[s.pk for s in sent]).update(
+            notification_sent=True, notified_at=timezone.now()
+        )
+
+        message = f"WhatsApp notification sent for {len(sent)} sessions."
+        if skipped:
+            message += f" {skipped} skipped (already notified or not scheduled)."
+        self.message_user(request, message)
+        if failed:
+            details = ", ".join(f"session {s.session_number} of {self.get_user_name(s)}: {reason}" for s, reason in failed[:5])
+            self.message_user(request, f"{len(failed)} notifications failed: {details}", level='error')
+
     def send_notification_action(self, request, session_id):
         """Custom admin action to send WhatsApp notification"""
         try:
-            treatment_session = TreatmentSession.objects.get(pk=session_id)
-            response = send_notification_on_whatsapp(treatment_session)
+            treatment_session = TreatmentSession.objects.select_related('treatment_plan__user').get(pk=session_id)
+        except TreatmentSession.DoesNotExist:
+            self.message_user(request, "Treatment session not found", level='error')
+            return HttpResponseRedirect(reverse('admin:appointments_treatmentsession_changelist'))
 
+        if not treatment_session.scheduled_at:
+            self.message_user(request, "Schedule the session before notifying the patient.", level='error')
+            return HttpResponseRedirect(reverse('admin:appointments_treatmentsession_changelist'))
 
+        response = send_notification_on_whatsapp(treatment_session, event=TreatmentSessionEvent.CREATED)
+        if response['status'] == 'sent':
+            TreatmentSession.objects.filter(pk=treatment_session.pk).update(
+                notification_sent=True, notified_at=timezone.now()
+            )
             self.message_user(
                 request,
                 f"WhatsApp notification sent to {treatment_session.treatment_plan.user.first_name} {treatment_session.treatment_plan.user.last_name}."
             )
-        except TreatmentSession.DoesNotExist:
-            self.message_user(request, "Treatment session not found", level='error')
+        else:
+            self.message_user(request, f"WhatsApp notification failed: {response['reason']}", level='error')
 
         return HttpResponseRedirect(
             reverse('admin:appointments_treatmentsession_changelist')
@@ -336,7 +527,7 @@ class TreatmentSessionAdmin(ModelAdmin):
 # Readonly admin for AppointmentRequest
 @admin.register(AppointmentRequest)
 class AppointmentRequestAdmin(ModelAdmin):
-    list_display = ['get_user_full_name', 'get_user_phone_number', 'created_at', 'status', 'source', 'create_appointment_button', 'created_at']
+    list_display = ['get_user_full_name', 'get_user_phone_number', 'created_at', 'status', 'source', 'day_availability', 'offered_slot', 'create_appointment_button', 'created_at']
     list_filter = ['status', 'source', 'created_at']
     search_fields = ['user__phone_number', 'user__first_name', 'user__last_name']
     readonly_fields = ['user', 'created_at', 'updated_at', 'source']
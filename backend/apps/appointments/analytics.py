@@ -0,0 +1,167 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Appointment, Payment, TreatmentPlan
+
+# Results are versioned, so the timeout only bounds how long unused months linger
+CACHE_TIMEOUT = 60 * 60 * 24
+MAX_MONTHS = 120
+# Bumped when a change can move numbers in every month, e.g. a plan changing treatment type
+GLOBAL_VERSION_KEY = "analytics:version"
+
+
+def month_of(dt):
+    """'YYYY-MM' of a datetime in the clinic's timezone."""
+    return timezone.localtime(dt).strftime("%Y-%m")
+
+
+def month_start(month):
+    return timezone.make_aware(datetime.strptime(month, "%Y-%m"))
+
+
+def add_months(month, count):
+    year, number = map(int, month.split("-"))
+    index = year * 12 + number - 1 + count
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def next_month(month):
+    return add_months(month, 1)
+
+
+def month_range(first, last):
+    """Months from `first` to `last` inclusive, as 'YYYY-MM' strings."""
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def _version_key(month):
+    return f"analytics:version:{month}"
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def touch(*datetimes, everything=False):
+    """
+    Invalidate the cached months the datetimes fall in, once the current
+    transaction commits. Pass everything=True when all months may change.
+    """
+    months = {month_of(dt) for dt in datetimes if dt}
+    if not months and not everything:
+        return
+
+    def bump():
+        if everything:
+            _bump(GLOBAL_VERSION_KEY)
+        for month in months:
+            _bump(_version_key(month))
+
+    transaction.on_commit(bump)
+
+
+def _empty_month(month):
+    return {
+        "month": month,
+        "revenue_by_treatment": {},
+        "billed_by_treatment": {},
+        "collections_by_method": {},
+        "appointments": {"total": 0, "completed": 0, "cancelled": 0},
+    }
+
+
+def compute_months(first, last):
+    """Stats for every month in [first, last] with three aggregate queries."""
+    start, end = month_start(first), month_start(next_month(last))
+    months = {month: _empty_month(month) for month in month_range(first, last)}
+
+    payments = (
+        Payment.objects
+        .filter(received_at__gte=start, received_at__lt=end)
+        .annotate(month=TruncMonth("received_at"))
+        .values("month", "treatment_plan__treatment_type", "method")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    for row in payments:
+        stats = months[month_of(row["month"])]
+        total = row["total"]
+        for bucket, key in (
+            ("revenue_by_treatment", row["treatment_plan__treatment_type"]),
+            ("collections_by_method", row["method"] or "unspecified"),
+        ):
+            stats[bucket][key] = stats[bucket].get(key, Decimal("0")) + total
+
+    plans = (
+        TreatmentPlan.objects
+        .filter(created_at__gte=start, created_at__lt=end)
+        .annotate(month=TruncMonth("created_at"))
+        .values("month", "treatment_type")
+        .annotate(total=Sum("total_amount"))
+        .order_by()
+    )
+    for row in plans:
+        months[month_of(row["month"])]["billed_by_treatment"][row["treatment_type"]] = row["total"]
+
+    appointments = (
+        Appointment.objects
+        .filter(scheduled_at__gte=start, scheduled_at__lt=end)
+        .annotate(month=TruncMonth("scheduled_at"))
+        .values("month")
+        .annotate(
+            total=Count("id"),
+            completed=Count("id", filter=Q(status="completed")),
+            cancelled=Count("id", filter=Q(status="canceled")),
+        )
+        .order_by()
+    )
+    for row in appointments:
+        months[month_of(row["month"])]["appointments"] = {
+            "total": row["total"],
+            "completed": row["completed"],
+            "cancelled": row["cancelled"],
+        }
+
+    for stats in months.values():
+        counts = stats["appointments"]
+        counts["completion_rate"] = round(counts["completed"] / counts["total"], 4) if counts["total"] else None
+        counts["cancellation_rate"] = round(counts["cancelled"] / counts["total"], 4) if counts["total"] else None
+    return months
+
+
+def get_monthly_stats(first, last):
+    """
+    Stats per month, served from the cache where the month hasn't changed.
+    Missing months are computed together, so a cold cache still costs three queries.
+    """
+    months = month_range(first, last)
+    version_keys = [GLOBAL_VERSION_KEY] + [_version_key(month) for month in months]
+    versions = cache.get_many(version_keys)
+    global_version = versions.get(GLOBAL_VERSION_KEY, 0)
+    keys = {
+        month: f"analytics:month:{month}:{global_version}:{versions.get(_version_key(month), 0)}"
+        for month in months
+    }
+
+    cached = cache.get_many(list(keys.values()))
+    result = {month: cached[key] for month, key in keys.items() if key in cached}
+    missing = [month for month in months if month not in result]
+    if missing:
+        computed = compute_months(missing[0], missing[-1])
+        cache.set_many({keys[month]: computed[month] for month in missing}, CACHE_TIMEOUT)
+        result.update({month: computed[month] for month in missing})
+    return [result[month] for month in months]
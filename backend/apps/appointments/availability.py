@@ -0,0 +1,114 @@
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment
+
+SLOT_DURATION = timedelta(minutes=30)
+
+# Clinic hours (local time). Defaults match the hours we publish on WhatsApp: Mon-Sat, 9AM-6PM.
+OPENING_TIME = getattr(settings, "CLINIC_OPENING_TIME", time(9, 0))
+CLOSING_TIME = getattr(settings, "CLINIC_CLOSING_TIME", time(18, 0))
+WORKING_DAYS = getattr(settings, "CLINIC_WORKING_DAYS", (0, 1, 2, 3, 4, 5))
+
+# Appointments in these states no longer occupy the chair
+NON_BLOCKING_STATUSES = ("canceled",)
+
+
+def load_busy_intervals(start, end, exclude_ids=None, include_holds=True):
+    """
+    Load every appointment touching [start, end) with a single range query and
+    return them as a sorted list of merged (start, end) intervals. Active slot
+    holds are merged in as well unless `include_holds` is False.
+    """
+    from .holds import held_intervals
+
+    # Appointments are fixed length, so anything overlapping the window must
+    # start inside [start - SLOT_DURATION, end). This keeps the lookup on the
+    # scheduled_at index instead of scanning end_time.
+    qs = (
+        Appointment.objects
+        .filter(scheduled_at__gt=start - SLOT_DURATION, scheduled_at__lt=end)
+        .exclude(status__in=NON_BLOCKING_STATUSES)
+        .order_by("scheduled_at")
+    )
+    if exclude_ids:
+        qs = qs.exclude(id__in=exclude_ids)
+
+    intervals = [
+        (scheduled_at, end_time or scheduled_at + SLOT_DURATION)
+        for scheduled_at, end_time in qs.values_list("scheduled_at", "end_time")
+    ]
+    if include_holds:
+        intervals = sorted(intervals + held_intervals(start, end))
+    return merge_intervals(intervals)
+
+
+def merge_intervals(intervals):
+    """Sweep (start, end) pairs sorted by start into disjoint, sorted intervals."""
+    merged = []
+    for start, end in intervals:
+        if merged and start < merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def is_free(busy, start, end):
+    """Check [start, end) against merged busy intervals in O(log n)."""
+    index = bisect_right(busy, (start, start)) - 1
+    if index >= 0 and busy[index][1] > start:
+        return False
+    index += 1
+    return index >= len(busy) or busy[index][0] >= end
+
+
+def iter_candidate_slots(start_date, end_date, tz=None):
+    """Yield aligned (start, end) slots inside clinic hours for each working day."""
+    tz = tz or timezone.get_current_timezone()
+    day = start_date
+    while day <= end_date:
+        if day.weekday() in WORKING_DAYS:
+            slot_start = timezone.make_aware(datetime.combine(day, OPENING_TIME), tz)
+            closing = timezone.make_aware(datetime.combine(day, CLOSING_TIME), tz)
+            while slot_start + SLOT_DURATION <= closing:
+                yield slot_start, slot_start + SLOT_DURATION
+                slot_start += SLOT_DURATION
+        day += timedelta(days=1)
+
+
+def free_slots(busy, candidates, not_before=None):
+    """
+    Two-pointer sweep of sorted candidate slots against sorted busy intervals.
+    Runs in O(slots + appointments) with no further database access.
+    """
+    slots = []
+    index = 0
+    total = len(busy)
+    for slot_start, slot_end in candidates:
+        if not_before and slot_start < not_before:
+            continue
+        while index < total and busy[index][1] <= slot_start:
+            index += 1
+        if index < total and busy[index][0] < slot_end:
+            continue
+        slots.append((slot_start, slot_end))
+    return slots
+
+
+def get_available_slots(start_date, end_date):
+    """Free 30 minute slots between two dates (inclusive), using one query."""
+    tz = timezone.get_current_timezone()
+    window_start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    window_end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+
+    busy = load_busy_intervals(window_start, window_end)
+    return free_slots(
+        busy,
+        iter_candidate_slots(start_date, end_date, tz),
+        not_before=timezone.now(),
+    )
@@ -0,0 +1,140 @@
+import logging
+from datetime import datetime, time, timedelta
+
+import redis
+from django.db import transaction
+from django.utils import timezone
+
+from apps.common.redis_client import get_redis
+from .models import AppointmentRequest
+from .notification_service import queue_slot_offer
+
+logger = logging.getLogger(__name__)
+
+# Pending requests with a day_availability are indexed in Redis as one sorted
+# set per day, scored by creation time. A cancellation pops the oldest request
+# for that day in O(log n) instead of scanning the requests table.
+KEY_PREFIX = "backfill:pending:"
+
+
+def day_key(day):
+    return f"{KEY_PREFIX}{day.isoformat()}"
+
+
+def is_backfill_candidate(appointment_request):
+    return (
+        appointment_request.status == "pending"
+        and appointment_request.day_availability is not None
+        and appointment_request.offered_at is None
+        and appointment_request.day_availability >= timezone.localdate()
+    )
+
+
+def _expire_at(day):
+    # Keys for past days are useless, let Redis drop them
+    end_of_day = datetime.combine(day + timedelta(days=1), time.min)
+    return timezone.make_aware(end_of_day)
+
+
+def index_request(appointment_request):
+    """Add or remove a request from the index to match its current state."""
+    try:
+        r = get_redis()
+        if is_backfill_candidate(appointment_request):
+            key = day_key(appointment_request.day_availability)
+            pipe = r.pipeline()
+            pipe.zadd(key, {appointment_request.pk: appointment_request.created_at.timestamp()})
+            pipe.expireat(key, _expire_at(appointment_request.day_availability))
+            pipe.execute()
+        else:
+            unindex_request(appointment_request)
+    except redis.RedisError as e:
+        logger.warning(f"Could not update backfill index for request {appointment_request.pk}: {str(e)}")
+
+
+def unindex_request(appointment_request):
+    if appointment_request.day_availability is None:
+        return
+    try:
+        get_redis().zrem(day_key(appointment_request.day_availability), appointment_request.pk)
+    except redis.RedisError as e:
+        logger.warning(f"Could not update backfill index for request {appointment_request.pk}: {str(e)}")
+
+
+def rebuild_index():
+    """Rebuild the index from the database, e.g. after a Redis flush."""
+    r = get_redis()
+    pipe = r.pipeline()
+    for key in r.scan_iter(f"{KEY_PREFIX}*"):
+        pipe.delete(key)
+
+    requests = AppointmentRequest.objects.filter(
+        status="pending",
+        offered_at__isnull=True,
+        day_availability__gte=timezone.localdate(),
+    ).values_list("pk", "day_availability", "created_at")
+
+    count = 0
+    for pk, day, created_at in requests.iterator():
+        pipe.zadd(day_key(day), {pk: created_at.timestamp()})
+        pipe.expireat(day_key(day), _expire_at(day))
+        count += 1
+    pipe.execute()
+    return count
+
+
+def _claim(request_id, day, slot_start):
+    now = timezone.now()
+    return AppointmentRequest.objects.filter(
+        pk=request_id, status="pending", day_availability=day, offered_at__isnull=True
+    ).update(offered_at=now, offered_slot=slot_start, updated_at=now)
+
+
+def _claim_oldest_from_index(day, slot_start):
+    """Pop candidates for `day` oldest first until one is still pending in the database."""
+    key = day_key(day)
+    while True:
+        popped = get_redis().zpopmin(key)
+        if not popped:
+            return None
+        request_id = popped[0][0]
+        if _claim(request_id, day, slot_start):
+            return request_id
+
+
+def _claim_oldest_from_database(day, slot_start):
+    with transaction.atomic():
+        request_id = (
+            AppointmentRequest.objects
+            .select_for_update(skip_locked=True)
+            .filter(status="pending", day_availability=day, offered_at__isnull=True)
+            .order_by("created_at")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if request_id is None or not _claim(request_id, day, slot_start):
+            return None
+        return request_id
+
+
+def offer_freed_slot(appointment):
+    """Offer the slot of a canceled appointment to the oldest pending request for that day."""
+    slot_start = appointment.scheduled_at
+    if not slot_start or slot_start <= timezone.now():
+        return None
+
+    day = timezone.localtime(slot_start).date()
+    try:
+        request_id = _claim_oldest_from_index(day, slot_start)
+    except redis.RedisError as e:
+        logger.warning(f"Backfill index unavailable, falling back to the database: {str(e)}")
+        request_id = _claim_oldest_from_database(day, slot_start)
+
+    if request_id is None:
+        return None
+
+    appointment_request = AppointmentRequest.objects.select_related("user").get(pk=request_id)
+    queue_slot_offer(appointment_request, slot_start)
+
+    logger.info(f"Offered freed slot {slot_start} to appointment request {request_id}")
+    return appointment_request
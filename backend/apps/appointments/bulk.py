@@ -0,0 +1,193 @@
+import logging
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import analytics
+from .models import Appointment, OVERLAP_MESSAGE, is_overlap_violation
+from .availability import SLOT_DURATION, NON_BLOCKING_STATUSES, load_busy_intervals, is_free
+from apps.common.outbox import build_message, enqueue_many
+from .notification_service import (
+    AppointmentEvent, get_recipient, render_notification, render_appointment_digest
+)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+NOTIFY_NONE = "none"
+NOTIFY_EACH = "each"
+NOTIFY_DIGEST = "digest"
+NOTIFY_CHOICES = [NOTIFY_NONE, NOTIFY_EACH, NOTIFY_DIGEST]
+
+MAX_BATCH_SIZE = 5000
+INSERT_BATCH_SIZE = 500
+
+
+class AppointmentImportSerializer(serializers.Serializer):
+    """A single row of an appointment import batch."""
+    phone_number = serializers.CharField(max_length=15)
+    scheduled_at = serializers.DateTimeField()
+    status = serializers.ChoiceField(choices=Appointment.APPOINTMENT_STATUS, default="confirmed")
+    payment_method = serializers.ChoiceField(
+        choices=Appointment._meta.get_field("payment_method").choices,
+        required=False,
+        allow_null=True,
+        allow_blank=True,
+    )
+    notes = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+
+def find_conflicts(rows, busy):
+    """
+    Sweep rows sorted by scheduled_at against merged busy intervals and against
+    each other. Returns (accepted, conflicts) without touching the database.
+    """
+    accepted = []
+    conflicts = []
+    batch_end = None
+    batch_row = None
+
+    for row in rows:
+        start = row["scheduled_at"]
+        end = start + SLOT_DURATION
+
+        if row["status"] in NON_BLOCKING_STATUSES:
+            accepted.append(row)
+            continue
+
+        if not is_free(busy, start, end):
+            conflicts.append({"row": row["row"], "errors": [OVERLAP_MESSAGE]})
+            continue
+
+        if batch_end is not None and start < batch_end:
+            conflicts.append({
+                "row": row["row"],
+                "errors": [f"Overlaps row {batch_row} in this batch."],
+            })
+            continue
+
+        accepted.append(row)
+        batch_end = end
+        batch_row = row["row"]
+
+    return accepted, conflicts
+
+
+def import_appointments(raw_rows, notify=NOTIFY_NONE, dry_run=False):
+    """
+    Validate, de-conflict and bulk insert a batch of appointments.
+
+    Skips Appointment.save() and its signals entirely: overlaps are found with
+    one range query plus an in-memory sweep and notifications are sent once per
+    batch according to `notify`.
+    """
+    conflicts = []
+    valid = []
+
+    for index, raw in enumerate(raw_rows, start=1):
+        serializer = AppointmentImportSerializer(data=raw)
+        if not serializer.is_valid():
+            conflicts.append({"row": index, "errors": serializer.errors})
+            continue
+        valid.append({"row": index, **serializer.validated_data})
+
+    phone_numbers = {row["phone_number"] for row in valid}
+    users = User.objects.filter(phone_number__in=phone_numbers).in_bulk(field_name="phone_number")
+
+    rows = []
+    for row in valid:
+        user = users.get(row["phone_number"])
+        if user is None:
+            conflicts.append({"row": row["row"], "errors": ["No patient with this phone number."]})
+            continue
+        row["user"] = user
+        rows.append(row)
+
+    rows.sort(key=lambda row: row["scheduled_at"])
+
+    accepted = []
+    if rows:
+        busy = load_busy_intervals(rows[0]["scheduled_at"], rows[-1]["scheduled_at"] + SLOT_DURATION)
+        accepted, overlaps = find_conflicts(rows, busy)
+        conflicts.extend(overlaps)
+
+    conflicts.sort(key=lambda conflict: conflict["row"])
+    result = {
+        "accepted": len(accepted),
+        "created": 0,
+        "ids": [],
+        "conflicts": conflicts,
+        "dry_run": dry_run,
+    }
+
+    if dry_run or not accepted:
+        return result
+
+    appointments = [
+        Appointment(
+            user=row["user"],
+            scheduled_at=row["scheduled_at"],
+            end_time=row["scheduled_at"] + SLOT_DURATION,
+            status=row["status"],
+            payment_method=row.get("payment_method") or None,
+            notes=row.get("notes"),
+        )
+        for row in accepted
+    ]
+
+    try:
+        with transaction.atomic():
+            created = Appointment.objects.bulk_create(appointments, batch_size=INSERT_BATCH_SIZE)
+            # bulk_create sends no signals
+            analytics.touch(*[appointment.scheduled_at for appointment in created])
+    except IntegrityError as e:
+        # Someone booked into the batch window between the sweep and the insert
+        if is_overlap_violation(e):
+            result["error"] = "Another booking overlapped this batch while it was being imported. Retry the import."
+            return result
+        raise
+
+    result["created"] = len(created)
+    result["ids"] = [appointment.pk for appointment in created]
+
+    notify_imported_appointments(created, notify)
+    return result
+
+
+def notify_imported_appointments(appointments, notify):
+    """Queue notifications for imported appointments, one per row or one digest per patient."""
+    # Historic rows from the old desk system are not worth a message
+    now = timezone.now()
+    appointments = [
+        a for a in appointments
+        if a.status in ("pending", "confirmed") and a.scheduled_at >= now
+    ]
+    messages = []
+    if notify == NOTIFY_EACH:
+        for appointment in appointments:
+            user = get_recipient(appointment)
+            messages.append(build_message(
+                user.phone_number,
+                body=render_notification(appointment, AppointmentEvent.CREATED, user),
+                event=AppointmentEvent.CREATED,
+                obj=appointment,
+            ))
+
+    elif notify == NOTIFY_DIGEST:
+        by_user = defaultdict(list)
+        for appointment in appointments:
+            by_user[appointment.user].append(appointment)
+
+        for user, user_appointments in by_user.items():
+            messages.append(build_message(
+                user.phone_number,
+                body=render_appointment_digest(user, user_appointments),
+                event=AppointmentEvent.DIGEST,
+            ))
+
+    # One insert for the whole batch, the outbox worker does the sending
+    enqueue_many(messages)
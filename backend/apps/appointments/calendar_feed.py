@@ -0,0 +1,59 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+
+from .models import Appointment
+
+CACHE_TIMEOUT = 60 * 5
+
+
+def window_queryset(start, end):
+    # Served from the scheduled_at index
+    return Appointment.objects.filter(scheduled_at__gte=start, scheduled_at__lt=end)
+
+
+def window_etag(start, end):
+    """
+    Fingerprint of the appointments in [start, end): the latest updated_at plus
+    the row count, so edits, inserts and deletes all change it. Titles show
+    the patient's name, so their latest updated_at counts too.
+    """
+    version = window_queryset(start, end).aggregate(
+        last_updated=Max("updated_at"),
+        users_updated=Max("user__updated_at"),
+        count=Count("id"),
+    )
+    last_updated, users_updated = (
+        version[field].isoformat() if version[field] else ""
+        for field in ("last_updated", "users_updated")
+    )
+    raw = f"{start.isoformat()}|{end.isoformat()}|{last_updated}|{users_updated}|{version['count']}"
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def build_events(start, end):
+    appointments = window_queryset(start, end).order_by("scheduled_at").values(
+        'id',
+        'scheduled_at',
+        'end_time',
+        'status',
+        user_name=F('user__first_name')
+    )
+    return [
+        {
+            'id': apt['id'],
+            'title': f"{apt['user_name']} - {apt['status']}",
+            'start': apt['scheduled_at'].isoformat(),
+            'end': apt['end_time'].isoformat() if apt['end_time'] else None,
+            'backgroundColor': '#0275d8' if apt['status'] == 'confirmed' else '#ffc107',
+            'extendedProps': {'status': apt['status']},
+        }
+        for apt in appointments
+    ]
+
+
+def get_calendar_events(start, end, etag):
+    """Events for the window, cached per window and version."""
+    key = f"appointments:calendar:{etag}"
+    return cache.get_or_set(key, lambda: build_events(start, end), CACHE_TIMEOUT)
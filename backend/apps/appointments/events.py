@@ -0,0 +1,34 @@
+class AppointmentEvent:
+    CREATED = "appointment.created"
+    UPDATED = "appointment.updated"
+    COMPLETED = "appointment.completed"
+    CANCELLED = "appointment.deleted"
+    REMINDER = "appointment.reminder"
+    # One message listing several new appointments of a patient
+    DIGEST = "appointment.digest"
+
+class AppointmentRequestEvent:
+    SLOT_OFFERED = "appointment_request.slot_offered"
+
+class UserEvent:
+    CREATED = "user.created"
+    UPDATED = "user.created"
+    DELETED = "user.deleted"
+
+class TreatmentPlanEvent:
+    CREATED = "treatment_plan.created"
+    UPDATED = "treatment_plan.updated"
+    COMPLETED = "treatment_plan.completed"
+    CANCELLED = "treatment_plan.cancelled"
+    # One message listing every generated session of the plan
+    SCHEDULED = "treatment_plan.scheduled"
+
+class TreatmentSessionEvent:
+    CREATED = "treatment_session.created"
+    UPDATED = "treatment_session_updated"
+    COMPLETED = "treatment_session_completed"
+    CANCELLED = "treatment_session_cancelled"
+    REMINDER = "treatment_session_reminder"
+
+class PrescriptionEvent:
+    CREATED = "prescription.created"
@@ -0,0 +1,140 @@
+import logging
+import secrets
+from datetime import datetime, timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.common.redis_client import get_redis
+from .availability import SLOT_DURATION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOLD_SECONDS = getattr(settings, "SLOT_HOLD_SECONDS", 5 * 60)
+MAX_HOLD_SECONDS = 15 * 60
+
+# One key per held slot, claimed with SET NX PX so holders never touch the
+# appointments table. The sorted set indexes held slot starts by time for range
+# lookups; its members are pruned lazily once the hold key has expired.
+KEY_PREFIX = "slot-hold:"
+INDEX_KEY = "slot-holds"
+
+# Delete the hold only if it still belongs to the caller
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def hold_key(start):
+    return f"{KEY_PREFIX}{int(start.timestamp())}"
+
+
+def _hold_value(token, user_id):
+    return f"{token}:{user_id}"
+
+
+def is_aligned(start):
+    local = timezone.localtime(start)
+    slot_minutes = int(SLOT_DURATION.total_seconds() // 60)
+    return local.second == 0 and local.microsecond == 0 and local.minute % slot_minutes == 0
+
+
+def create_hold(start, user_id, seconds=DEFAULT_HOLD_SECONDS):
+    """
+    Reserve the slot starting at `start` for `seconds`. Returns (token, expires_at)
+    or raises SlotUnavailable if the slot is booked or held by someone else.
+    """
+    from .models import Appointment
+
+    seconds = max(1, min(int(seconds), MAX_HOLD_SECONDS))
+    if Appointment.overlapping(start, start + SLOT_DURATION).exists():
+        raise SlotUnavailable("This slot is already booked.")
+
+    token = secrets.token_urlsafe(16)
+    r = get_redis()
+    if not r.set(hold_key(start), _hold_value(token, user_id), nx=True, px=seconds * 1000):
+        raise SlotUnavailable("This slot is being booked by someone else. Try another slot.")
+    r.zadd(INDEX_KEY, {int(start.timestamp()): start.timestamp()})
+
+    return token, timezone.now() + timedelta(seconds=seconds)
+
+
+def release_hold(start, token, user_id):
+    """Release a hold owned by `token`. Returns True if a hold was removed."""
+    r = get_redis()
+    released = r.eval(RELEASE_SCRIPT, 1, hold_key(start), _hold_value(token, user_id))
+    if released:
+        r.zrem(INDEX_KEY, int(start.timestamp()))
+    return bool(released)
+
+
+def owns_hold(start, token, user_id):
+    return get_redis().get(hold_key(start)) == _hold_value(token, user_id)
+
+
+def release_on_commit(start, token, user_id):
+    """Drop a hold once the appointment that converted it has been committed."""
+    def release():
+        try:
+            release_hold(start, token, user_id)
+        except redis.RedisError as e:
+            # The key expires on its own, this only frees the slot sooner
+            logger.warning(f"Could not release slot hold for {start}: {str(e)}")
+
+    transaction.on_commit(release)
+
+
+def held_intervals(start, end, exclude_token=None):
+    """
+    Active holds overlapping [start, end) as sorted (start, end) pairs. Fails
+    open: if Redis is unreachable, holds are ignored and the database
+    constraint still prevents double bookings.
+    """
+    try:
+        r = get_redis()
+        starts = r.zrangebyscore(
+            INDEX_KEY,
+            (start - SLOT_DURATION).timestamp(),
+            f"({end.timestamp()}",
+        )
+        if not starts:
+            return []
+
+        values = r.mget([f"{KEY_PREFIX}{ts}" for ts in starts])
+    except redis.RedisError as e:
+        logger.warning(f"Slot holds unavailable: {str(e)}")
+        return []
+
+    intervals = []
+    expired = []
+    for ts, value in zip(starts, values):
+        if value is None:
+            expired.append(ts)
+            continue
+        if exclude_token and value.split(":", 1)[0] == exclude_token:
+            continue
+        hold_start = datetime.fromtimestamp(int(ts), tz=timezone.get_current_timezone())
+        hold_end = hold_start + SLOT_DURATION
+        if hold_start < end and hold_end > start:
+            intervals.append((hold_start, hold_end))
+
+    if expired:
+        try:
+            r.zrem(INDEX_KEY, *expired)
+        except redis.RedisError:
+            pass
+    return intervals
+
+
+def is_held(start, end, exclude_token=None):
+    return bool(held_intervals(start, end, exclude_token=exclude_token))
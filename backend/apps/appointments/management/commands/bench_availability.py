@@ -0,0 +1,67 @@
+import random
+from datetime import datetime, time, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.appointments.availability import (
+    SLOT_DURATION, free_slots, get_available_slots, iter_candidate_slots, merge_intervals,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the free-slot availability engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--appointments", type=int, default=50000)
+        parser.add_argument("--days", type=int, default=31)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--db",
+            action="store_true",
+            help="Also run a month-wide query against the configured database and count queries.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["appointments"]
+        days = options["days"]
+        repeat = options["repeat"]
+
+        start_date = timezone.localdate()
+        end_date = start_date + timedelta(days=days - 1)
+        tz = timezone.get_current_timezone()
+        window_start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+        window_minutes = days * 24 * 60
+
+        rng = random.Random(42)
+        starts = sorted(
+            window_start + timedelta(minutes=rng.randrange(window_minutes))
+            for _ in range(count)
+        )
+        appointments = [(start, start + SLOT_DURATION) for start in starts]
+
+        timings = []
+        for _ in range(repeat):
+            began = perf_counter()
+            busy = merge_intervals(appointments)
+            slots = free_slots(busy, iter_candidate_slots(start_date, end_date, tz))
+            timings.append(perf_counter() - began)
+
+        self.stdout.write(
+            f"{count} appointments over {days} days: "
+            f"best {min(timings) * 1000:.1f} ms, worst {max(timings) * 1000:.1f} ms "
+            f"({len(busy)} busy intervals, {len(slots)} free slots)"
+        )
+
+        if options["db"]:
+            with CaptureQueriesContext(connection) as queries:
+                began = perf_counter()
+                slots = get_available_slots(start_date, end_date)
+                elapsed = perf_counter() - began
+            self.stdout.write(
+                f"Database query for {days} days: {elapsed * 1000:.1f} ms, "
+                f"{len(queries)} queries, {len(slots)} free slots"
+            )
@@ -0,0 +1,54 @@
+from collections import Counter
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.appointments.models import Appointment, TreatmentPlan, TreatmentSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the queries issued by saving an existing Appointment, TreatmentPlan "
+        "and TreatmentSession. Changes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        # (model, field that can be touched without triggering a notification)
+        cases = [
+            (Appointment, "notes"),
+            (TreatmentPlan, "estimated_duration_months"),
+            (TreatmentSession, "description"),
+        ]
+
+        with transaction.atomic():
+            for model, field in cases:
+                pk = model.objects.values_list("pk", flat=True).first()
+                if pk is None:
+                    raise CommandError(f"Need at least one {model.__name__} to benchmark")
+                self.bench(model, pk, field, repeat)
+            transaction.set_rollback(True)
+
+    def bench(self, model, pk, field, repeat):
+        kinds = Counter()
+        timings = []
+        for _ in range(repeat):
+            instance = model.objects.get(pk=pk)
+            setattr(instance, field, getattr(instance, field))
+            with CaptureQueriesContext(connection) as queries:
+                began = perf_counter()
+                instance.save()
+                timings.append(perf_counter() - began)
+            for query in queries:
+                kinds[query["sql"].split(None, 1)[0].upper()] += 1
+
+        per_save = ", ".join(f"{kind} {count / repeat:g}" for kind, count in sorted(kinds.items()))
+        self.stdout.write(
+            f"{model.__name__}.save(): {sum(kinds.values()) / repeat:g} queries per save ({per_save}), "
+            f"best {min(timings) * 1000:.2f} ms"
+        )
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.appointments.events import AppointmentEvent, TreatmentSessionEvent
+from apps.appointments.message_templates import render
+from apps.appointments.models import Appointment, TreatmentPlan, TreatmentSession
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark rendering of WhatsApp message templates. Uses in-memory objects only."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        count = options["messages"]
+        repeat = options["repeat"]
+        start = timezone.now()
+
+        for lang, _ in User.LANGUAGE_CHOICES:
+            users = [
+                User(phone_number=f"+91{9000000000 + i}", first_name="Patient", last_name=str(i), preferred_language=lang)
+                for i in range(count)
+            ]
+            appointments = [
+                Appointment(user=user, scheduled_at=start + timedelta(minutes=30 * i))
+                for i, user in enumerate(users)
+            ]
+            plan = TreatmentPlan(user=users[0], treatment_type="braces", total_amount=0, estimated_duration_months=12)
+            sessions = [
+                TreatmentSession(treatment_plan=plan, session_number=i + 1, scheduled_at=start + timedelta(hours=i))
+                for i in range(count)
+            ]
+
+            cases = [
+                (AppointmentEvent.REMINDER, [(a.user, a) for a in appointments]),
+                (TreatmentSessionEvent.REMINDER, [(users[i], s) for i, s in enumerate(sessions)]),
+            ]
+            for event, items in cases:
+                timings = []
+                for _ in range(repeat):
+                    began = perf_counter()
+                    for user, instance in items:
+                        render(event, user, instance)
+                    timings.append(perf_counter() - began)
+                best = min(timings)
+                self.stdout.write(
+                    f"{lang} {event}: {count} messages in {best * 1000:.1f} ms "
+                    f"({count / best:,.0f} msgs/sec)"
+                )
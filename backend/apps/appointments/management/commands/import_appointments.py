@@ -0,0 +1,57 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.appointments.bulk import import_appointments, NOTIFY_CHOICES, NOTIFY_NONE
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import appointments from a CSV or JSON file. Expected columns: "
+        "phone_number, scheduled_at, status, payment_method, notes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row, or a JSON list of objects")
+        parser.add_argument("--notify", choices=NOTIFY_CHOICES, default=NOTIFY_NONE)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--dry-run", action="store_true", help="Report conflicts without inserting anything")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        rows = self.read_rows(path)
+        batch_size = options["batch_size"]
+        created = 0
+        conflicts = 0
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            result = import_appointments(batch, notify=options["notify"], dry_run=options["dry_run"])
+
+            if result.get("error"):
+                raise CommandError(f"Batch starting at row {offset + 1}: {result['error']}")
+
+            created += result["accepted"] if options["dry_run"] else result["created"]
+            conflicts += len(result["conflicts"])
+            for conflict in result["conflicts"]:
+                self.stderr.write(f"Row {offset + conflict['row']}: {conflict['errors']}")
+
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {created} appointments, {conflicts} rows skipped"))
+
+    def read_rows(self, path):
+        with path.open(newline="", encoding="utf-8") as f:
+            if path.suffix.lower() == ".json":
+                rows = json.load(f)
+                if not isinstance(rows, list):
+                    raise CommandError("JSON file must contain a list of appointments")
+                return rows
+            return [
+                {key: value for key, value in row.items() if value not in (None, "")}
+                for row in csv.DictReader(f)
+            ]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.appointments.backfill import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis index of pending appointment requests used to backfill canceled slots"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} pending appointment requests"))
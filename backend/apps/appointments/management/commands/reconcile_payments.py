@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.appointments.models import TreatmentPlan, TreatmentSession
+
+
+def ledger_total():
+    return Coalesce(
+        Sum("payments__amount"),
+        Value(Decimal("0")),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare each plan's amount_paid and balance, and each session's "
+        "amount_received, with the payment ledger. With --fix, the ledger wins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite drifted totals from the ledger")
+
+    def handle(self, *args, **options):
+        drifted = list(
+            TreatmentPlan.objects
+            .annotate(ledger=ledger_total())
+            .filter(~Q(amount_paid=F("ledger")) | ~Q(balance=F("total_amount") - F("amount_paid")))
+            .values_list("pk", "total_amount", "amount_paid", "balance", "ledger")
+        )
+        drifted_sessions = list(
+            TreatmentSession.objects
+            .annotate(ledger=ledger_total())
+            .exclude(amount_received=F("ledger"))
+            .values_list("pk", "amount_received", "ledger")
+        )
+
+        for pk, total_amount, amount_paid, balance, ledger in drifted:
+            self.stdout.write(
+                f"plan {pk}: amount_paid {amount_paid}, ledger {ledger}, "
+                f"balance {balance}, expected {total_amount - ledger}"
+            )
+        for pk, amount_received, ledger in drifted_sessions:
+            self.stdout.write(f"session {pk}: amount_received {amount_received}, ledger {ledger}")
+        if not drifted and not drifted_sessions:
+            self.stdout.write(self.style.SUCCESS("All plans and sessions match the payment ledger."))
+            return
+
+        if options["fix"]:
+            with transaction.atomic():
+                for pk, total_amount, _, _, ledger in drifted:
+                    TreatmentPlan.objects.filter(pk=pk).update(
+                        amount_paid=ledger, balance=total_amount - ledger
+                    )
+                for pk, _, ledger in drifted_sessions:
+                    TreatmentSession.objects.filter(pk=pk).update(amount_received=ledger)
+            self.stdout.write(self.style.SUCCESS(
+                f"Fixed {len(drifted)} plans and {len(drifted_sessions)} sessions."
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(drifted)} plans and {len(drifted_sessions)} sessions drifted. Run with --fix to repair."
+            ))
@@ -0,0 +1,381 @@
+from string import Formatter
+
+from django.utils import timezone
+
+from .events import AppointmentEvent, AppointmentRequestEvent, TreatmentPlanEvent, TreatmentSessionEvent
+
+DEFAULT_LANGUAGE = "en"
+
+WEEKDAYS = {
+    "hi": ["सोमवार", "मंगलवार", "बुधवार", "गुरुवार", "शुक्रवार", "शनिवार", "रविवार"],
+    "mr": ["सोमवार", "मंगळवार", "बुधवार", "गुरुवार", "शुक्रवार", "शनिवार", "रविवार"],
+}
+MONTHS = {
+    "hi": ["जनवरी", "फ़रवरी", "मार्च", "अप्रैल", "मई", "जून", "जुलाई", "अगस्त", "सितंबर", "अक्टूबर", "नवंबर", "दिसंबर"],
+    "mr": ["जानेवारी", "फेब्रुवारी", "मार्च", "एप्रिल", "मे", "जून", "जुलै", "ऑगस्ट", "सप्टेंबर", "ऑक्टोबर", "नोव्हेंबर", "डिसेंबर"],
+}
+
+
+def format_datetime(dt, lang=DEFAULT_LANGUAGE):
+    """Clinic-local date and time as patients read it, e.g. Monday, 05 Jan at 10:00 AM."""
+    dt = timezone.localtime(dt)
+    if lang in WEEKDAYS:
+        return f"{WEEKDAYS[lang][dt.weekday()]}, {dt.day} {MONTHS[lang][dt.month - 1]}, {dt.strftime('%I:%M %p')}"
+    return dt.strftime("%A, %d %b at %I:%M %p")
+
+
+def _treatment(instance):
+    plan = getattr(instance, "treatment_plan", instance)
+    return plan.get_treatment_type_display()
+
+
+# Values a template can use, computed only when its template asks for them.
+# Each getter takes (instance, user, lang, extra).
+FIELD_GETTERS = {
+    "name": lambda instance, user, lang, extra: f"{user.first_name} {user.last_name}".strip(),
+    "when": lambda instance, user, lang, extra: format_datetime(extra.get("at") or instance.scheduled_at, lang),
+    "treatment": lambda instance, user, lang, extra: _treatment(instance),
+    "session_number": lambda instance, user, lang, extra: instance.session_number,
+    "dates": lambda instance, user, lang, extra: "\n".join(
+        f"📅 *{format_datetime(visit.scheduled_at, lang)}*"
+        for visit in sorted(extra.get("sessions") or extra["appointments"], key=lambda v: v.scheduled_at)
+    ),
+}
+
+
+TEMPLATES = {
+    # English
+    (AppointmentEvent.CREATED, "en"): (
+        "Hi *{name}* 😊\n\n"
+        "Your appointment at *Blissful Smiles* is now confirmed! 🦷\n"
+        "📅 *{when}*\n\n"
+        "We're looking forward to brightening your smile! ✨\n"
+        "See you soon!"
+    ),
+    (AppointmentEvent.UPDATED, "en"): (
+        "Hey *{name}* 👋\n\n"
+        "We've *updated* your appointment:\n"
+        "🆕 *{when}*\n\n"
+        "Everything else stays the same. Questions? Just reply! 😄"
+    ),
+    (AppointmentEvent.COMPLETED, "en"): (
+        "Great seeing you today, *{name}*! 😁\n\n"
+        "Your appointment on *{when}* is all wrapped up! 🎉\n\n"
+        "Keep up the great dental care - your smile looks fantastic! 🌟"
+    ),
+    (AppointmentEvent.CANCELLED, "en"): (
+        "Hi *{name}*,\n\n"
+        "Your appointment on *{when}* has been cancelled 🗑️\n\n"
+        "Need to book a new one? We're here to help! 🌟 Reply anytime."
+    ),
+    (AppointmentEvent.REMINDER, "en"): (
+        "Hi *{name}* 👋\n\n"
+        "Just a reminder of your appointment at *Blissful Smiles*:\n"
+        "📅 *{when}*\n\n"
+        "Can't make it? Reply and we'll find you a new time 😊"
+    ),
+    (AppointmentEvent.DIGEST, "en"): (
+        "Hi *{name}* 😊\n\n"
+        "Your upcoming appointments at *Blissful Smiles* are confirmed! 🦷\n"
+        "{dates}\n\n"
+        "We're looking forward to brightening your smile! ✨"
+    ),
+    (AppointmentRequestEvent.SLOT_OFFERED, "en"): (
+        "Good news, *{name}*! 🎉\n\n"
+        "A slot just opened up at *Blissful Smiles* on the day you asked for:\n"
+        "📅 *{when}*\n\n"
+        "Reply *YES* to grab it — we'll confirm your appointment right away! 🦷"
+    ),
+    (TreatmentPlanEvent.CREATED, "en"): (
+        "Hello *{name}* 🌟\n\n"
+        "Your new *{treatment}* treatment plan is ready! 🦷\n\n"
+        "We've planned everything to get you the best results — step by step.\n"
+        "Excited to start this journey with you! 🚀"
+    ),
+    (TreatmentPlanEvent.UPDATED, "en"): (
+        "Hi *{name}* 👋\n\n"
+        "We've made some changes to your *{treatment}* treatment plan.\n\n"
+        "Questions? Just reply — we're happy to walk you through it! 😊"
+    ),
+    (TreatmentPlanEvent.COMPLETED, "en"): (
+        "Wow *{name}* — you did it! 🎉\n\n"
+        "Your *{treatment}* treatment plan is officially *complete* 🏆\n\n"
+        "Your smile looks amazing — keep up the great work! 😁\n"
+        "We're so proud of you!"
+    ),
+    (TreatmentPlanEvent.CANCELLED, "en"): (
+        "Hi *{name}*,\n\n"
+        "Your *{treatment}* treatment plan has been cancelled.\n\n"
+        "No worries — whenever you're ready to continue, just let us know ❤️"
+    ),
+    (TreatmentPlanEvent.SCHEDULED, "en"): (
+        "Hi *{name}* 😊\n\n"
+        "Your *{treatment}* sessions at *Blissful Smiles* are scheduled! 🦷\n"
+        "{dates}\n\n"
+        "We'll remind you before each visit. See you soon! ✨"
+    ),
+    (TreatmentSessionEvent.CREATED, "en"): (
+        "Hi *{name}* 😄\n\n"
+        "*Session {session_number}* of your *{treatment}* plan is scheduled!\n"
+        "📅 *{when}*\n\n"
+        "Get ready for the next step toward a healthier smile! ✨"
+    ),
+    (TreatmentSessionEvent.UPDATED, "en"): (
+        "Hey *{name}*,\n\n"
+        "We've *rescheduled* Session {session_number}:\n"
+        "🆕 *{when}*\n\n"
+        "Sorry for any inconvenience — we'll make it worth it! 🦷😊"
+    ),
+    (TreatmentSessionEvent.COMPLETED, "en"): (
+        "Great job today, *{name}*! 👏\n\n"
+        "*Session {session_number}* is successfully completed 🎯\n\n"
+        "You're making awesome progress — keep shining! 🌟"
+    ),
+    (TreatmentSessionEvent.CANCELLED, "en"): (
+        "Hi *{name}*,\n\n"
+        "Session {session_number} has been cancelled.\n\n"
+        "Want to pick a new time? Just reply — we've got you! 😊"
+    ),
+    (TreatmentSessionEvent.REMINDER, "en"): (
+        "Hi *{name}* 👋\n\n"
+        "Reminder: *Session {session_number}* of your *{treatment}* plan is coming up!\n"
+        "📅 *{when}*\n\n"
+        "Can't make it? Reply and we'll reschedule 😊"
+    ),
+
+    # Hindi
+    (AppointmentEvent.CREATED, "hi"): (
+        "नमस्ते *{name}* 😊\n\n"
+        "*Blissful Smiles* में आपका अपॉइंटमेंट पक्का हो गया है! 🦷\n"
+        "📅 *{when}*\n\n"
+        "आपकी मुस्कान को और चमकाने का इंतज़ार है! ✨\n"
+        "जल्द मिलते हैं!"
+    ),
+    (AppointmentEvent.UPDATED, "hi"): (
+        "नमस्ते *{name}* 👋\n\n"
+        "हमने आपका अपॉइंटमेंट *बदल* दिया है:\n"
+        "🆕 *{when}*\n\n"
+        "बाकी सब पहले जैसा ही है। कोई सवाल हो तो बस जवाब दें! 😄"
+    ),
+    (AppointmentEvent.COMPLETED, "hi"): (
+        "आज आपसे मिलकर अच्छा लगा, *{name}*! 😁\n\n"
+        "*{when}* का आपका अपॉइंटमेंट पूरा हो गया! 🎉\n\n"
+        "दाँतों का ऐसे ही ख्याल रखें - आपकी मुस्कान शानदार है! 🌟"
+    ),
+    (AppointmentEvent.CANCELLED, "hi"): (
+        "नमस्ते *{name}*,\n\n"
+        "*{when}* का आपका अपॉइंटमेंट रद्द कर दिया गया है 🗑️\n\n"
+        "नया अपॉइंटमेंट बुक करना है? हम मदद के लिए यहाँ हैं! 🌟 कभी भी जवाब दें।"
+    ),
+    (AppointmentEvent.REMINDER, "hi"): (
+        "नमस्ते *{name}* 👋\n\n"
+        "*Blissful Smiles* में आपके अपॉइंटमेंट की याद दिला रहे हैं:\n"
+        "📅 *{when}*\n\n"
+        "नहीं आ पाएँगे? जवाब दें, हम नया समय ढूँढ देंगे 😊"
+    ),
+    (AppointmentEvent.DIGEST, "hi"): (
+        "नमस्ते *{name}* 😊\n\n"
+        "*Blissful Smiles* में आपके आने वाले अपॉइंटमेंट पक्के हो गए हैं! 🦷\n"
+        "{dates}\n\n"
+        "आपकी मुस्कान को और चमकाने का इंतज़ार है! ✨"
+    ),
+    (AppointmentRequestEvent.SLOT_OFFERED, "hi"): (
+        "खुशखबरी, *{name}*! 🎉\n\n"
+        "आपने जिस दिन के लिए पूछा था, उस दिन *Blissful Smiles* में एक स्लॉट खाली हुआ है:\n"
+        "📅 *{when}*\n\n"
+        "इसे पाने के लिए *YES* लिखकर जवाब दें — हम तुरंत आपका अपॉइंटमेंट पक्का कर देंगे! 🦷"
+    ),
+    (TreatmentPlanEvent.CREATED, "hi"): (
+        "नमस्ते *{name}* 🌟\n\n"
+        "आपका नया *{treatment}* ट्रीटमेंट प्लान तैयार है! 🦷\n\n"
+        "बेहतरीन नतीजों के लिए हमने सब कुछ कदम-दर-कदम तय किया है।\n"
+        "इस सफ़र की शुरुआत के लिए हम उत्साहित हैं! 🚀"
+    ),
+    (TreatmentPlanEvent.UPDATED, "hi"): (
+        "नमस्ते *{name}* 👋\n\n"
+        "आपके *{treatment}* ट्रीटमेंट प्लान में कुछ बदलाव किए गए हैं।\n\n"
+        "कोई सवाल हो तो बस जवाब दें — हम सब समझा देंगे! 😊"
+    ),
+    (TreatmentPlanEvent.COMPLETED, "hi"): (
+        "वाह *{name}* — आपने कर दिखाया! 🎉\n\n"
+        "आपका *{treatment}* ट्रीटमेंट प्लान *पूरा* हो गया है 🏆\n\n"
+        "आपकी मुस्कान कमाल की लग रही है! 😁\n"
+        "हमें आप पर गर्व है!"
+    ),
+    (TreatmentPlanEvent.CANCELLED, "hi"): (
+        "नमस्ते *{name}*,\n\n"
+        "आपका *{treatment}* ट्रीटमेंट प्लान रद्द कर दिया गया है।\n\n"
+        "कोई बात नहीं — जब भी आप आगे बढ़ना चाहें, हमें बताएँ ❤️"
+    ),
+    (TreatmentPlanEvent.SCHEDULED, "hi"): (
+        "नमस्ते *{name}* 😊\n\n"
+        "*Blissful Smiles* में आपके *{treatment}* सेशन तय हो गए हैं! 🦷\n"
+        "{dates}\n\n"
+        "हर विज़िट से पहले हम आपको याद दिला देंगे। जल्द मिलते हैं! ✨"
+    ),
+    (TreatmentSessionEvent.CREATED, "hi"): (
+        "नमस्ते *{name}* 😄\n\n"
+        "आपके *{treatment}* प्लान का *सेशन {session_number}* तय हो गया है!\n"
+        "📅 *{when}*\n\n"
+        "स्वस्थ मुस्कान की ओर अगले कदम के लिए तैयार रहें! ✨"
+    ),
+    (TreatmentSessionEvent.UPDATED, "hi"): (
+        "नमस्ते *{name}*,\n\n"
+        "हमने सेशन {session_number} का समय *बदल* दिया है:\n"
+        "🆕 *{when}*\n\n"
+        "असुविधा के लिए माफ़ी — हम इसकी भरपाई ज़रूर करेंगे! 🦷😊"
+    ),
+    (TreatmentSessionEvent.COMPLETED, "hi"): (
+        "आज बहुत बढ़िया, *{name}*! 👏\n\n"
+        "*सेशन {session_number}* सफलतापूर्वक पूरा हुआ 🎯\n\n"
+        "आप शानदार प्रगति कर रहे हैं — ऐसे ही चमकते रहें! 🌟"
+    ),
+    (TreatmentSessionEvent.CANCELLED, "hi"): (
+        "नमस्ते *{name}*,\n\n"
+        "सेशन {session_number} रद्द कर दिया गया है।\n\n"
+        "नया समय चुनना है? बस जवाब दें — हम मदद करेंगे! 😊"
+    ),
+    (TreatmentSessionEvent.REMINDER, "hi"): (
+        "नमस्ते *{name}* 👋\n\n"
+        "याद दिला रहे हैं: आपके *{treatment}* प्लान का *सेशन {session_number}* जल्द है!\n"
+        "📅 *{when}*\n\n"
+        "नहीं आ पाएँगे? जवाब दें, हम समय बदल देंगे 😊"
+    ),
+
+    # Marathi
+    (AppointmentEvent.CREATED, "mr"): (
+        "नमस्कार *{name}* 😊\n\n"
+        "*Blissful Smiles* मधील तुमची अपॉइंटमेंट निश्चित झाली आहे! 🦷\n"
+        "📅 *{when}*\n\n"
+        "तुमचे हास्य अधिक उजळवण्यासाठी आम्ही उत्सुक आहोत! ✨\n"
+        "लवकरच भेटू!"
+    ),
+    (AppointmentEvent.UPDATED, "mr"): (
+        "नमस्कार *{name}* 👋\n\n"
+        "आम्ही तुमची अपॉइंटमेंट *बदलली* आहे:\n"
+        "🆕 *{when}*\n\n"
+        "बाकी सर्व पूर्वीसारखेच आहे. काही प्रश्न असल्यास उत्तर द्या! 😄"
+    ),
+    (AppointmentEvent.COMPLETED, "mr"): (
+        "आज तुम्हाला भेटून आनंद झाला, *{name}*! 😁\n\n"
+        "*{when}* ची तुमची अपॉइंटमेंट पूर्ण झाली! 🎉\n\n"
+        "दातांची अशीच काळजी घ्या - तुमचे हास्य सुंदर दिसत आहे! 🌟"
+    ),
+    (AppointmentEvent.CANCELLED, "mr"): (
+        "नमस्कार *{name}*,\n\n"
+        "*{when}* ची तुमची अपॉइंटमेंट रद्द करण्यात आली आहे 🗑️\n\n"
+        "नवीन अपॉइंटमेंट बुक करायची आहे? आम्ही मदतीसाठी आहोत! 🌟 कधीही उत्तर द्या."
+    ),
+    (AppointmentEvent.REMINDER, "mr"): (
+        "नमस्कार *{name}* 👋\n\n"
+        "*Blissful Smiles* मधील तुमच्या अपॉइंटमेंटची आठवण:\n"
+        "📅 *{when}*\n\n"
+        "येऊ शकत नाही? उत्तर द्या, आम्ही नवीन वेळ शोधू 😊"
+    ),
+    (AppointmentEvent.DIGEST, "mr"): (
+        "नमस्कार *{name}* 😊\n\n"
+        "*Blissful Smiles* मधील तुमच्या पुढील अपॉइंटमेंट्स निश्चित झाल्या आहेत! 🦷\n"
+        "{dates}\n\n"
+        "तुमचे हास्य अधिक उजळवण्यासाठी आम्ही उत्सुक आहोत! ✨"
+    ),
+    (AppointmentRequestEvent.SLOT_OFFERED, "mr"): (
+        "आनंदाची बातमी, *{name}*! 🎉\n\n"
+        "तुम्ही विचारलेल्या दिवशी *Blissful Smiles* मध्ये एक वेळ उपलब्ध झाली आहे:\n"
+        "📅 *{when}*\n\n"
+        "ती मिळवण्यासाठी *YES* असे उत्तर द्या — आम्ही लगेच तुमची अपॉइंटमेंट निश्चित करू! 🦷"
+    ),
+    (TreatmentPlanEvent.CREATED, "mr"): (
+        "नमस्कार *{name}* 🌟\n\n"
+        "तुमचा नवीन *{treatment}* उपचार प्लॅन तयार आहे! 🦷\n\n"
+        "सर्वोत्तम परिणामांसाठी आम्ही सर्व काही टप्प्याटप्प्याने ठरवले आहे.\n"
+        "हा प्रवास तुमच्यासोबत सुरू करण्यास आम्ही उत्सुक आहोत! 🚀"
+    ),
+    (TreatmentPlanEvent.UPDATED, "mr"): (
+        "नमस्कार *{name}* 👋\n\n"
+        "तुमच्या *{treatment}* उपचार प्लॅनमध्ये काही बदल करण्यात आले आहेत.\n\n"
+        "काही प्रश्न असल्यास उत्तर द्या — आम्ही सर्व समजावून सांगू! 😊"
+    ),
+    (TreatmentPlanEvent.COMPLETED, "mr"): (
+        "वा *{name}* — तुम्ही करून दाखवलंत! 🎉\n\n"
+        "तुमचा *{treatment}* उपचार प्लॅन *पूर्ण* झाला आहे 🏆\n\n"
+        "तुमचे हास्य अप्रतिम दिसत आहे! 😁\n"
+        "आम्हाला तुमचा अभिमान आहे!"
+    ),
+    (TreatmentPlanEvent.CANCELLED, "mr"): (
+        "नमस्कार *{name}*,\n\n"
+        "तुमचा *{treatment}* उपचार प्लॅन रद्द करण्यात आला आहे.\n\n"
+        "काळजी करू नका — पुढे सुरू करायचे असेल तेव्हा आम्हाला कळवा ❤️"
+    ),
+    (TreatmentPlanEvent.SCHEDULED, "mr"): (
+        "नमस्कार *{name}* 😊\n\n"
+        "*Blissful Smiles* मधील तुमची *{treatment}* सत्रे ठरली आहेत! 🦷\n"
+        "{dates}\n\n"
+        "प्रत्येक भेटीआधी आम्ही तुम्हाला आठवण करून देऊ. लवकरच भेटू! ✨"
+    ),
+    (TreatmentSessionEvent.CREATED, "mr"): (
+        "नमस्कार *{name}* 😄\n\n"
+        "तुमच्या *{treatment}* प्लॅनचे *सत्र {session_number}* ठरले आहे!\n"
+        "📅 *{when}*\n\n"
+        "निरोगी हास्याच्या पुढच्या टप्प्यासाठी तयार राहा! ✨"
+    ),
+    (TreatmentSessionEvent.UPDATED, "mr"): (
+        "नमस्कार *{name}*,\n\n"
+        "आम्ही सत्र {session_number} ची वेळ *बदलली* आहे:\n"
+        "🆕 *{when}*\n\n"
+        "गैरसोयीबद्दल क्षमस्व — आम्ही त्याची भरपाई नक्की करू! 🦷😊"
+    ),
+    (TreatmentSessionEvent.COMPLETED, "mr"): (
+        "आज छान काम केलंत, *{name}*! 👏\n\n"
+        "*सत्र {session_number}* यशस्वीरित्या पूर्ण झाले 🎯\n\n"
+        "तुमची प्रगती उत्तम आहे — असेच चमकत राहा! 🌟"
+    ),
+    (TreatmentSessionEvent.CANCELLED, "mr"): (
+        "नमस्कार *{name}*,\n\n"
+        "सत्र {session_number} रद्द करण्यात आले आहे.\n\n"
+        "नवीन वेळ निवडायची आहे? फक्त उत्तर द्या — आम्ही मदत करू! 😊"
+    ),
+    (TreatmentSessionEvent.REMINDER, "mr"): (
+        "नमस्कार *{name}* 👋\n\n"
+        "आठवण: तुमच्या *{treatment}* प्लॅनचे *सत्र {session_number}* लवकरच आहे!\n"
+        "📅 *{when}*\n\n"
+        "येऊ शकत नाही? उत्तर द्या, आम्ही वेळ बदलू 😊"
+    ),
+}
+
+
+def compile_template(text):
+    """Parse a template once into its bound format_map and the fields it needs."""
+    fields = tuple(dict.fromkeys(
+        name for _, name, _, _ in Formatter().parse(text) if name
+    ))
+    unknown = set(fields) - FIELD_GETTERS.keys()
+    if unknown:
+        raise ValueError(f"Unknown template fields: {', '.join(sorted(unknown))}")
+    return text.format_map, fields
+
+
+# (event, language) -> (format_map, fields), built once at import
+REGISTRY = {key: compile_template(text) for key, text in TEMPLATES.items()}
+
+
+def get_template(event, lang=DEFAULT_LANGUAGE):
+    """Compiled template for an event, falling back to English. None if there is none."""
+    return REGISTRY.get((event, lang)) or REGISTRY.get((event, DEFAULT_LANGUAGE))
+
+
+def render(event, user, instance=None, lang=None, **extra):
+    """
+    Render the template for `event` in the patient's language. `extra` carries
+    values that don't come from the instance: `at` overrides the time shown and
+    `appointments` feeds the digest. Returns None if there is no template, or
+    if it shows a time and the visit isn't scheduled yet.
+    """
+    lang = lang or getattr(user, "preferred_language", None) or DEFAULT_LANGUAGE
+    template = get_template(event, lang)
+    if template is None:
+        return None
+    format_map, fields = template
+    # localtime(None) is the current time, which would read as the visit's time
+    if "when" in fields and not (extra.get("at") or getattr(instance, "scheduled_at", None)):
+        return None
+    return format_map({name: FIELD_GETTERS[name](instance, user, lang, extra) for name in fields})
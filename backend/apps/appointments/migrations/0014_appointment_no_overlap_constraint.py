@@ -0,0 +1,56 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:12
+
+from django.db import migrations
+
+CONSTRAINT_NAME = 'appointments_appointment_no_overlap'
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Exclusion constraints are PostgreSQL only. Other backends (SQLite for
+    # local dev) keep the application level check in Appointment.clean().
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # The constraint can't be added while overlapping rows exist. Name them
+    # so they can be canceled or moved, instead of failing with a bare error.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT a.id, b.id FROM appointments_appointment a '
+            'JOIN appointments_appointment b ON a.id < b.id '
+            "AND tstzrange(a.scheduled_at, a.end_time, '[)') && tstzrange(b.scheduled_at, b.end_time, '[)') "
+            "WHERE a.status <> 'canceled' AND b.status <> 'canceled' "
+            'AND a.end_time IS NOT NULL AND b.end_time IS NOT NULL '
+            'ORDER BY a.id, b.id LIMIT 20'
+        )
+        overlaps = cursor.fetchall()
+    if overlaps:
+        pairs = ', '.join(f'{first}/{second}' for first, second in overlaps)
+        raise RuntimeError(
+            'Cannot add the appointment overlap constraint: these appointments '
+            f'overlap (showing up to 20 pairs of ids): {pairs}. Cancel or '
+            'reschedule one of each pair, then run the migration again.'
+        )
+    schema_editor.execute(
+        'ALTER TABLE appointments_appointment '
+        f'ADD CONSTRAINT {CONSTRAINT_NAME} '
+        "EXCLUDE USING gist (tstzrange(scheduled_at, end_time, '[)') WITH &&) "
+        "WHERE (status <> 'canceled' AND end_time IS NOT NULL)"
+    )
+
+
+def remove_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS {CONSTRAINT_NAME}'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_treatmentsession_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_constraint, remove_overlap_constraint),
+    ]
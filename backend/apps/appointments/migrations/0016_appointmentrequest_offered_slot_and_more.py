@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0015_appointmentseries_appointment_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentrequest',
+            name='offered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointmentrequest',
+            name='offered_slot',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentrequest',
+            index=models.Index(fields=['status', 'day_availability', 'created_at'], name='appointment_status_31fcc6_idx'),
+        ),
+    ]
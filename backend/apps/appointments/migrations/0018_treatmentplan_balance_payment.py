@@ -0,0 +1,77 @@
+# Generated by Django 5.2.10 on 2026-10-18 16:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_ledger(apps, schema_editor):
+    """Carry existing payments into the ledger and compute balances."""
+    TreatmentPlan = apps.get_model('appointments', 'TreatmentPlan')
+    TreatmentSession = apps.get_model('appointments', 'TreatmentSession')
+    Payment = apps.get_model('appointments', 'Payment')
+
+    payments = []
+    session_totals = dict(
+        TreatmentSession.objects.order_by().values('treatment_plan_id')
+        .annotate(total=Sum('amount_received'))
+        .values_list('treatment_plan_id', 'total')
+    )
+    for session in TreatmentSession.objects.exclude(amount_received=0).only(
+        'pk', 'treatment_plan_id', 'amount_received', 'updated_at'
+    ).iterator():
+        payments.append(Payment(
+            treatment_plan_id=session.treatment_plan_id,
+            session_id=session.pk,
+            amount=session.amount_received,
+            notes='Carried over from before the payment ledger',
+            received_at=session.updated_at,
+        ))
+
+    # Amounts entered on a plan directly have no session to attach to
+    for plan in TreatmentPlan.objects.only('pk', 'amount_paid', 'updated_at').iterator():
+        residual = plan.amount_paid - (session_totals.get(plan.pk) or Decimal('0'))
+        if residual:
+            payments.append(Payment(
+                treatment_plan_id=plan.pk,
+                amount=residual,
+                notes='Carried over from before the payment ledger',
+                received_at=plan.updated_at,
+            ))
+
+    Payment.objects.bulk_create(payments, batch_size=1000)
+    TreatmentPlan.objects.update(balance=F('total_amount') - F('amount_paid'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0017_appointment_notified_at_appointment_reminder_stage_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treatmentplan',
+            name='balance',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('method', models.CharField(blank=True, choices=[('upi', 'UPI'), ('card', 'Debit Card/ Credit Card'), ('bank_transfer', 'Bank Transfer(NEFT/IMPS)'), ('cash', 'Cash')], max_length=50)),
+                ('notes', models.CharField(blank=True, max_length=255)),
+                ('received_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='appointments.treatmentsession')),
+                ('treatment_plan', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='appointments.treatmentplan')),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
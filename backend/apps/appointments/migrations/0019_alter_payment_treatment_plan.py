@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0018_treatmentplan_balance_payment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='treatment_plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='appointments.treatmentplan'),
+        ),
+    ]
@@ -1,13 +1,44 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError, connections, router
+from django.db.models.functions import TruncDate
 from django.conf import settings
 from django.dispatch import receiver
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from apps.common.counters import reserve
+from apps.common.tracking import FieldTrackerMixin
 
 User = settings.AUTH_USER_MODEL
 
+# Created by migration 0014 on PostgreSQL
+OVERLAP_CONSTRAINT = "appointments_appointment_no_overlap"
+OVERLAP_MESSAGE = "The appointment time overlaps with an existing appointment. Choose a different time."
+HELD_MESSAGE = "This slot is on hold for another patient. Choose a different time."
+
+PAYMENT_METHODS = [
+    ("upi", "UPI"),
+    ("card", "Debit Card/ Credit Card"),
+    ("bank_transfer", "Bank Transfer(NEFT/IMPS)"),
+    ("cash", "Cash"),
+]
+
+
+def database_enforces_overlap(using=None):
+    """PostgreSQL enforces non-overlapping appointments with an exclusion constraint."""
+    using = using or router.db_for_write(Appointment)
+    return connections[using].vendor == "postgresql"
+
+
+def is_overlap_violation(error):
+    """Check whether an IntegrityError was raised by the overlap exclusion constraint."""
+    diag = getattr(error.__cause__, "diag", None)
+    if diag is not None and getattr(diag, "constraint_name", None):
+        return diag.constraint_name == OVERLAP_CONSTRAINT
+    return OVERLAP_CONSTRAINT in str(error)
+
 # This is just a normal appointment model for regular check-ups and consultations.
-class Appointment(models.Model):
+class Appointment(FieldTrackerMixin, models.Model):
     """Base appointment model for regular check-ups and consultations."""
     APPOINTMENT_STATUS = [
         ("pending", "Pending"),
@@ -29,9 +60,18 @@ class Appointment(models.Model):
         choices=APPOINTMENT_STATUS,
         db_index=True
     )
-    payment_method = models.CharField(max_length=50, null=True, blank=True,
-                                    choices=[("upi", "UPI"), ("card", "Debit Card/ Credit Card"), ("bank_transfer", "Bank Transfer(NEFT/IMPS)"),("cash", "Cash")])
+    payment_method = models.CharField(max_length=50, null=True, blank=True, choices=PAYMENT_METHODS)
     notes = models.TextField(blank=True, null=True)
+    series = models.ForeignKey(
+        "AppointmentSeries",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="appointments"
+    )
+    notified_at = models.DateTimeField(null=True, blank=True)
+    # 0: no reminder yet, 1: day-before reminder sent, 2: same-day reminder sent
+    reminder_stage = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -42,32 +82,88 @@ class Appointment(models.Model):
         ]
         ordering = ['-scheduled_at']
 
+    # Set from the API when an appointment is booked from a slot hold
+    hold_token = None
+
+    @classmethod
+    def overlapping(cls, start, end):
+        """Non-canceled appointments overlapping [start, end)."""
+        return cls.objects.filter(
+            scheduled_at__lt=end,
+            end_time__gt=start
+        ).exclude(status="canceled")
+
     def clean(self):
         if not self.scheduled_at:
             return
-        
+
+        # Canceled appointments don't occupy the slot, matching the constraint's WHERE clause
+        if self.status == "canceled":
+            return
+
+        from .holds import is_held
+
         end_time = self.scheduled_at + timezone.timedelta(minutes=30)
+        if is_held(self.scheduled_at, end_time, exclude_token=self.hold_token):
+            raise ValidationError(HELD_MESSAGE)
 
-        qs = Appointment.objects.filter(
-            scheduled_at__lt=end_time,
-            end_time__gt=self.scheduled_at
-        )
+        # On PostgreSQL the exclusion constraint is the source of truth and is
+        # checked atomically on insert/update, so skip the racy pre-check.
+        if database_enforces_overlap():
+            return
+
+        qs = Appointment.overlapping(self.scheduled_at, end_time)
 
         if self.pk:
             qs = qs.exclude(id=self.pk)
 
         if qs.exists():
-            raise ValidationError("The appointment time overlaps with an existing appointment. Choose a different time.")
+            raise ValidationError(OVERLAP_MESSAGE)
 
     def save(self, *args, **kwargs):
         self.full_clean()
         if self.scheduled_at:
             self.end_time = self.scheduled_at + timezone.timedelta(minutes=30)
-        super().save(*args, **kwargs)
+        try:
+            # Savepoint so a constraint violation doesn't break the caller's transaction
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if is_overlap_violation(e):
+                raise ValidationError(OVERLAP_MESSAGE) from e
+            raise
 
     def __str__(self):
         return f"Appointment for {self.user.first_name} {self.user.last_name} on {self.scheduled_at}"
 
+class AppointmentSeries(models.Model):
+    """Recurring appointments, e.g. an orthodontic adjustment every 4 weeks"""
+    FREQUENCIES = [
+        ("daily", "Daily"),
+        ("weekly", "Weekly"),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="appointment_series"
+    )
+    starts_at = models.DateTimeField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default="weekly")
+    interval = models.PositiveSmallIntegerField(default=1)
+    # At least one of count/until bounds the series
+    count = models.PositiveSmallIntegerField(null=True, blank=True)
+    until = models.DateField(null=True, blank=True)
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Appointment series"
+
+    def __str__(self):
+        return f"Every {self.interval} {self.frequency} for {self.user.first_name} {self.user.last_name} from {self.starts_at}"
+
 class AppointmentRequest(models.Model):
     """Appointment requests made by users"""
     REQUEST_STATUS = [
@@ -101,8 +197,16 @@ class AppointmentRequest(models.Model):
         default="pending",
         db_index=True)
     additional_notes = models.TextField(blank=True, null=True)
+    # Set when a canceled slot was offered to this request (see backfill.py)
+    offered_slot = models.DateTimeField(null=True, blank=True)
+    offered_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'day_availability', 'created_at']),
+        ]
     
 class FollowUp(models.Model):
     """Follow-up visits/notes for an appointment"""
@@ -123,7 +227,7 @@ class FollowUp(models.Model):
     def __str__(self):
         return f"Follow-up for {self.appointment} on {self.scheduled_at}"
 
-class TreatmentPlan(models.Model):
+class TreatmentPlan(FieldTrackerMixin, models.Model):
     """Treatment plans associated with an appointment"""
     TREATMENT_TYPES = [
         ("braces", "Braces"),
@@ -153,7 +257,10 @@ class TreatmentPlan(models.Model):
     )
 
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0"))
+    # total_amount - amount_paid, stored so outstanding balances can be filtered on an index.
+    # Moved together with amount_paid by payments.apply_plan_payments
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_index=True)
 
     estimated_duration_months = models.IntegerField()
     is_completed = models.BooleanField(default=False)
@@ -168,11 +275,40 @@ class TreatmentPlan(models.Model):
     def amount_remaining(self):
         """Calculate remaining amount dynamically"""
         return self.total_amount - self.amount_paid
+
+    @classmethod
+    def outstanding(cls, min_balance=0):
+        """Open plans with more than `min_balance` left to pay, largest first."""
+        return cls.objects.filter(balance__gt=min_balance, is_completed=False).order_by('-balance')
+
+    def save(self, *args, **kwargs):
+        # amount_paid and balance are moved in the database by payments, so a
+        # plan saved with a stale copy must not write them back
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and self.previous("amount_paid") is not None
+            and not self.has_changed("amount_paid")
+        ):
+            total_changed = self.has_changed("total_amount")
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ("amount_paid", "balance")
+            ]
+            super().save(*args, **kwargs)
+            if total_changed:
+                TreatmentPlan.objects.filter(pk=self.pk).update(balance=models.F("total_amount") - models.F("amount_paid"))
+                self.mark_saved(balance=self.total_amount - self.amount_paid)
+            return
+
+        self.balance = self.total_amount - self.amount_paid
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.treatment_type} plan for {self.user.first_name} {self.user.last_name}"
     
-class TreatmentSession(models.Model):
+class TreatmentSession(FieldTrackerMixin, models.Model):
     """Individual sessions/phases of a treatment plan"""
     SESSION_STATUS = [
         ("pending", "Pending"),
@@ -204,6 +340,7 @@ class TreatmentSession(models.Model):
 
     notification_sent = models.BooleanField(default=False)
     notified_at = models.DateTimeField(null=True, blank=True)
+    reminder_stage = models.PositiveSmallIntegerField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -211,43 +348,116 @@ class TreatmentSession(models.Model):
     class Meta:
         ordering = ['session_number']
         unique_together = ['treatment_plan', 'session_number']
+        indexes = [
+            models.Index(fields=['scheduled_at']),
+        ]
+
+    # Set before save() to record how a change in amount_received was paid
+    payment_method = None
+
+    @staticmethod
+    def reserve_numbers(plan_id, count=1):
+        """First of `count` consecutive session numbers for the plan, unique even under concurrent inserts."""
+        def highest_existing():
+            return TreatmentSession.objects.filter(treatment_plan_id=plan_id).aggregate(
+                highest=models.Max('session_number')
+            )['highest'] or 0
+
+        return reserve(f"appointments.treatmentsession:{plan_id}", count, seed=highest_existing)
 
     def save(self, *args, **kwargs):
+        with transaction.atomic():
+            amount_difference = self._prepare_save()
+            super().save(*args, **kwargs)
+            if amount_difference:
+                self._apply_payment(amount_difference)
+
+    def _prepare_save(self):
+        """Number a new session and return how much its save adds to the plan's amount_paid."""
         # Check if this is an existing session (update) or new session (create)
         if self.pk:
-            # This is an update - get the old instance
-            old_instance = TreatmentSession.objects.get(pk=self.pk)
-            old_amount_received = old_instance.amount_received
-            
-            # Calculate the difference
-            amount_difference = self.amount_received - old_amount_received
-            
-            # Update treatment plan amount paid with the difference
-            self.treatment_plan.amount_paid += amount_difference
-            self.treatment_plan.save()
+            # This is an update - the tracker kept the amount as it was loaded
+            old_amount_received = self.previous('amount_received')
+            if old_amount_received is None:
+                old_amount_received = TreatmentSession.objects.values_list(
+                    'amount_received', flat=True
+                ).get(pk=self.pk)
+            return self.amount_received - old_amount_received
         else:
             # This is a new session (create)
             if not self.session_number:
-                last_session = TreatmentSession.objects.filter(
-                    treatment_plan=self.treatment_plan
-                ).order_by('-session_number').first()
-
-                if last_session:
-                    self.session_number = last_session.session_number + 1
-                else:
-                    self.session_number = 1
+                self.session_number = TreatmentSession.reserve_numbers(self.treatment_plan_id)
 
             if not self.amount_received:
                 self.amount_received = 0
-            
-            # Add the new amount to treatment plan
-            updated_amount = self.treatment_plan.amount_paid + self.amount_received
-            self.treatment_plan.amount_paid = updated_amount
-            self.treatment_plan.save()
+            return self.amount_received
 
-        super().save(*args, **kwargs)
+    def _apply_payment(self, amount):
+        """Record the payment in the ledger and move the plan's totals; plan signals don't run."""
+        from .payments import append_payment
+
+        append_payment(self.treatment_plan_id, amount, method=self.payment_method or "", session=self)
+        # Keep an already loaded plan in step without writing it again
+        if TreatmentSession.treatment_plan.is_cached(self):
+            plan = self.treatment_plan
+            plan.mark_saved(amount_paid=plan.amount_paid + amount, balance=plan.balance - amount)
     
 
     def __str__(self):
         return f"Session {self.session_number} - {self.treatment_plan}"
 
+
+class Payment(models.Model):
+    """
+    Append-only ledger of money received for treatment plans. Corrections are
+    new entries with a negative amount. Rows are never edited, and are only
+    deleted along with their plan.
+    """
+    treatment_plan = models.ForeignKey(
+        TreatmentPlan,
+        on_delete=models.CASCADE,
+        related_name="payments"
+    )
+    session = models.ForeignKey(
+        TreatmentSession,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="payments"
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Blank for entries carried over from before the ledger or entered without a method
+    method = models.CharField(max_length=50, choices=PAYMENT_METHODS, blank=True)
+    notes = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-received_at']
+
+    @classmethod
+    def daily_totals(cls, start, end):
+        """Money collected per day and method between two datetimes."""
+        return (
+            cls.objects
+            .filter(received_at__gte=start, received_at__lt=end)
+            .annotate(day=TruncDate('received_at'))
+            .values('day', 'method')
+            .annotate(total=models.Sum('amount'), count=models.Count('id'))
+            .order_by('day', 'method')
+        )
+
+    def clean(self):
+        if self.session_id and self.treatment_plan_id and self.session.treatment_plan_id != self.treatment_plan_id:
+            raise ValidationError({"session": "This session belongs to a different treatment plan."})
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Payments can't be changed. Record a correcting payment instead.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Payments can't be deleted. Record a correcting payment instead.")
+
+    def __str__(self):
+        return f"{self.amount} for {self.treatment_plan} on {self.received_at:%Y-%m-%d}"
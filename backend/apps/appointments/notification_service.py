@@ -1,142 +1,53 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
-from twilio.rest import Client
+from apps.common.messaging import send_whatsapp
+from apps.common.outbox import CONCURRENCY, enqueue, object_type_of, pending_events, supersede
+from .events import (
+    AppointmentEvent, AppointmentRequestEvent, TreatmentPlanEvent, TreatmentSessionEvent,
+    PrescriptionEvent
+)
+from .message_templates import render
 
 logger = logging.getLogger(__name__)
 
-client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-
-class AppointmentEvent:
-    CREATED = "appointment.created"
-    UPDATED = "appointment.updated"
-    COMPLETED = "appointment.completed"
-    CANCELLED = "appointment.deleted"
-
-class UserEvent:
-    CREATED = "user.created"
-    UPDATED = "user.created"
-    DELETED = "user.deleted"
-
-class TreatmentPlanEvent:
-    CREATED = "treatment_plan.created"
-    UPDATED = "treatment_plan.updated"
-    COMPLETED = "treatment_plan.completed"
-    CANCELLED = "treatment_plan.cancelled"
+def get_recipient(instance):
+    user = getattr(instance, 'user', None)
+    if not user and hasattr(instance, 'treatment_plan'):
+        user = instance.treatment_plan.user
+    return user
 
-class TreatmentSessionEvent:
-    CREATED = "treatment_session.created"
-    UPDATED = "treatment_session_updated"
-    COMPLETED = "treatment_session_completed"
-    CANCELLED = "treatment_session_cancelled"
+# Events sent as an approved WhatsApp template instead of a text body
+CONTENT_TEMPLATES = {
+    PrescriptionEvent.CREATED: settings.T2_PRESCRIPTION_SID,
+}
 
-def format_datetime(dt):
-    return dt.strftime("%A, %d %b at %I:%M %p")
+def render_notification(instance, event, user):
+    """Message text for an event in the patient's language, or None if there is no template for it."""
+    return render(event, user, instance)
 
 def send_notification_on_whatsapp(instance, **kwargs):
-    """
-    Send WhatsApp notification to user about treatment session.
-    Currently returns a mock response.
-    TODO: Integrate with WhatsApp API (Twilio or similar)
-    """
+    """Send a WhatsApp notification right away, bypassing the outbox."""
     event = kwargs.get('event')
-    print("Sending whatsapp message...")
-    user = getattr(instance, 'user', None)
-    if not user and hasattr(instance, 'treatment_plan'):
-        user = instance.treatment_plan.user
-
+    user = get_recipient(instance)
     if not user:
         return {'status': 'failed', 'reason': 'No user associated with instance'}
-    
+
+    content_sid = CONTENT_TEMPLATES.get(event) or ""
+    message = render_notification(instance, event, user) if not content_sid else content_sid
+    if message is None:
+        return {'status': 'failed', 'reason': f'No whatsapp message for event: {event} (no template, or not scheduled yet)'}
+
     phone_number = user.phone_number
     full_name = f"{user.first_name} {user.last_name}".strip()
-    message = ""
-
-    if event == AppointmentEvent.CREATED:
-        message = (
-                f"Hi *{full_name}* 😊\n\n"
-                f"Your appointment at *Blissful Smiles* is now confirmed! 🦷\n"
-                f"📅 *{format_datetime(instance.scheduled_at)}*\n\n"
-                f"We're looking forward to brightening your smile! ✨\n"
-                f"See you soon!"
-            )
-    elif event == AppointmentEvent.UPDATED:
-        message = (
-            f"Hey *{full_name}* 👋\n\n"
-            f"We've *updated* your appointment:\n"
-            f"🆕 *{format_datetime(instance.scheduled_at)}*\n\n"
-            f"Everything else stays the same. Questions? Just reply! 😄"
-        )
-    elif event == AppointmentEvent.COMPLETED:
-        message = (
-            f"Great seeing you today, *{full_name}*! 😁\n\n"
-            f"Your appointment on *{format_datetime(instance.scheduled_at)}* is all wrapped up! 🎉\n\n"
-            f"Keep up the great dental care - your smile looks fantastic! 🌟"
-        )
-    elif event == AppointmentEvent.CANCELLED:
-        message = (
-            f"Hi *{full_name}*,\n\n"
-            f"Your appointment on *{format_datetime(instance.scheduled_at)}* has been cancelled 🗑️\n\n"
-            f"Need to book a new one? We're here to help! 🌟 Reply anytime."
-        )
-    elif event == TreatmentPlanEvent.CREATED:
-        message = (
-                f"Hello *{full_name}* 🌟\n\n"
-                f"Your new *{instance.get_treatment_type_display()}* treatment plan is ready! 🦷\n\n"
-                f"We've planned everything to get you the best results — step by step.\n"
-                f"Excited to start this journey with you! 🚀"
-            )
-    elif event == TreatmentPlanEvent.COMPLETED:
-        message = (
-            f"Wow *{full_name}* — you did it! 🎉\n\n"
-            f"Your *{instance.get_treatment_type_display()}* treatment plan is officially *complete* 🏆\n\n"
-            f"Your smile looks amazing — keep up the great work! 😁\n"
-            f"We're so proud of you!"
-        )
-    elif event == TreatmentPlanEvent.CANCELLED:
-        message = (
-            f"Hi *{full_name}*,\n\n"
-            f"Your *{instance.get_treatment_type_display()}* treatment plan has been cancelled.\n\n"
-            f"No worries — whenever you're ready to continue, just let us know ❤️"
-        )
-    elif event == TreatmentSessionEvent.CREATED:
-        message = (
-                f"Hi *{full_name}* 😄\n\n"
-                f"*Session {instance.session_number}* of your *{instance.treatment_plan.get_treatment_type_display()}* plan is scheduled!\n"
-                f"📅 *{format_datetime(instance.scheduled_at)}*\n\n"
-                f"Get ready for the next step toward a healthier smile! ✨"
-            )
-    elif event == TreatmentSessionEvent.UPDATED:
-        message = (
-            f"Hey *{full_name}*,\n\n"
-            f"We've *rescheduled* Session {instance.session_number}:\n"
-            f"🆕 *{format_datetime(instance.scheduled_at)}*\n\n"
-            f"Sorry for any inconvenience — we'll make it worth it! 🦷😊"
-        )
-
-    elif event == TreatmentSessionEvent.COMPLETED:
-        message = (
-            f"Great job today, *{full_name}*! 👏\n\n"
-            f"*Session {instance.session_number}* is successfully completed 🎯\n\n"
-            f"You're making awesome progress — keep shining! 🌟"
-        )
-
-    elif event == TreatmentSessionEvent.CANCELLED:
-        message = (
-            f"Hi *{full_name}*,\n\n"
-            f"Session {instance.session_number} has been cancelled.\n\n"
-            f"Want to pick a new time? Just reply — we've got you! 😊"
-        )
-    else:
-        return {'status': 'failed', 'reason': f'No whatsapp template for event: {event}'}
-    
     logger.info(f"[WhatsApp] Sending to {phone_number}: {message}")
 
-    client.messages.create(
-        body=message,
-        to=f"whatsapp:{phone_number}",
-        from_=settings.TWILIO_WHATSAPP_NUMBER,
-    )
+    if content_sid:
+        send_whatsapp(phone_number, content_sid=content_sid)
+    else:
+        send_whatsapp(phone_number, body=message)
 
     return {
         'status': 'sent',
@@ -146,6 +57,110 @@ def send_notification_on_whatsapp(instance, **kwargs):
         'timestamp': timezone.now().isoformat(),
     }
 
+# An update to something the patient hasn't been told about yet is still news of its creation
+UNANNOUNCED_UPDATES = {
+    AppointmentEvent.UPDATED: AppointmentEvent.CREATED,
+    TreatmentPlanEvent.UPDATED: TreatmentPlanEvent.CREATED,
+    TreatmentSessionEvent.UPDATED: TreatmentSessionEvent.CREATED,
+}
+
+def coalesce_key(user, instance):
+    return f"{user.pk}:{object_type_of(instance)}:{instance.pk}"
+
+def merge_event(earlier_events, event):
+    """The single event to send in place of the superseded ones and the new one."""
+    created = UNANNOUNCED_UPDATES.get(event)
+    if created and created in earlier_events:
+        return created
+    return event
+
+def _send_safely(instance, event):
+    try:
+        return instance, send_notification_on_whatsapp(instance, event=event)
+    except Exception as e:
+        logger.error(f"WhatsApp notification for {instance} failed: {str(e)}")
+        return instance, {'status': 'failed', 'reason': str(e)}
+
+def send_notifications(instances, event, concurrency=CONCURRENCY):
+    """
+    Send the same event for many objects right away, `concurrency` at a time.
+    Returns the objects that were sent and (object, reason) pairs for the rest.
+    """
+    if not instances:
+        return [], []
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(instances))) as executor:
+        results = list(executor.map(lambda instance: _send_safely(instance, event), instances))
+
+    sent = [instance for instance, response in results if response['status'] == 'sent']
+    failed = [(instance, response['reason']) for instance, response in results if response['status'] != 'sent']
+    return sent, failed
+
+def queue_notification(instance, event):
+    """
+    Write the notification to the outbox, it is sent after the transaction commits.
+    Notifications about the same object are debounced: a newer one replaces any
+    still waiting, rendered from the latest state.
+    """
+    user = get_recipient(instance)
+    if not user:
+        return None
+
+    key = coalesce_key(user, instance)
+    with transaction.atomic():
+        pending = pending_events(key)
+        if pending:
+            event = merge_event(list(pending.values()), event)
+
+        message = render_notification(instance, event, user)
+        if message is None:
+            # Nothing replaces the pending messages, so they still go out
+            logger.info(f"Nothing to send for {event} of {key}: no template, or not scheduled yet")
+            return None
+        supersede(pending)
+        if pending:
+            logger.info(f"Coalesced {len(pending)} pending notifications into {event} for {key}")
+        return enqueue(user.phone_number, body=message, event=event, obj=instance, coalesce_key=key)
+
+def render_appointment_digest(user, appointments):
+    """A single message listing several new appointments of a patient."""
+    return render(AppointmentEvent.DIGEST, user, appointments=appointments)
+
+def queue_appointment_digest(user, appointments):
+    if not appointments:
+        return None
+    return enqueue(
+        user.phone_number,
+        body=render_appointment_digest(user, appointments),
+        event=AppointmentEvent.DIGEST,
+    )
+
+def render_plan_schedule(plan, sessions):
+    """A single message listing the generated sessions of a treatment plan."""
+    return render(TreatmentPlanEvent.SCHEDULED, plan.user, plan, sessions=sessions)
+
+def queue_plan_schedule(plan, sessions):
+    if not sessions:
+        return None
+    return enqueue(
+        plan.user.phone_number,
+        body=render_plan_schedule(plan, sessions),
+        event=TreatmentPlanEvent.SCHEDULED,
+        obj=plan,
+    )
+
+def render_slot_offer(appointment_request, slot_start):
+    """Offer a slot freed by a cancellation to a patient waiting on an appointment request."""
+    return render(AppointmentRequestEvent.SLOT_OFFERED, appointment_request.user, appointment_request, at=slot_start)
+
+def queue_slot_offer(appointment_request, slot_start):
+    phone_number = appointment_request.phone_number or appointment_request.user.phone_number
+    return enqueue(
+        phone_number,
+        body=render_slot_offer(appointment_request, slot_start),
+        event=AppointmentRequestEvent.SLOT_OFFERED,
+        obj=appointment_request,
+    )
+
 # def send_notification_on_sms(instance, **kwargs):
 #     event = kwargs.get('event')
 #     user = getattr(instance, 'user', None)
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AppointmentCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (scheduled_at, id). Each page is an indexed range
+    read, so deep pages cost the same as the first one.
+    """
+    ordering = ('-scheduled_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,123 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from . import analytics
+from .models import Payment, TreatmentPlan, TreatmentSession
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def _increments(deltas):
+    """CASE expression adding each pk's delta, for one UPDATE over many rows."""
+    return Case(
+        *[When(pk=pk, then=Value(delta, output_field=MONEY)) for pk, delta in deltas.items()],
+        default=Value(Decimal("0"), output_field=MONEY),
+        output_field=MONEY,
+    )
+
+
+def apply_plan_payments(deltas):
+    """
+    Add {plan_id: amount} to the plans' amount_paid, and take it off their
+    balance, in a single UPDATE. The arithmetic happens in the database, so
+    concurrent payments on one plan all count, and no plan signals run.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    increments = _increments(deltas)
+    return TreatmentPlan.objects.filter(pk__in=deltas).update(
+        amount_paid=F("amount_paid") + increments,
+        balance=F("balance") - increments,
+        updated_at=timezone.now(),
+    )
+
+
+def record_payment(plan_id, amount, method="", session=None, notes="", received_at=None):
+    """
+    Append a ledger entry and move the plan's totals, and the session's
+    amount_received if the payment is for one, in one transaction.
+    """
+    with transaction.atomic():
+        payment = append_payment(plan_id, amount, method=method, session=session, notes=notes, received_at=received_at)
+        if session is not None:
+            TreatmentSession.objects.filter(pk=session.pk).update(
+                amount_received=F("amount_received") + amount,
+                updated_at=timezone.now(),
+            )
+            session.mark_saved(amount_received=session.amount_received + amount)
+    return payment
+
+
+def append_payment(plan_id, amount, method="", session=None, notes="", received_at=None):
+    """
+    Append a ledger entry and move the plan's totals only, for a session that
+    already saved its own amount_received.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.create(
+            treatment_plan_id=plan_id,
+            session=session,
+            amount=amount,
+            method=method,
+            notes=notes,
+            received_at=received_at or timezone.now(),
+        )
+        apply_plan_payments({plan_id: amount})
+        analytics.touch(payment.received_at)
+    return payment
+
+
+def record_session_payments(payments, method=""):
+    """
+    Record money received for many sessions at once. `payments` maps session
+    ids to the amount received now. The ledger gets one INSERT, and sessions
+    and their plans one UPDATE each, whatever the number of sessions or plans.
+    Returns a summary, or {"error": ...} if a session doesn't exist.
+    """
+    payments = {pk: amount for pk, amount in payments.items() if amount}
+    if not payments:
+        return {"sessions": 0, "plans": 0, "total": Decimal("0")}
+
+    with transaction.atomic():
+        plan_ids = dict(
+            TreatmentSession.objects
+            .select_for_update()
+            .filter(pk__in=payments)
+            .values_list("pk", "treatment_plan_id")
+        )
+        missing = set(payments) - set(plan_ids)
+        if missing:
+            return {"error": f"Unknown treatment sessions: {', '.join(map(str, sorted(missing)))}"}
+
+        plan_deltas = {}
+        for session_id, amount in payments.items():
+            plan_id = plan_ids[session_id]
+            plan_deltas[plan_id] = plan_deltas.get(plan_id, Decimal("0")) + amount
+
+        now = timezone.now()
+        Payment.objects.bulk_create([
+            Payment(
+                treatment_plan_id=plan_ids[session_id],
+                session_id=session_id,
+                amount=amount,
+                method=method,
+                received_at=now,
+            )
+            for session_id, amount in payments.items()
+        ])
+        TreatmentSession.objects.filter(pk__in=payments).update(
+            amount_received=F("amount_received") + _increments(payments),
+            updated_at=now,
+        )
+        apply_plan_payments(plan_deltas)
+        analytics.touch(now)
+
+    return {
+        "sessions": len(payments),
+        "plans": len(plan_deltas),
+        "total": sum(payments.values(), Decimal("0")),
+    }
@@ -0,0 +1,116 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+
+from . import analytics
+from .models import Appointment, is_overlap_violation
+from .availability import SLOT_DURATION, load_busy_intervals, is_free
+from .notification_service import queue_appointment_digest
+
+# Keeps a single series to about a year of weekly visits
+MAX_OCCURRENCES = 52
+
+FREQUENCY_STEPS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+}
+
+
+def expand_occurrences(starts_at, frequency, interval, count=None, until=None):
+    """
+    Expand an RRULE-like spec into occurrence datetimes. Steps are taken on the
+    local wall clock so a 10:00 visit stays at 10:00.
+    """
+    step = FREQUENCY_STEPS[frequency] * interval
+    tz = timezone.get_current_timezone()
+    first = timezone.localtime(starts_at, tz).replace(tzinfo=None)
+    limit = min(count or MAX_OCCURRENCES, MAX_OCCURRENCES)
+    last = datetime.combine(until, time.max) if until else None
+
+    occurrences = []
+    current = first
+    while len(occurrences) < limit and (last is None or current <= last):
+        occurrences.append(timezone.make_aware(current, tz))
+        current += step
+    return occurrences
+
+
+def exceeds_max_occurrences(starts_at, frequency, interval, count=None, until=None):
+    """Whether the spec asks for more than MAX_OCCURRENCES visits, which would be cut short."""
+    if count and count > MAX_OCCURRENCES:
+        return True
+    if until and not count:
+        first = timezone.localtime(starts_at).replace(tzinfo=None)
+        # The first occurrence past the limit still falls on or before `until`
+        return first + FREQUENCY_STEPS[frequency] * interval * MAX_OCCURRENCES <= datetime.combine(until, time.max)
+    return False
+
+
+def plan_series(series):
+    """
+    Occurrences of an (unsaved) AppointmentSeries and the ones that clash with
+    existing bookings. One range query plus an in-memory sweep.
+    """
+    occurrences = expand_occurrences(
+        series.starts_at, series.frequency, series.interval, series.count, series.until
+    )
+    if not occurrences:
+        return [], []
+
+    busy = load_busy_intervals(occurrences[0], occurrences[-1] + SLOT_DURATION)
+    conflicts = [start for start in occurrences if not is_free(busy, start, start + SLOT_DURATION)]
+    return occurrences, conflicts
+
+
+def book_series(series, status="confirmed", skip_conflicts=False, notify=True):
+    """
+    Save the series and bulk insert its appointments. Conflicting occurrences
+    reject the whole series unless `skip_conflicts` is set. The patient gets a
+    single digest message through the outbox.
+    """
+    occurrences, conflicts = plan_series(series)
+    result = {
+        "series": None,
+        "created": 0,
+        "ids": [],
+        "conflicts": [start.isoformat() for start in conflicts],
+    }
+
+    if conflicts and not skip_conflicts:
+        return result
+
+    conflicting = set(conflicts)
+    appointments = [
+        Appointment(
+            user=series.user,
+            series=series,
+            scheduled_at=start,
+            end_time=start + SLOT_DURATION,
+            status=status,
+            notes=series.notes,
+        )
+        for start in occurrences
+        if start not in conflicting
+    ]
+    if not appointments:
+        return result
+
+    try:
+        with transaction.atomic():
+            series.save()
+            created = Appointment.objects.bulk_create(appointments)
+            analytics.touch(*[appointment.scheduled_at for appointment in created])
+            if notify:
+                queue_appointment_digest(series.user, created)
+    except IntegrityError as e:
+        if is_overlap_violation(e):
+            result["error"] = "Another booking overlapped this series while it was being created. Try again."
+            return result
+        raise
+
+    result["series"] = series.pk
+    result["created"] = len(created)
+    result["ids"] = [appointment.pk for appointment in created]
+    return result
+
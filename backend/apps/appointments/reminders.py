@@ -0,0 +1,93 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.common.outbox import build_message, enqueue_many
+from .models import Appointment, TreatmentSession
+from .notification_service import (
+    AppointmentEvent, TreatmentSessionEvent, get_recipient, render_notification
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# (reminder_stage, lead time), nearest window first so a visit booked a few
+# hours ahead only gets the same-day reminder
+REMINDER_STAGES = [
+    (2, timedelta(hours=2)),
+    (1, timedelta(hours=24)),
+]
+
+REMINDABLE_STATUSES = ("pending", "confirmed")
+
+# (model, event, select_related path to the patient)
+REMINDER_SOURCES = [
+    (Appointment, AppointmentEvent.REMINDER, "user"),
+    (TreatmentSession, TreatmentSessionEvent.REMINDER, "treatment_plan__user"),
+]
+
+
+def due_queryset(model, stage, lead_time, now):
+    """Rows starting within `lead_time` that haven't had this reminder. Served from the scheduled_at index."""
+    return (
+        model.objects
+        .filter(
+            scheduled_at__gt=now,
+            scheduled_at__lte=now + lead_time,
+            status__in=REMINDABLE_STATUSES,
+            reminder_stage__lt=stage,
+        )
+        # Booked inside the window: the booking confirmation is reminder enough
+        .exclude(created_at__gt=F("scheduled_at") - lead_time)
+    )
+
+
+def queue_reminder_batch(model, event, related, stage, ids):
+    """
+    Queue reminders for one batch and advance reminder_stage with a single
+    UPDATE, in the same transaction so a crash can neither skip nor repeat them.
+    """
+    with transaction.atomic():
+        rows = list(
+            model.objects
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related(related)
+            .filter(pk__in=ids, reminder_stage__lt=stage)
+        )
+        if not rows:
+            return 0
+
+        messages = []
+        for row in rows:
+            user = get_recipient(row)
+            messages.append(build_message(
+                user.phone_number,
+                body=render_notification(row, event, user),
+                event=event,
+                obj=row,
+            ))
+        enqueue_many(messages)
+        model.objects.filter(pk__in=[row.pk for row in rows]).update(reminder_stage=stage)
+    return len(rows)
+
+
+def queue_due_reminders(now=None):
+    """Queue every reminder that is due. Returns the number queued per model."""
+    now = now or timezone.now()
+    queued = {}
+    for model, event, related in REMINDER_SOURCES:
+        count = 0
+        for stage, lead_time in REMINDER_STAGES:
+            ids = list(
+                due_queryset(model, stage, lead_time, now)
+                .order_by("scheduled_at")
+                .values_list("pk", flat=True)
+            )
+            for offset in range(0, len(ids), BATCH_SIZE):
+                count += queue_reminder_batch(model, event, related, stage, ids[offset:offset + BATCH_SIZE])
+        queued[model._meta.model_name] = count
+    return queued
@@ -0,0 +1,148 @@
+from bisect import insort
+from datetime import timedelta
+from decimal import Decimal, ROUND_DOWN
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import TreatmentPlan, TreatmentSession
+from .availability import SLOT_DURATION, load_busy_intervals, merge_intervals, is_free, iter_candidate_slots, free_slots
+from .recurrence import expand_occurrences, MAX_OCCURRENCES
+from .notification_service import queue_plan_schedule
+
+MAX_SESSIONS = MAX_OCCURRENCES
+DEFAULT_INTERVAL_WEEKS = 4
+# How far a clashing session may move to the next free slot
+MAX_SHIFT = timedelta(days=7)
+CENT = Decimal("0.01")
+
+
+def default_session_count(plan, interval_weeks):
+    """Visits needed to cover the plan's estimated duration at the given cadence."""
+    weeks = plan.estimated_duration_months * 52 // 12
+    return max(1, min(MAX_SESSIONS, weeks // interval_weeks))
+
+
+def split_amount(total, count, deposit=None):
+    """
+    Per-session amounts that add up to `total` exactly: an optional deposit
+    for the first session and the rest spread evenly, with the rounding
+    remainder on the last session.
+    """
+    if count < 1 or total <= 0:
+        return [Decimal("0")] * count
+    amounts = []
+    if deposit is not None:
+        deposit = min(deposit, total)
+        amounts.append(deposit)
+        total -= deposit
+        count -= 1
+    if count:
+        share = (total / count).quantize(CENT, rounding=ROUND_DOWN)
+        amounts += [share] * (count - 1) + [total - share * (count - 1)]
+    elif amounts:
+        amounts[0] += total
+    return amounts
+
+
+def load_calendar(start, end):
+    """Busy intervals for [start, end): appointments, holds and other plans' sessions."""
+    sessions = (
+        TreatmentSession.objects
+        .filter(scheduled_at__gt=start - SLOT_DURATION, scheduled_at__lt=end)
+        .exclude(status="cancelled")
+        .values_list("scheduled_at", flat=True)
+    )
+    intervals = load_busy_intervals(start, end) + [(at, at + SLOT_DURATION) for at in sessions]
+    return merge_intervals(sorted(intervals))
+
+
+def place_sessions(starts_at, interval_weeks, count, shift_conflicts=True):
+    """
+    Session times on the cadence, checked against the calendar loaded once.
+    A clashing session moves to the next free slot within MAX_SHIFT when
+    `shift_conflicts` is set. Returns (placed, shifted, conflicts).
+    """
+    occurrences = expand_occurrences(starts_at, "weekly", interval_weeks, count)
+    if not occurrences:
+        return [], [], []
+
+    busy = load_calendar(occurrences[0], occurrences[-1] + MAX_SHIFT + SLOT_DURATION)
+    placed, shifted, conflicts = [], [], []
+    for start in occurrences:
+        slot = start if is_free(busy, start, start + SLOT_DURATION) else None
+        if slot is None and shift_conflicts:
+            local_day = timezone.localtime(start).date()
+            candidates = free_slots(
+                busy,
+                iter_candidate_slots(local_day, local_day + MAX_SHIFT),
+                not_before=start,
+            )
+            if candidates:
+                slot = candidates[0][0]
+                shifted.append((start, slot))
+        if slot is None:
+            conflicts.append(start)
+            continue
+        placed.append(slot)
+        # Later sessions must not land on this one either
+        insort(busy, (slot, slot + SLOT_DURATION))
+    return placed, shifted, conflicts
+
+
+def generate_schedule(plan, starts_at, interval_weeks=DEFAULT_INTERVAL_WEEKS, count=None,
+                      deposit=None, shift_conflicts=True, notify=True, dry_run=False):
+    """
+    Expand a treatment plan into its sessions: place them on the calendar,
+    split what is left of the plan's total across them, insert them with one
+    bulk_create and send the patient one schedule summary. Nothing is created
+    if any session can't be placed.
+    """
+    count = count or default_session_count(plan, interval_weeks)
+    placed, shifted, conflicts = place_sessions(starts_at, interval_weeks, count, shift_conflicts)
+
+    already_planned = plan.sessions.aggregate(total=Sum("amount_for_session"))["total"] or Decimal("0")
+    amounts = split_amount(plan.total_amount - already_planned, len(placed), deposit)
+
+    result = {
+        "plan": plan.pk,
+        "created": 0,
+        "ids": [],
+        "sessions": [
+            {"scheduled_at": start.isoformat(), "amount_for_session": amount}
+            for start, amount in zip(placed, amounts)
+        ],
+        "shifted": [{"from": old.isoformat(), "to": new.isoformat()} for old, new in shifted],
+        "conflicts": [start.isoformat() for start in conflicts],
+    }
+    if conflicts or not placed or dry_run:
+        return result
+
+    with transaction.atomic():
+        # One counter UPDATE numbers the whole block
+        first_number = TreatmentSession.reserve_numbers(plan.pk, len(placed))
+        treatment = plan.get_treatment_type_display()
+        sessions = [
+            TreatmentSession(
+                treatment_plan=plan,
+                session_number=first_number + offset,
+                description=f"{treatment} session {first_number + offset}",
+                amount_for_session=amount,
+                scheduled_at=start,
+            )
+            for offset, (start, amount) in enumerate(zip(placed, amounts))
+        ]
+        # bulk_create skips save() and the per-session signals, so the plan is
+        # touched once here and the patient gets one summary instead of a message per session
+        created = TreatmentSession.objects.bulk_create(sessions)
+        TreatmentPlan.objects.filter(pk=plan.pk).update(updated_at=timezone.now())
+        if notify:
+            queue_plan_schedule(plan, created)
+
+    for entry, session in zip(result["sessions"], created):
+        entry["id"] = session.pk
+        entry["session_number"] = session.session_number
+    result["created"] = len(created)
+    result["ids"] = [session.pk for session in created]
+    return result
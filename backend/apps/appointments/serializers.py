@@ -1,16 +1,27 @@
-from datetime import timedelta, timezone
+from decimal import Decimal
+import redis
 from rest_framework import serializers
-from .models import Appointment, AppointmentRequest, TreatmentPlan, TreatmentSession
+from django.db import transaction
+from django.utils import timezone
+from .models import Appointment, AppointmentRequest, AppointmentSeries, TreatmentPlan, TreatmentSession, PAYMENT_METHODS
+from .availability import get_available_slots
+from .holds import owns_hold, release_on_commit
+from .recurrence import MAX_OCCURRENCES, exceeds_max_occurrences
+from .bulk import NOTIFY_CHOICES, NOTIFY_NONE
+from .recurrence import MAX_OCCURRENCES as MAX_SESSIONS
+
+MAX_PAYMENTS_PER_REQUEST = 500
 
 class AppointmentSerializer(serializers.ModelSerializer):
-    user_payment_method = serializers.CharField(source='user.payment_method')
+    user_payment_method = serializers.CharField(source='payment_method', read_only=True)
     user_name = serializers.CharField(source='user.first_name', read_only=True)
     scheduled_at = serializers.DateTimeField()
+    hold_token = serializers.CharField(write_only=True, required=False)
 
 
     class Meta:
         model = Appointment
-        fields = ["id", "user_name", "scheduled_at", "status", "notes", "user_payment_method", "created_at"]
+        fields = ["id", "user_name", "scheduled_at", "status", "notes", "user_payment_method", "hold_token", "created_at"]
         read_only_fields = ["id", "user_name", "created_at"]
 
     def get_user_payment_method(self, obj):
@@ -20,8 +31,90 @@ class AppointmentSerializer(serializers.ModelSerializer):
     def validate_scheduled_at(self, value):
         if value < timezone.now():
             raise serializers.ValidationError("Scheduled time cannot be in the past.")
+        return value
+
+    def validate(self, attrs):
+        hold_token = attrs.get("hold_token")
+        if hold_token:
+            scheduled_at = attrs.get("scheduled_at") or getattr(self.instance, "scheduled_at", None)
+            try:
+                owned = owns_hold(scheduled_at, hold_token, self.context["request"].user.pk)
+            except redis.RedisError:
+                # Booking still goes through, the overlap constraint guards the slot
+                owned = True
+            if not owned:
+                raise serializers.ValidationError({"hold_token": "Your hold on this slot has expired. Pick the slot again."})
+        return attrs
+
+    def create(self, validated_data):
+        hold_token = validated_data.pop("hold_token", None)
+        appointment = Appointment(**validated_data)
+        appointment.hold_token = hold_token
+        with transaction.atomic():
+            appointment.save()
+            if hold_token:
+                release_on_commit(appointment.scheduled_at, hold_token, appointment.user_id)
+        return appointment
+
+    def update(self, instance, validated_data):
+        hold_token = validated_data.pop("hold_token", None)
+        instance.hold_token = hold_token
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if hold_token:
+                release_on_commit(instance.scheduled_at, hold_token, self.context["request"].user.pk)
+        return instance
+
+
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    status = serializers.ChoiceField(choices=Appointment.APPOINTMENT_STATUS, default="confirmed", write_only=True)
+    skip_conflicts = serializers.BooleanField(default=False, write_only=True)
+    notify = serializers.BooleanField(default=True, write_only=True)
+
+    class Meta:
+        model = AppointmentSeries
+        fields = [
+            "id",
+            "user",
+            "starts_at",
+            "frequency",
+            "interval",
+            "count",
+            "until",
+            "notes",
+            "status",
+            "skip_conflicts",
+            "notify",
+            "created_at",
+        ]
+        read_only_fields = ["id", "created_at"]
+
+    def validate_starts_at(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("The series cannot start in the past.")
+        return value
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Interval must be at least 1.")
+        return value
+
+    def validate_count(self, value):
+        if value is not None and value > MAX_OCCURRENCES:
+            raise serializers.ValidationError(f"A series can have at most {MAX_OCCURRENCES} visits.")
+        return value
+
+    def validate(self, attrs):
+        if not attrs.get("count") and not attrs.get("until"):
+            raise serializers.ValidationError("Either `count` or `until` is required.")
+        if exceeds_max_occurrences(
+            attrs["starts_at"], attrs["frequency"], attrs.get("interval", 1), attrs.get("count"), attrs.get("until")
+        ):
+            raise serializers.ValidationError(
+                {"until": f"A series can have at most {MAX_OCCURRENCES} visits. Choose an earlier end date."}
+            )
+        return attrs
 
-        
 
 class AppointmentRequestSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(read_only=True)
@@ -43,21 +136,9 @@ class AppointmentRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "user_name", "user_phone", "created_at", "status", "source"]
 
     def validate(self, attrs):
-        scheduled_at = attrs.get('day_availability')
-        if scheduled_at:
-            end_time = scheduled_at + timedelta(minutes = 30)
-
-            qs = Appointment.objects.filter(
-                scheduled_at__lt=end_time,
-                end_time__gt=scheduled_at
-            )
-
-            # Exclude self in case of update
-            if self.instance:
-                qs = qs.exclude(id=self.instance.id)
-
-            if qs.exists():
-                raise serializers.ValidationError("The appointment time overlaps with an existing appointment. Choose a different time.")
+        day = attrs.get('day_availability')
+        if day and not get_available_slots(day, day):
+            raise serializers.ValidationError("There are no free slots left on this day. Choose a different day.")
         return attrs
     
     def validate_phone_number(self, value):
@@ -139,4 +220,42 @@ class AppointmentRequestSerializer(serializers.ModelSerializer):
         def validate_scheduled_at(self, value):
             if value and value < timezone.now():
                 raise serializers.ValidationError("Scheduled time cannot be in the past.")
-            return value
\ No newline at end of file
+            return value
+
+class AppointmentImportOptionsSerializer(serializers.Serializer):
+    """Options of a bulk import; the rows themselves are checked by bulk.import_appointments"""
+    notify = serializers.ChoiceField(choices=NOTIFY_CHOICES, default=NOTIFY_NONE)
+    dry_run = serializers.BooleanField(default=False)
+
+
+class SessionPaymentSerializer(serializers.Serializer):
+    session = serializers.IntegerField(min_value=1)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.01"))
+
+
+class SessionPaymentsSerializer(serializers.Serializer):
+    payments = SessionPaymentSerializer(many=True, allow_empty=False)
+    method = serializers.ChoiceField(choices=PAYMENT_METHODS, required=False, default="")
+
+    def validate_payments(self, value):
+        if len(value) > MAX_PAYMENTS_PER_REQUEST:
+            raise serializers.ValidationError(f"At most {MAX_PAYMENTS_PER_REQUEST} payments per request.")
+        sessions = [payment["session"] for payment in value]
+        if len(sessions) != len(set(sessions)):
+            raise serializers.ValidationError("Each session can appear only once.")
+        return value
+
+
+class PlanScheduleSerializer(serializers.Serializer):
+    starts_at = serializers.DateTimeField()
+    interval_weeks = serializers.IntegerField(min_value=1, max_value=26, default=4)
+    count = serializers.IntegerField(min_value=1, max_value=MAX_SESSIONS, required=False)
+    deposit = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0"), required=False)
+    shift_conflicts = serializers.BooleanField(default=True)
+    notify = serializers.BooleanField(default=True)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_starts_at(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("The schedule cannot start in the past.")
+        return value
@@ -1,24 +1,20 @@
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from django.utils import timezone
-from .models import TreatmentSession, TreatmentPlan, Appointment
-from .notification_service import send_notification_on_whatsapp
+from .models import TreatmentSession, TreatmentPlan, Appointment, AppointmentRequest
+from .backfill import index_request, unindex_request, offer_freed_slot
+from . import analytics
+from .notification_service import queue_notification
 from .notification_service import (
         AppointmentEvent, TreatmentPlanEvent, TreatmentSessionEvent
     )
 
 @receiver(pre_save, sender=Appointment)
-@receiver(pre_save, sender=TreatmentPlan)
 @receiver(pre_save, sender=TreatmentSession)
-def store_original_values(sender, instance, **kwargs):
-    """Store original field values to detect changes"""
-    if instance.pk:
-        try:
-            instance._original = sender.objects.get(pk=instance.pk)
-        except sender.DoesNotExist:
-            instance._original = None
-    else:
-        instance._original = None
+def reset_reminders_on_reschedule(sender, instance, **kwargs):
+    """A rescheduled visit needs its reminders again"""
+    if instance.has_changed('scheduled_at'):
+        instance.reminder_stage = 0
 
 
 # 
@@ -27,77 +23,68 @@ def store_original_values(sender, instance, **kwargs):
 @receiver(post_save, sender=Appointment)
 def auto_notify_treatment_session(sender, instance, created, **kwargs):
     """Automatically send WhatsApp notification when treatment session is created"""
-    
+    if kwargs.get('raw'):
+        return
+
     should_notify = False
     event = None
 
-    original = getattr(instance, '_original', None)
-    if hasattr(instance, '_original'):
-        delattr(instance, '_original')
-
-        if sender == Appointment:
-            if created:
-                should_notify = True
-                event = AppointmentEvent.CREATED
-            else:
-
-                if original:
-                    if instance.status != original.status:
-                        if instance.status == 'completed':
-                            should_notify = True
-                            event = AppointmentEvent.COMPLETED
-                        elif instance.status == 'canceled':
-                            should_notify = True
-                            event = AppointmentEvent.CANCELLED
-                    elif instance.scheduled_at != original.scheduled_at:
-                        should_notify = True
-                        event = AppointmentEvent.UPDATED
-
-        elif sender == TreatmentPlan:
-            if created:
+    # Changes are diffed against the values tracked since the instance was loaded
+    if sender == Appointment:
+        if created:
+            should_notify = True
+            event = AppointmentEvent.CREATED
+        elif instance.has_changed('status'):
+            if instance.status == 'completed':
                 should_notify = True
-                event = TreatmentPlanEvent.CREATED
-            else:
-                if original:
-                    # Check if is_completed changed to True
-                    if instance.is_completed and not original.is_completed:
-                        should_notify = True
-                        event = TreatmentPlanEvent.COMPLETED
-                    # Check for other meaningful changes
-                    elif not instance.is_completed and (
-                        instance.treatment_type != original.treatment_type or
-                        instance.status != original.status
-                    ):
-                        should_notify = True
-                        event = TreatmentPlanEvent.UPDATED
-        elif sender == TreatmentSession:
-            if created:
+                event = AppointmentEvent.COMPLETED
+            elif instance.status == 'canceled':
                 should_notify = True
+                event = AppointmentEvent.CANCELLED
+        elif instance.has_changed('scheduled_at'):
+            should_notify = True
+            event = AppointmentEvent.UPDATED
+
+    elif sender == TreatmentPlan:
+        if created:
+            should_notify = True
+            event = TreatmentPlanEvent.CREATED
+        # Check if is_completed changed to True
+        elif instance.is_completed and instance.has_changed('is_completed'):
+            should_notify = True
+            event = TreatmentPlanEvent.COMPLETED
+        # Check for other meaningful changes
+        elif not instance.is_completed and instance.has_changed('treatment_type'):
+            should_notify = True
+            event = TreatmentPlanEvent.UPDATED
+
+    elif sender == TreatmentSession:
+        if created:
+            should_notify = True
+            event = TreatmentSessionEvent.CREATED
+        elif instance.has_changed('scheduled_at'):
+            should_notify = True
+            # Sessions created without a time weren't announced; the first time is their news
+            if instance.previous('scheduled_at') is None:
                 event = TreatmentSessionEvent.CREATED
             else:
-                if original:
-                    if instance.scheduled_at != original.scheduled_at:
-                        should_notify = True
-                        event = TreatmentSessionEvent.UPDATED
-
-                    elif instance.status != original.status:
-                        if instance.status == 'completed':
-                            should_notify = True
-                            event = TreatmentSessionEvent.COMPLETED
-                        elif instance.status == 'cancelled':
-                            should_notify = True
-                            event = TreatmentSessionEvent.CANCELLED
-
-        # Send notification only if there was a meaningful change
-        if should_notify and event:
-            send_notification_on_whatsapp(instance, event=event)
-            
-            # Update notification timestamp
-            if hasattr(instance, 'notified_at'):
-                sender.objects.filter(pk=instance.pk).update(
-                    notified_at=timezone.now(),
-                    notification_sent=True
-                )
+                event = TreatmentSessionEvent.UPDATED
+        elif instance.has_changed('status'):
+            if instance.status == 'completed':
+                should_notify = True
+                event = TreatmentSessionEvent.COMPLETED
+            elif instance.status == 'cancelled':
+                should_notify = True
+                event = TreatmentSessionEvent.CANCELLED
+
+    # Send notification only if there was a meaningful change
+    if should_notify and event:
+        # Hand the freed chair time to the oldest waiting request for that day
+        if event == AppointmentEvent.CANCELLED:
+            transaction.on_commit(lambda: offer_freed_slot(instance))
+
+        # Sent by the outbox worker after commit, which also stamps notified_at
+        queue_notification(instance, event)
 
 
     # if created:
@@ -107,3 +94,27 @@ def auto_notify_treatment_session(sender, instance, created, **kwargs):
     #     instance.save(update_fields=['notification_sent', 'notified_at'])
 
 
+@receiver(post_save, sender=AppointmentRequest)
+def update_backfill_index(sender, instance, **kwargs):
+    """Keep the pending-requests-by-day index in sync"""
+    transaction.on_commit(lambda: index_request(instance))
+
+
+@receiver(post_delete, sender=AppointmentRequest)
+def remove_from_backfill_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: unindex_request(instance))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_analytics(sender, instance, **kwargs):
+    """Drop cached analytics for the months the appointment was and is in"""
+    analytics.touch(instance.scheduled_at, instance.previous('scheduled_at'))
+
+
+@receiver(post_save, sender=TreatmentPlan)
+@receiver(post_delete, sender=TreatmentPlan)
+def invalidate_plan_analytics(sender, instance, **kwargs):
+    # Revenue is grouped by treatment type across every month the plan was paid in
+    analytics.touch(instance.created_at, everything=instance.has_changed('treatment_type'))
+
@@ -0,0 +1,16 @@
+import logging
+
+from celery import shared_task
+
+from .reminders import queue_due_reminders
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def send_reminders():
+    """Queue day-before and same-day reminders for appointments and sessions."""
+    queued = queue_due_reminders()
+    if any(queued.values()):
+        logger.info(f"Reminders queued: {queued}")
+    return queued
@@ -1,3 +1,731 @@
-from django.test import TestCase
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.common.redis_client import get_redis
+from .calendar_feed import get_calendar_events, window_etag
+from .bulk import NOTIFY_DIGEST, find_conflicts, import_appointments
+from . import analytics
+from .events import AppointmentEvent, TreatmentPlanEvent, TreatmentSessionEvent
+from .availability import SLOT_DURATION, free_slots, is_free, iter_candidate_slots, merge_intervals
+from .holds import INDEX_KEY
+from .models import Appointment, AppointmentSeries, Payment, TreatmentPlan, TreatmentSession
+from .message_templates import render
+from .notification_service import merge_event
+from .payments import apply_plan_payments, record_payment, record_session_payments
+from .schedule import default_session_count, generate_schedule, split_amount
+from .recurrence import MAX_OCCURRENCES, exceeds_max_occurrences, expand_occurrences
+from apps.common.models import OutboxMessage
+
+User = get_user_model()
+
+
+def at(hour, minute=0, day=date(2026, 10, 19)):
+    """Aware datetime in the clinic's timezone. 2026-10-19 is a Monday."""
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class MergeIntervalsTests(SimpleTestCase):
+    def test_overlapping_and_contained_intervals_merge(self):
+        merged = merge_intervals([
+            (at(9), at(10)),
+            (at(9, 30), at(11)),
+            (at(9, 45), at(10, 15)),
+            (at(12), at(12, 30)),
+        ])
+        self.assertEqual(merged, [(at(9), at(11)), (at(12), at(12, 30))])
+
+    def test_touching_intervals_stay_apart(self):
+        merged = merge_intervals([(at(9), at(9, 30)), (at(9, 30), at(10))])
+        self.assertEqual(merged, [(at(9), at(9, 30)), (at(9, 30), at(10))])
+
+    def test_empty(self):
+        self.assertEqual(merge_intervals([]), [])
+
+
+class IsFreeTests(SimpleTestCase):
+    busy = [(at(10), at(10, 30)), (at(12), at(13))]
+
+    def test_slots_between_and_around_busy_intervals_are_free(self):
+        self.assertTrue(is_free(self.busy, at(9, 30), at(10)))
+        self.assertTrue(is_free(self.busy, at(10, 30), at(11)))
+        self.assertTrue(is_free(self.busy, at(13), at(13, 30)))
+
+    def test_partial_overlaps_are_busy(self):
+        self.assertFalse(is_free(self.busy, at(9, 45), at(10, 15)))
+        self.assertFalse(is_free(self.busy, at(12, 30), at(13)))
+        self.assertFalse(is_free(self.busy, at(11, 45), at(12, 15)))
+
+
+class FreeSlotsTests(SimpleTestCase):
+    def test_busy_slots_are_skipped(self):
+        candidates = [(at(9), at(9, 30)), (at(9, 30), at(10)), (at(10), at(10, 30)), (at(10, 30), at(11))]
+        busy = [(at(9, 15), at(10))]
+        self.assertEqual(free_slots(busy, candidates), [(at(10), at(10, 30)), (at(10, 30), at(11))])
+
+    def test_not_before_drops_past_slots(self):
+        candidates = [(at(9), at(9, 30)), (at(9, 30), at(10))]
+        self.assertEqual(free_slots([], candidates, not_before=at(9, 10)), [(at(9, 30), at(10))])
+
+    def test_matches_is_free_for_every_candidate(self):
+        day = date(2026, 10, 19)
+        candidates = list(iter_candidate_slots(day, day))
+        busy = merge_intervals([(at(9, 10), at(9, 40)), (at(11), at(12, 15)), (at(17, 45), at(18, 30))])
+        expected = [slot for slot in candidates if is_free(busy, *slot)]
+        self.assertEqual(free_slots(busy, candidates), expected)
+
+
+class CandidateSlotsTests(SimpleTestCase):
+    def test_clinic_hours_and_working_days(self):
+        # Saturday 2026-10-24 is a working day, Sunday 2026-10-25 is not
+        slots = list(iter_candidate_slots(date(2026, 10, 24), date(2026, 10, 25)))
+        saturday = date(2026, 10, 24)
+        self.assertEqual(slots[0], (at(9, day=saturday), at(9, 30, day=saturday)))
+        self.assertEqual(slots[-1], (at(17, 30, day=saturday), at(18, day=saturday)))
+        self.assertEqual(len(slots), 18)
+        self.assertTrue(all(end - start == SLOT_DURATION for start, end in slots))
+        self.assertEqual(slots[1][0] - slots[0][0], timedelta(minutes=30))
+
+
+class FindConflictsTests(SimpleTestCase):
+    def row(self, number, start, status="confirmed"):
+        return {"row": number, "scheduled_at": start, "status": status}
+
+    def test_rows_clashing_with_existing_appointments_are_rejected(self):
+        busy = [(at(10), at(10, 30))]
+        rows = [self.row(1, at(9, 30)), self.row(2, at(10, 15)), self.row(3, at(10, 30))]
+        accepted, conflicts = find_conflicts(rows, busy)
+        self.assertEqual([row["row"] for row in accepted], [1, 3])
+        self.assertEqual([conflict["row"] for conflict in conflicts], [2])
+
+    def test_rows_clashing_within_the_batch_name_the_earlier_row(self):
+        rows = [self.row(1, at(9)), self.row(2, at(9, 15)), self.row(3, at(9, 30))]
+        accepted, conflicts = find_conflicts(rows, [])
+        self.assertEqual([row["row"] for row in accepted], [1, 3])
+        self.assertEqual(conflicts, [{"row": 2, "errors": ["Overlaps row 1 in this batch."]}])
+
+    def test_canceled_rows_never_conflict(self):
+        busy = [(at(9), at(9, 30))]
+        rows = [self.row(1, at(9), status="canceled"), self.row(2, at(9, 30))]
+        accepted, conflicts = find_conflicts(rows, busy)
+        self.assertEqual([row["row"] for row in accepted], [1, 2])
+        self.assertEqual(conflicts, [])
+
+
+def make_user(phone_number="+919800000001", **fields):
+    fields.setdefault("first_name", "Asha")
+    fields.setdefault("last_name", "Patil")
+    return User.objects.create_user(phone_number, **fields)
+
+
+class AppointmentOverlapTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.user = make_user()
+        self.start = at(10, day=date(2031, 3, 3))
+        Appointment.objects.create(user=self.user, scheduled_at=self.start, status="confirmed")
+
+    @mock.patch("apps.appointments.models.database_enforces_overlap", return_value=False)
+    def test_application_check_rejects_overlaps(self, _):
+        with self.assertRaises(ValidationError):
+            Appointment.objects.create(user=self.user, scheduled_at=self.start + timedelta(minutes=15), status="pending")
+
+    @mock.patch("apps.appointments.models.database_enforces_overlap", return_value=False)
+    def test_application_check_ignores_canceled_appointments(self, _):
+        # Same rule as the constraint's WHERE status <> 'canceled'
+        canceled = Appointment.objects.create(user=self.user, scheduled_at=self.start, status="canceled")
+        self.assertIsNotNone(canceled.pk)
+
+    @skipUnless(connection.vendor == "postgresql", "exclusion constraint is PostgreSQL only")
+    def test_constraint_rejects_overlaps(self):
+        with self.assertRaises(ValidationError):
+            Appointment.objects.create(user=self.user, scheduled_at=self.start + timedelta(minutes=15), status="pending")
+
+
+@skipUnless(connection.vendor == "postgresql", "exclusion constraint is PostgreSQL only")
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.users = [make_user(f"+91980000010{index}") for index in range(self.THREADS)]
+
+    def test_only_one_booking_of_a_slot_commits(self):
+        start = at(11, day=date(2031, 3, 4))
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def book(user):
+            try:
+                barrier.wait()
+                Appointment.objects.create(user=user, scheduled_at=start, status="confirmed")
+                results.append("booked")
+            except ValidationError:
+                results.append("rejected")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ["booked"] + ["rejected"] * (self.THREADS - 1))
+        self.assertEqual(Appointment.objects.filter(scheduled_at=start).count(), 1)
+
+
+class ImportAppointmentsTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.user = make_user()
+        self.existing = at(10, day=date(2031, 3, 5))
+        Appointment.objects.create(user=self.user, scheduled_at=self.existing, status="confirmed")
+
+    def rows(self):
+        return [
+            {"phone_number": self.user.phone_number, "scheduled_at": (self.existing + timedelta(hours=1)).isoformat()},
+            {"phone_number": self.user.phone_number, "scheduled_at": (self.existing + timedelta(hours=2)).isoformat()},
+            {"phone_number": self.user.phone_number, "scheduled_at": self.existing.isoformat()},
+            {"phone_number": "+910000000000", "scheduled_at": self.existing.isoformat()},
+            {"phone_number": self.user.phone_number, "scheduled_at": "not a date"},
+        ]
+
+    def test_dry_run_reports_without_inserting(self):
+        result = import_appointments(self.rows(), dry_run=True)
+        self.assertEqual(result["accepted"], 2)
+        self.assertEqual([conflict["row"] for conflict in result["conflicts"]], [3, 4, 5])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_import_inserts_accepted_rows_and_queues_one_digest(self):
+        OutboxMessage.objects.all().delete()
+        result = import_appointments(self.rows(), notify=NOTIFY_DIGEST)
+        self.assertEqual(result["created"], 2)
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(OutboxMessage.objects.filter(to=self.user.phone_number).count(), 1)
+
+    def test_api_parses_dry_run_as_a_boolean(self):
+        client = APIClient()
+        client.force_authenticate(make_user("+919800000200", is_staff=True))
+        url = reverse("appointments:appointment-bulk-import")
+
+        response = client.post(url, {"appointments": self.rows(), "notify": "sometimes"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("notify", response.data)
+
+        response = client.post(url, {"appointments": self.rows(), "dry_run": "true"}, format="json")
+        self.assertEqual((response.status_code, Appointment.objects.count()), (200, 1))
+        # A form-style "false" string used to be truthy and silently dry-run the import
+        response = client.post(url, {"appointments": self.rows(), "dry_run": "false"}, format="json")
+        self.assertEqual((response.status_code, Appointment.objects.count()), (201, 3))
+
+
+class AppointmentListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = make_user("+919800000200", is_staff=True)
+        users = [make_user(f"+9198000003{index:02d}") for index in range(10)]
+        start = at(9, day=date(2031, 4, 1))
+        Appointment.objects.bulk_create([
+            Appointment(
+                user=users[index % len(users)],
+                scheduled_at=start + index * SLOT_DURATION,
+                end_time=start + (index + 1) * SLOT_DURATION,
+                status="confirmed",
+            )
+            for index in range(60)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_one_query_per_page_whatever_its_size(self):
+        for page_size in (5, 50):
+            with self.subTest(page_size=page_size), self.assertNumQueries(1):
+                response = self.client.get(reverse("appointments:appointment-list"), {"page_size": page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+
+
+class ExpandOccurrencesTests(SimpleTestCase):
+    def test_count_and_interval(self):
+        start = at(10)
+        self.assertEqual(
+            expand_occurrences(start, "weekly", 4, count=3),
+            [start, start + timedelta(weeks=4), start + timedelta(weeks=8)],
+        )
+
+    def test_until_is_inclusive(self):
+        start = at(10)
+        occurrences = expand_occurrences(start, "daily", 1, until=date(2026, 10, 21))
+        self.assertEqual(occurrences, [start, at(10, day=date(2026, 10, 20)), at(10, day=date(2026, 10, 21))])
+
+    def test_wall_clock_is_kept_across_dst(self):
+        with timezone.override("Europe/London"):
+            start = timezone.make_aware(datetime(2026, 10, 20, 10, 0))
+            occurrences = expand_occurrences(start, "weekly", 1, count=2)
+            self.assertEqual([timezone.localtime(at).hour for at in occurrences], [10, 10])
+            # British Summer Time ends in between, so the second visit is an hour later in UTC
+            utc = [occurrence.astimezone(dt_timezone.utc) for occurrence in occurrences]
+            self.assertEqual(utc[1] - utc[0], timedelta(weeks=1, hours=1))
+
+    def test_limit(self):
+        self.assertFalse(exceeds_max_occurrences(at(10), "weekly", 1, count=MAX_OCCURRENCES))
+        self.assertTrue(exceeds_max_occurrences(at(10), "weekly", 1, count=MAX_OCCURRENCES + 1))
+        last = timezone.localtime(at(10) + timedelta(weeks=MAX_OCCURRENCES - 1)).date()
+        self.assertFalse(exceeds_max_occurrences(at(10), "weekly", 1, until=last + timedelta(days=6)))
+        self.assertTrue(exceeds_max_occurrences(at(10), "weekly", 1, until=last + timedelta(days=7)))
+
+
+class SeriesApiTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.patient = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user("+919800000200", is_staff=True))
+        self.url = reverse("appointments:appointment-create-series")
+
+    def post(self, **fields):
+        data = {
+            "user": self.patient.pk,
+            "starts_at": at(10, day=date(2031, 5, 5)).isoformat(),
+            "frequency": "weekly",
+            "interval": 1,
+            "notify": False,
+            **fields,
+        }
+        return self.client.post(self.url, data, format="json")
+
+    def test_count_over_the_limit_is_rejected_not_truncated(self):
+        response = self.post(count=MAX_OCCURRENCES + 8)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("count", response.data)
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_until_over_the_limit_is_rejected(self):
+        response = self.post(until="2033-05-05")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("until", response.data)
+
+    def test_series_within_the_limit_is_booked(self):
+        response = self.post(count=6)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.filter(user=self.patient).count(), 6)
+
+
+class MergeEventTests(SimpleTestCase):
+    def test_update_of_an_unannounced_object_is_its_creation(self):
+        self.assertEqual(merge_event([AppointmentEvent.CREATED], AppointmentEvent.UPDATED), AppointmentEvent.CREATED)
+        self.assertEqual(
+            merge_event([TreatmentSessionEvent.CREATED, TreatmentSessionEvent.UPDATED], TreatmentSessionEvent.UPDATED),
+            TreatmentSessionEvent.CREATED,
+        )
+
+    def test_other_events_replace_the_pending_ones(self):
+        self.assertEqual(merge_event([AppointmentEvent.UPDATED], AppointmentEvent.UPDATED), AppointmentEvent.UPDATED)
+        self.assertEqual(merge_event([AppointmentEvent.CREATED], AppointmentEvent.CANCELLED), AppointmentEvent.CANCELLED)
+
+
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.user = make_user()
+
+    def test_reschedules_before_the_debounce_send_one_creation_message(self):
+        appointment = Appointment.objects.create(user=self.user, scheduled_at=at(10, day=date(2031, 3, 3)), status="confirmed")
+        for hour in (11, 12):
+            appointment.scheduled_at = at(hour, day=date(2031, 3, 3))
+            appointment.save()
+
+        messages = OutboxMessage.objects.filter(object_id=appointment.pk).order_by("id")
+        self.assertEqual([m.status for m in messages], ["superseded", "superseded", "pending"])
+        self.assertEqual(messages.last().event, AppointmentEvent.CREATED)
+        self.assertGreater(messages.last().available_at, timezone.now())
+
+    def test_pending_message_survives_a_change_with_nothing_to_send(self):
+        plan = make_plan(self.user)
+        session = TreatmentSession.objects.create(
+            treatment_plan=plan, description="Fitting", amount_for_session=0, scheduled_at=at(10, day=date(2031, 3, 3))
+        )
+        # Unscheduling renders no message, so it must not retire the pending one
+        session.scheduled_at = None
+        session.save()
+        message = OutboxMessage.objects.get(object_type="appointments.treatmentsession", object_id=session.pk)
+        self.assertEqual((message.status, message.event), ("pending", TreatmentSessionEvent.CREATED))
+
+    def test_claimed_messages_are_not_superseded(self):
+        appointment = Appointment.objects.create(user=self.user, scheduled_at=at(10, day=date(2031, 3, 3)), status="confirmed")
+        OutboxMessage.objects.filter(object_id=appointment.pk).update(status="sending")
+        appointment.scheduled_at = at(11, day=date(2031, 3, 3))
+        appointment.save()
+
+        pending = OutboxMessage.objects.get(object_id=appointment.pk, status="pending")
+        self.assertEqual(pending.event, AppointmentEvent.UPDATED)
+
+
+def make_plan(user, total_amount=Decimal("1000.00"), **fields):
+    fields.setdefault("treatment_type", "braces")
+    fields.setdefault("estimated_duration_months", 6)
+    return TreatmentPlan.objects.create(user=user, total_amount=total_amount, **fields)
+
+
+class TreatmentPlanBalanceTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+
+    def test_new_plan_owes_its_total(self):
+        plan = make_plan(self.user)
+        plan.refresh_from_db()
+        self.assertEqual((plan.amount_paid, plan.balance), (Decimal("0"), Decimal("1000.00")))
+
+    def test_admin_add_page_creates_a_plan(self):
+        admin = User.objects.create_superuser("+919800000099", password="secret")
+        self.client.force_login(admin)
+        response = self.client.post(reverse("admin:appointments_treatmentplan_add"), {
+            "user": self.user.pk,
+            "treatment_type": "braces",
+            "total_amount": "2500.00",
+            "estimated_duration_months": 3,
+            "_save": "Save",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TreatmentPlan.objects.get().balance, Decimal("2500.00"))
+
+    def test_changing_the_total_keeps_payments(self):
+        plan = make_plan(self.user)
+        record_payment(plan.pk, Decimal("300.00"))
+        plan.total_amount = Decimal("1200.00")
+        plan.save()  # stale amount_paid of 0 in memory
+        plan.refresh_from_db()
+        self.assertEqual((plan.amount_paid, plan.balance), (Decimal("300.00"), Decimal("900.00")))
+
+
+class PaymentLedgerTests(TestCase):
+    def setUp(self):
+        self.plan = make_plan(make_user())
+        self.session = TreatmentSession.objects.create(
+            treatment_plan=self.plan, description="Fitting", amount_for_session=Decimal("400.00")
+        )
+
+    def assertTotals(self, amount_paid, amount_received):
+        self.plan.refresh_from_db()
+        self.session.refresh_from_db()
+        self.assertEqual(self.plan.amount_paid, amount_paid)
+        self.assertEqual(self.plan.balance, self.plan.total_amount - amount_paid)
+        self.assertEqual(self.session.amount_received, amount_received)
+        self.assertEqual(sum(Payment.objects.values_list("amount", flat=True)), amount_paid)
+
+    def test_session_save_records_the_difference(self):
+        self.session.amount_received = Decimal("150.00")
+        self.session.save()
+        self.session.amount_received = Decimal("400.00")
+        self.session.save()
+        self.assertTotals(Decimal("400.00"), Decimal("400.00"))
+        self.assertEqual(sorted(Payment.objects.values_list("amount", flat=True)), [Decimal("150.00"), Decimal("250.00")])
+
+    def test_payment_for_a_session_moves_the_session_once(self):
+        record_payment(self.plan.pk, Decimal("100.00"), session=self.session)
+        self.assertTotals(Decimal("100.00"), Decimal("100.00"))
+
+    def test_admin_payment_with_a_session(self):
+        admin = User.objects.create_superuser("+919800000099", password="secret")
+        self.client.force_login(admin)
+        response = self.client.post(reverse("admin:appointments_payment_add"), {
+            "treatment_plan": self.plan.pk,
+            "session": self.session.pk,
+            "amount": "250.00",
+            "method": "upi",
+            "received_at_0": "2026-10-18",
+            "received_at_1": "10:00:00",
+            "_save": "Save",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals(Decimal("250.00"), Decimal("250.00"))
+
+    def test_deleting_a_paid_plan_or_patient_removes_its_ledger(self):
+        record_payment(self.plan.pk, Decimal("100.00"), session=self.session)
+        other_plan = make_plan(self.plan.user)
+        record_payment(other_plan.pk, Decimal("50.00"))
+
+        self.plan.delete()
+        self.assertEqual(list(Payment.objects.values_list("treatment_plan_id", flat=True)), [other_plan.pk])
+        self.plan.user.delete()
+        self.assertFalse(Payment.objects.exists())
+
+    def test_session_must_belong_to_the_plan(self):
+        other_plan = make_plan(self.plan.user)
+        with self.assertRaises(ValidationError):
+            Payment(treatment_plan=other_plan, session=self.session, amount=Decimal("1.00")).full_clean()
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        record_payment(self.plan.pk, Decimal("100.00"), session=self.session)
+        TreatmentPlan.objects.filter(pk=self.plan.pk).update(amount_paid=Decimal("0"))
+        TreatmentSession.objects.filter(pk=self.session.pk).update(amount_received=Decimal("200.00"))
+
+        out = StringIO()
+        call_command("reconcile_payments", stdout=out)
+        self.assertIn(f"plan {self.plan.pk}:", out.getvalue())
+        self.assertIn(f"session {self.session.pk}: amount_received 200.00, ledger 100", out.getvalue())
+
+        call_command("reconcile_payments", "--fix", stdout=StringIO())
+        self.assertTotals(Decimal("100.00"), Decimal("100.00"))
+
+
+class SessionPaymentsTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        self.plans = [make_plan(user), make_plan(user)]
+        self.sessions = [
+            TreatmentSession.objects.create(treatment_plan=plan, description="Visit", amount_for_session=Decimal("200.00"))
+            for plan in (self.plans[0], self.plans[0], self.plans[1])
+        ]
+
+    def test_apply_plan_payments_is_one_update(self):
+        with self.assertNumQueries(1):
+            apply_plan_payments({self.plans[0].pk: Decimal("100.00"), self.plans[1].pk: Decimal("-20.00")})
+        self.assertEqual(apply_plan_payments({self.plans[0].pk: Decimal("0")}), 0)
+        balances = dict(TreatmentPlan.objects.values_list("pk", "balance"))
+        self.assertEqual(balances, {self.plans[0].pk: Decimal("900.00"), self.plans[1].pk: Decimal("1020.00")})
+
+    def test_bulk_payments_move_sessions_plans_and_ledger(self):
+        result = record_session_payments(
+            {session.pk: Decimal("50.00") for session in self.sessions}, method="upi"
+        )
+        self.assertEqual(result, {"sessions": 3, "plans": 2, "total": Decimal("150.00")})
+        self.assertEqual(
+            dict(TreatmentPlan.objects.values_list("pk", "amount_paid")),
+            {self.plans[0].pk: Decimal("100.00"), self.plans[1].pk: Decimal("50.00")},
+        )
+        self.assertEqual(set(TreatmentSession.objects.values_list("amount_received", flat=True)), {Decimal("50.00")})
+        self.assertEqual(Payment.objects.filter(method="upi").count(), 3)
+
+    def test_unknown_session_writes_nothing(self):
+        result = record_session_payments({self.sessions[0].pk: Decimal("50.00"), 999999: Decimal("1.00")})
+        self.assertEqual(result, {"error": "Unknown treatment sessions: 999999"})
+        self.assertFalse(Payment.objects.exists())
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(make_user("+919800000099", is_staff=True))
+        url = reverse("appointments:session-payments")
+        payments = [{"session": self.sessions[0].pk, "amount": "75.00"}]
+
+        response = client.post(url, {"payments": payments + payments}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = client.post(url, {"payments": payments, "method": "card"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.sessions[0].refresh_from_db()
+        self.assertEqual(self.sessions[0].amount_received, Decimal("75.00"))
+
+
+class MonthHelpersTests(SimpleTestCase):
+    def test_add_months_crosses_years(self):
+        self.assertEqual(analytics.add_months("2026-11", 2), "2027-01")
+        self.assertEqual(analytics.add_months("2026-01", -1), "2025-12")
+
+    def test_month_range_is_inclusive(self):
+        self.assertEqual(analytics.month_range("2026-11", "2027-02"), ["2026-11", "2026-12", "2027-01", "2027-02"])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MonthlyStatsCacheTests(TestCase):
+    def setUp(self):
+        self.plan = make_plan(make_user())
+
+    def pay(self, amount, day):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_payment(self.plan.pk, amount, method="upi", received_at=at(10, day=day))
+
+    def revenue(self, stats):
+        return [month["revenue_by_treatment"].get("braces") for month in stats]
+
+    def test_cached_months_are_served_until_touched(self):
+        self.pay(Decimal("100.00"), date(2026, 3, 5))
+        self.assertEqual(self.revenue(analytics.get_monthly_stats("2026-03", "2026-04")), [Decimal("100.00"), None])
+
+        with self.assertNumQueries(0):
+            analytics.get_monthly_stats("2026-03", "2026-04")
+
+        # Only April is recomputed: one query per aggregate
+        self.pay(Decimal("50.00"), date(2026, 4, 9))
+        with self.assertNumQueries(3):
+            stats = analytics.get_monthly_stats("2026-03", "2026-04")
+        self.assertEqual(self.revenue(stats), [Decimal("100.00"), Decimal("50.00")])
+
+    def test_treatment_type_change_invalidates_every_month(self):
+        self.pay(Decimal("100.00"), date(2026, 3, 5))
+        analytics.get_monthly_stats("2026-03", "2026-03")
+
+        plan = TreatmentPlan.objects.get(pk=self.plan.pk)
+        plan.treatment_type = "invisalign"
+        with self.captureOnCommitCallbacks(execute=True):
+            plan.save()
+        stats = analytics.get_monthly_stats("2026-03", "2026-03")
+        self.assertEqual(stats[0]["revenue_by_treatment"], {"invisalign": Decimal("100.00")})
+
+
+class SessionNumberingTests(TestCase):
+    def test_numbers_continue_after_existing_sessions(self):
+        plan = make_plan(make_user())
+        TreatmentSession.objects.create(treatment_plan=plan, session_number=5, description="Imported", amount_for_session=0)
+        numbers = [
+            TreatmentSession.objects.create(treatment_plan=plan, description="Visit", amount_for_session=0).session_number
+            for _ in range(2)
+        ]
+        self.assertEqual(numbers, [6, 7])
+        self.assertEqual(TreatmentSession.reserve_numbers(make_plan(plan.user).pk, count=3), 1)
+
+
+class SplitAmountTests(SimpleTestCase):
+    def test_remainder_goes_on_the_last_session(self):
+        amounts = split_amount(Decimal("1000.00"), 3)
+        self.assertEqual(amounts, [Decimal("333.33"), Decimal("333.33"), Decimal("333.34")])
+        self.assertEqual(sum(amounts), Decimal("1000.00"))
+
+    def test_deposit_comes_first(self):
+        self.assertEqual(
+            split_amount(Decimal("1000.00"), 3, deposit=Decimal("400.00")),
+            [Decimal("400.00"), Decimal("300.00"), Decimal("300.00")],
+        )
+
+    def test_deposit_is_capped_at_the_total(self):
+        self.assertEqual(split_amount(Decimal("100.00"), 2, deposit=Decimal("500.00")), [Decimal("100.00"), Decimal("0.00")])
+        self.assertEqual(split_amount(Decimal("100.00"), 1, deposit=Decimal("40.00")), [Decimal("100.00")])
+
+    def test_nothing_left_to_split(self):
+        self.assertEqual(split_amount(Decimal("0"), 2), [Decimal("0"), Decimal("0")])
+        self.assertEqual(split_amount(Decimal("100.00"), 0), [])
+
+    def test_default_session_count_follows_the_duration(self):
+        plan = TreatmentPlan(estimated_duration_months=6)
+        self.assertEqual(default_session_count(plan, 4), 6)
+        self.assertEqual(default_session_count(TreatmentPlan(estimated_duration_months=1), 8), 1)
+
+
+class GenerateScheduleTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.plan = make_plan(make_user(), total_amount=Decimal("900.00"))
+        self.start = at(10, day=date(2031, 3, 3))
+
+    def test_creates_numbered_sessions_and_one_summary(self):
+        result = generate_schedule(self.plan, self.start, interval_weeks=2, count=3)
+
+        sessions = list(self.plan.sessions.all())
+        self.assertEqual(result["created"], 3)
+        self.assertEqual([s.session_number for s in sessions], [1, 2, 3])
+        self.assertEqual([s.scheduled_at for s in sessions], [self.start + timedelta(weeks=weeks) for weeks in (0, 2, 4)])
+        self.assertEqual(sum(s.amount_for_session for s in sessions), Decimal("900.00"))
+        self.assertEqual(OutboxMessage.objects.filter(event=TreatmentPlanEvent.SCHEDULED).count(), 1)
+
+    def test_clashing_session_moves_to_the_next_free_slot(self):
+        Appointment.objects.create(user=self.plan.user, scheduled_at=self.start + timedelta(weeks=1), status="confirmed")
+        result = generate_schedule(self.plan, self.start, interval_weeks=1, count=2, notify=False)
+        self.assertEqual(result["shifted"], [{
+            "from": (self.start + timedelta(weeks=1)).isoformat(),
+            "to": (self.start + timedelta(weeks=1) + SLOT_DURATION).isoformat(),
+        }])
+
+    def test_conflicts_and_dry_runs_create_nothing(self):
+        Appointment.objects.create(user=self.plan.user, scheduled_at=self.start, status="confirmed")
+        result = generate_schedule(self.plan, self.start, count=2, shift_conflicts=False)
+        self.assertEqual(result["conflicts"], [self.start.isoformat()])
+
+        result = generate_schedule(self.plan, self.start + timedelta(days=1), count=2, dry_run=True)
+        self.assertEqual((result["created"], len(result["sessions"])), (0, 2))
+        self.assertFalse(self.plan.sessions.exists())
+
+
+class UnscheduledSessionNotificationTests(TestCase):
+    def setUp(self):
+        self.plan = make_plan(make_user())
+
+    def test_no_message_shows_a_time_the_session_does_not_have(self):
+        session = TreatmentSession(treatment_plan=self.plan, session_number=1, description="Fitting", amount_for_session=0)
+        self.assertIsNone(render(TreatmentSessionEvent.CREATED, self.plan.user, session))
+        session.scheduled_at = at(10, day=date(2031, 3, 3))
+        self.assertIn("03 Mar at 10:00 AM", render(TreatmentSessionEvent.CREATED, self.plan.user, session))
+
+    def test_session_is_announced_once_it_gets_a_time(self):
+        session = TreatmentSession.objects.create(treatment_plan=self.plan, description="Fitting", amount_for_session=0)
+        self.assertFalse(OutboxMessage.objects.filter(object_type="appointments.treatmentsession").exists())
+
+        session.scheduled_at = at(10, day=date(2031, 3, 3))
+        session.save()
+        message = OutboxMessage.objects.get(object_type="appointments.treatmentsession", object_id=session.pk)
+        self.assertEqual(message.event, TreatmentSessionEvent.CREATED)
+
+
+class SeriesAdminTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.patient = make_user()
+        self.client.force_login(User.objects.create_superuser("+919800000099", password="secret"))
+        self.start = at(10, day=date(2031, 5, 5))
+
+    def post(self):
+        return self.client.post(reverse("admin:appointments_appointmentseries_add"), {
+            "user": self.patient.pk,
+            "starts_at": timezone.localtime(self.start).strftime("%Y-%m-%dT%H:%M"),
+            "frequency": "weekly",
+            "interval": 1,
+            "count": 3,
+            "_save": "Save",
+        })
+
+    def test_books_the_series(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(AppointmentSeries.objects.get().appointments.count(), 3)
+
+    def test_visit_taken_after_clean_re_renders_the_form(self):
+        Appointment.objects.create(user=self.patient, scheduled_at=self.start + timedelta(weeks=1), status="confirmed")
+        # As if the clashing visit was booked between clean() and the save
+        with mock.patch("apps.appointments.admin.plan_series", return_value=([], [])):
+            response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "booked in the meantime")
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_overlap_error_while_booking_re_renders_the_form(self):
+        error = {"series": None, "created": 0, "ids": [], "conflicts": [], "error": "Another booking overlapped this series"}
+        with mock.patch("apps.appointments.admin.book_series", return_value=error):
+            response = self.post()
+        self.assertContains(response, "Another booking overlapped this series")
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        get_redis().delete(INDEX_KEY)
+        self.user = make_user()
+        self.start, self.end = at(0, day=date(2031, 3, 3)), at(0, day=date(2031, 3, 10))
+        Appointment.objects.create(user=self.user, scheduled_at=at(10, day=date(2031, 3, 4)), status="confirmed")
+
+    def titles(self):
+        etag = window_etag(self.start, self.end)
+        return etag, [event["title"] for event in get_calendar_events(self.start, self.end, etag)]
+
+    def test_renaming_the_patient_changes_the_feed(self):
+        etag, titles = self.titles()
+        self.assertEqual(titles, ["Asha - confirmed"])
+
+        self.user.first_name = "Ashwini"
+        self.user.save()
+        new_etag, titles = self.titles()
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(titles, ["Ashwini - confirmed"])
@@ -1,5 +1,6 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import AppointmentRequestViewSet, AppointmentViewSet
+from .views import AppointmentRequestViewSet, AppointmentViewSet, SessionPaymentsView, AnalyticsView, PlanScheduleView
 
 app_name = 'appointments'
 
@@ -8,4 +9,8 @@ router = DefaultRouter()
 router.register(r"requests", AppointmentRequestViewSet, basename="appointmentrequest")
 router.register(r"", AppointmentViewSet, basename="appointment")
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path("sessions/payments/", SessionPaymentsView.as_view(), name="session-payments"),
+    path("analytics/", AnalyticsView.as_view(), name="analytics"),
+    path("plans/<int:plan_id>/schedule/", PlanScheduleView.as_view(), name="plan-schedule"),
+] + router.urls
\ No newline at end of file
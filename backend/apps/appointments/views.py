@@ -1,10 +1,32 @@
+from datetime import datetime, timedelta
+import redis
 from rest_framework.response import Response
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status, serializers
+from rest_framework.decorators import action
+from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
-from .models import Appointment, AppointmentRequest
-from .serializers import AppointmentRequestSerializer, AppointmentSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Appointment, AppointmentRequest, AppointmentSeries, TreatmentPlan
+from .serializers import (
+    AppointmentRequestSerializer, AppointmentSerializer, AppointmentSeriesSerializer, SessionPaymentsSerializer,
+    PlanScheduleSerializer, AppointmentImportOptionsSerializer
+)
+from .availability import get_available_slots, SLOT_DURATION
+from .holds import create_hold, release_hold, is_aligned, SlotUnavailable, DEFAULT_HOLD_SECONDS
+from .bulk import import_appointments, MAX_BATCH_SIZE
+from .pagination import AppointmentCursorPagination
+from .recurrence import book_series
+from .payments import record_session_payments
+from .schedule import generate_schedule
+from .analytics import add_months, get_monthly_stats, month_of, MAX_MONTHS
 from rest_framework.permissions import AllowAny
 
+# Upper bound on the range a single availability query may cover
+MAX_AVAILABILITY_DAYS = 62
+
 User = get_user_model()
 
 class isOwnerOrAdmin(permissions.BasePermission):
@@ -41,16 +63,181 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     """
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated, isOwnerOrAdmin]
+    pagination_class = AppointmentCursorPagination
+
+    def get_permissions(self):
+        # The WhatsApp bot asks for free slots on behalf of unauthenticated patients
+        source = self.request.query_params.get("source", "").lower()
+        if self.action == "availability" and source == "whatsapp":
+            return [AllowAny()]
+        return super().get_permissions()
 
     def get_queryset(self):
         user = self.request.user
+        # The serializer reads user fields for every row
+        queryset = Appointment.objects.select_related('user')
         if user.is_staff or user.is_superuser:
-            return Appointment.objects.all()
-        return Appointment.objects.filter(user=user)
+            return queryset
+        return queryset.filter(user=user)
 
         
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            serializer.save(user=self.request.user)
+        except DjangoValidationError as e:
+            # Overlaps are rejected by the database constraint at insert time
+            raise serializers.ValidationError(e.messages)
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+    @action(detail=False, methods=["post"], url_path="bulk", permission_classes=[permissions.IsAdminUser])
+    def bulk_import(self, request):
+        """
+        Import a batch of appointments in one go.
+        Body: {"appointments": [...], "notify": "none" | "each" | "digest", "dry_run": false}
+        """
+        rows = request.data.get("appointments")
+        options = AppointmentImportOptionsSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"error": "`appointments` must be a non-empty list."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"At most {MAX_BATCH_SIZE} appointments can be imported per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = import_appointments(rows, **options.validated_data)
+        if result.get("error"):
+            return Response(result, status=status.HTTP_409_CONFLICT)
+        return Response(result, status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"], url_path="series", permission_classes=[permissions.IsAdminUser])
+    def create_series(self, request):
+        """
+        Book a recurring series, e.g. every 4 weeks for 6 visits.
+        Body: {"user", "starts_at", "frequency", "interval", "count" | "until", "skip_conflicts", "notify"}
+        """
+        serializer = AppointmentSeriesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = {
+            key: serializer.validated_data.pop(key)
+            for key in ("status", "skip_conflicts", "notify")
+        }
+
+        series = AppointmentSeries(**serializer.validated_data)
+        result = book_series(series, **options)
+
+        if result.get("error"):
+            return Response(result, status=status.HTTP_409_CONFLICT)
+        if not result["created"]:
+            return Response(result, status=status.HTTP_409_CONFLICT if result["conflicts"] else status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post", "delete"])
+    def holds(self, request):
+        """
+        POST: hold a slot for a few minutes while the patient completes the booking.
+        Body: {"scheduled_at", "seconds"}. Book it by sending the returned token as `hold_token`.
+        DELETE: release a hold. Body: {"scheduled_at", "token"}
+        """
+        value = request.data.get("scheduled_at")
+        scheduled_at = parse_datetime(value) if isinstance(value, str) else None
+        if scheduled_at is None or timezone.is_naive(scheduled_at):
+            return Response(
+                {"error": "`scheduled_at` must be an ISO 8601 datetime with a timezone."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            if request.method == "DELETE":
+                token = request.data.get("token")
+                if not token:
+                    return Response({"error": "`token` is required."}, status=status.HTTP_400_BAD_REQUEST)
+                release_hold(scheduled_at, token, request.user.pk)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+
+            if scheduled_at <= timezone.now():
+                return Response({"error": "Cannot hold a slot in the past."}, status=status.HTTP_400_BAD_REQUEST)
+            if not is_aligned(scheduled_at):
+                return Response(
+                    {"error": f"Slots start every {int(SLOT_DURATION.total_seconds() // 60)} minutes."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                seconds = int(request.data.get("seconds", DEFAULT_HOLD_SECONDS))
+            except (TypeError, ValueError):
+                return Response({"error": "`seconds` must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            token, expires_at = create_hold(scheduled_at, request.user.pk, seconds)
+        except SlotUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except redis.RedisError:
+            return Response(
+                {"error": "Slot holds are temporarily unavailable. Book the slot directly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        return Response(
+            {
+                "token": token,
+                "scheduled_at": scheduled_at.isoformat(),
+                "end_time": (scheduled_at + SLOT_DURATION).isoformat(),
+                "expires_at": expires_at.isoformat(),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=["get"])
+    def availability(self, request):
+        """
+        Free 30 minute slots between `from` and `to` (YYYY-MM-DD, inclusive).
+        Defaults to the next 7 days.
+        """
+        start_param = request.query_params.get("from")
+        end_param = request.query_params.get("to")
+        try:
+            start_date = parse_date(start_param) if start_param else timezone.localdate()
+            end_date = parse_date(end_param) if end_param else None
+        except ValueError:
+            start_date = end_date = None
+        else:
+            if start_date and not end_param:
+                end_date = start_date + timedelta(days=6)
+
+        if not start_date or not end_date:
+            return Response(
+                {"error": "`from` and `to` must be dates in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if end_date < start_date:
+            return Response(
+                {"error": "`to` must be on or after `from`."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if (end_date - start_date).days >= MAX_AVAILABILITY_DAYS:
+            return Response(
+                {"error": f"Availability can be queried for at most {MAX_AVAILABILITY_DAYS} days at a time."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        slots = get_available_slots(start_date, end_date)
+        return Response({
+            "from": start_date.isoformat(),
+            "to": end_date.isoformat(),
+            "slot_minutes": int(SLOT_DURATION.total_seconds() // 60),
+            "slots": [
+                {"start": slot_start.isoformat(), "end": slot_end.isoformat()}
+                for slot_start, slot_end in slots
+            ],
+        })
 
     
 class AppointmentRequestViewSet(viewsets.ModelViewSet):
@@ -89,3 +276,76 @@ class AppointmentRequestViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=201, headers=headers)
         return super().create(request, *args, **kwargs)
 
+
+class SessionPaymentsView(APIView):
+    """
+    Record payments for many treatment sessions at once.
+    Body: {"payments": [{"session": 12, "amount": "500.00"}, ...], "method": "upi"}
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = SessionPaymentsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payments = {
+            payment["session"]: payment["amount"]
+            for payment in serializer.validated_data["payments"]
+        }
+
+        result = record_session_payments(payments, method=serializer.validated_data["method"])
+        if result.get("error"):
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class AnalyticsView(APIView):
+    """
+    Monthly revenue by treatment type, collections by payment method and
+    appointment outcomes. Query: ?start=YYYY-MM&end=YYYY-MM (default: the last 12 months)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            # Normalised to zero-padded YYYY-MM so months compare as strings
+            first, last = (
+                datetime.strptime(value, "%Y-%m").strftime("%Y-%m") if value else None
+                for value in (request.query_params.get("start"), request.query_params.get("end"))
+            )
+        except ValueError:
+            return Response(
+                {"error": "`start` and `end` must be months in YYYY-MM format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        last = last or month_of(timezone.now())
+        first = first or add_months(last, -11)
+
+        if first > last:
+            return Response({"error": "`start` must not be after `end`."}, status=status.HTTP_400_BAD_REQUEST)
+        if add_months(first, MAX_MONTHS) <= last:
+            return Response(
+                {"error": f"At most {MAX_MONTHS} months can be requested at once."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({"start": first, "end": last, "months": get_monthly_stats(first, last)})
+
+
+class PlanScheduleView(APIView):
+    """
+    Generate the sessions of a treatment plan on a cadence.
+    Body: {"starts_at", "interval_weeks", "count", "deposit", "shift_conflicts", "notify", "dry_run"}
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, plan_id):
+        plan = get_object_or_404(TreatmentPlan.objects.select_related("user"), pk=plan_id)
+        serializer = PlanScheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = generate_schedule(plan, **serializer.validated_data)
+        if result["conflicts"]:
+            return Response(result, status=status.HTTP_409_CONFLICT)
+        if not result["sessions"]:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK)
@@ -1,3 +1,47 @@
 from django.contrib import admin
+from django.utils import timezone
+from unfold.admin import ModelAdmin
+from .models import Counter, MessageDelivery, OutboxMessage
+from .outbox import schedule_drain
 
-# Register your models here.
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(ModelAdmin):
+    list_display = ['id', 'to', 'event', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'event']
+    search_fields = ['to', 'message_sid', 'coalesce_key']
+    readonly_fields = [field.name for field in OutboxMessage._meta.fields]
+    actions = ['retry_messages']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected messages")
+    def retry_messages(self, request, queryset):
+        updated = queryset.exclude(status="sent").update(
+            status="pending", attempts=0, available_at=timezone.now()
+        )
+        schedule_drain()
+        self.message_user(request, f"{updated} messages queued for retry.")
+
+
+@admin.register(MessageDelivery)
+class MessageDeliveryAdmin(ModelAdmin):
+    list_display = ['message_sid', 'to', 'status', 'error_code', 'status_at', 'outbox_message']
+    list_filter = ['status', 'error_code']
+    search_fields = ['message_sid', 'to']
+    readonly_fields = [field.name for field in MessageDelivery._meta.fields]
+    list_select_related = ['outbox_message']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Counter)
+class CounterAdmin(ModelAdmin):
+    list_display = ['name', 'value']
+    search_fields = ['name']
+    readonly_fields = ['name', 'value']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,66 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from .models import Counter
+
+# Backends that can advance a counter and read it back in one statement
+RETURNING_VENDORS = {"postgresql", "sqlite"}
+
+
+def _table(connection):
+    return connection.ops.quote_name(Counter._meta.db_table)
+
+
+def _advance_returning(connection, name, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {_table(connection)} SET value = value + %s WHERE name = %s RETURNING value",
+            [count, name],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _create_returning(connection, name, value, count):
+    # Two processes may both find the counter missing; the loser adds to the winner's row
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {_table(connection)} (name, value) VALUES (%s, %s) "
+            f"ON CONFLICT (name) DO UPDATE SET value = {_table(connection)}.value + %s "
+            f"RETURNING value",
+            [name, value, count],
+        )
+        return cursor.fetchone()[0]
+
+
+def _reserve_locked(name, count, seed):
+    with transaction.atomic(using=router.db_for_write(Counter)):
+        counter, created = Counter.objects.select_for_update().get_or_create(
+            name=name, defaults={"value": (seed() if seed else 0) + count}
+        )
+        if created:
+            return counter.value
+        Counter.objects.filter(pk=counter.pk).update(value=F("value") + count)
+        return counter.value + count
+
+
+def reserve(name, count=1, seed=None):
+    """
+    Hand out `count` consecutive numbers from the sequence `name` and return
+    the first. An existing counter is advanced with a single
+    UPDATE ... RETURNING, so concurrent callers never get the same number.
+
+    `seed` returns the highest number already in use and is only called the
+    first time a sequence is used, so rows numbered before the counter
+    existed are not handed out again.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    connection = connections[router.db_for_write(Counter)]
+    if connection.vendor not in RETURNING_VENDORS:
+        return _reserve_locked(name, count, seed) - count + 1
+
+    last = _advance_returning(connection, name, count)
+    if last is None:
+        last = _create_returning(connection, name, (seed() if seed else 0) + count, count)
+    return last - count + 1
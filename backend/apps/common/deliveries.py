@@ -0,0 +1,115 @@
+import json
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from .models import MessageDelivery, OutboxMessage
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# whatsapp_client pushes every Twilio status callback onto this list as JSON
+QUEUE_KEY = getattr(settings, "DELIVERY_STATUS_QUEUE", "twilio:status-callbacks")
+LOCK_KEY = f"{QUEUE_KEY}:flush-lock"
+BATCH_SIZE = 1000
+MAX_BATCHES_PER_RUN = 20
+
+# Callbacks arrive out of order; a message's status never moves down this ladder
+STATUS_RANK = {
+    "accepted": 0,
+    "queued": 1,
+    "sending": 2,
+    "sent": 3,
+    "delivered": 4,
+    "undelivered": 4,
+    "failed": 4,
+    "read": 5,
+}
+
+
+def _rank(status):
+    return STATUS_RANK.get(status, -1)
+
+
+def parse_callback(raw):
+    try:
+        item = json.loads(raw)
+    except ValueError:
+        logger.warning(f"Dropping malformed status callback: {raw!r}")
+        return None
+    if not item.get("sid") or item.get("status") not in STATUS_RANK:
+        return None
+    return item
+
+
+def latest_per_message(items):
+    """Collapse a batch to the furthest status per MessageSid."""
+    latest = {}
+    for item in items:
+        current = latest.get(item["sid"])
+        if current is None or (_rank(item["status"]), item.get("at", 0)) > (_rank(current["status"]), current.get("at", 0)):
+            latest[item["sid"]] = item
+    return latest
+
+
+def save_statuses(latest):
+    """Upsert one batch in three queries: existing statuses, outbox links, the upsert itself."""
+    if not latest:
+        return 0
+
+    sids = list(latest)
+    existing = dict(
+        MessageDelivery.objects.filter(message_sid__in=sids).values_list("message_sid", "status")
+    )
+    outbox_ids = dict(
+        OutboxMessage.objects.filter(message_sid__in=sids).values_list("message_sid", "id")
+    )
+
+    rows = []
+    for sid, item in latest.items():
+        if sid in existing and _rank(existing[sid]) > _rank(item["status"]):
+            continue
+        rows.append(MessageDelivery(
+            message_sid=sid,
+            outbox_message_id=outbox_ids.get(sid),
+            to=(item.get("to") or "").replace("whatsapp:", ""),
+            status=item["status"],
+            error_code=str(item.get("error_code") or ""),
+            error_message=item.get("error_message") or "",
+            status_at=datetime.fromtimestamp(item.get("at", 0), tz=dt_timezone.utc),
+        ))
+
+    MessageDelivery.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["message_sid"],
+        update_fields=["status", "error_code", "error_message", "status_at", "outbox_message", "updated_at"],
+    )
+    return len(rows)
+
+
+def flush_statuses(batch_size=BATCH_SIZE):
+    """
+    Move buffered callbacks from Redis into MessageDelivery. Items are trimmed
+    from the list only after they are saved, and a lock keeps a single flusher
+    running, so a crash replays a batch instead of losing it (the upsert is
+    idempotent).
+    """
+    r = get_redis()
+    lock = r.lock(LOCK_KEY, timeout=120, blocking=False)
+    if not lock.acquire():
+        return 0
+
+    saved = 0
+    try:
+        for _ in range(MAX_BATCHES_PER_RUN):
+            raw_items = r.lrange(QUEUE_KEY, 0, batch_size - 1)
+            if not raw_items:
+                break
+            items = [item for item in map(parse_callback, raw_items) if item]
+            saved += save_statuses(latest_per_message(items))
+            r.ltrim(QUEUE_KEY, len(raw_items), -1)
+    finally:
+        lock.release()
+    return saved
@@ -0,0 +1,213 @@
+import json
+import logging
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+from twilio.request_validator import RequestValidator
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/(?P<account>\w+)/Messages(?:/(?P<sid>\w+))?\.json$")
+CONTENT_PATH = re.compile(r"^/v1/Content(?:/(?P<sid>\w+))?$")
+# Sent messages kept for GET lookups
+MAX_STORED = 10000
+
+
+def twilio_error(status, code, message):
+    return status, {
+        "code": code,
+        "message": message,
+        "more_info": f"https://www.twilio.com/docs/errors/{code}",
+        "status": status,
+    }
+
+
+class FakeTwilio:
+    """
+    In-memory stand-in for the Twilio Messages and Content APIs. Latency and
+    failure rates are configurable so senders can be load tested offline.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, callbacks=False, auth_token=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.callbacks = callbacks
+        # Callbacks are signed with it like Twilio's, so receivers can verify them
+        self.validator = RequestValidator(auth_token) if auth_token else None
+        self.messages = OrderedDict()
+        self.contents = {}
+        self.stats = {"requests": 0, "created": 0, "errors": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _delay(self):
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+    def _injected_failure(self):
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self._count("throttled")
+            return twilio_error(429, 20429, "Too Many Requests")
+        if roll < self.throttle_rate + self.error_rate:
+            self._count("errors")
+            return twilio_error(500, 20500, "Internal Server Error")
+        return None
+
+    def create_message(self, account_sid, form):
+        to, from_ = form.get("To"), form.get("From")
+        body, content_sid = form.get("Body"), form.get("ContentSid")
+        if not to or not from_:
+            return twilio_error(400, 21604, "A 'To' and a 'From' phone number are required.")
+        if not body and not content_sid:
+            return twilio_error(400, 21602, "Message body is required.")
+
+        sid = f"SM{uuid.uuid4().hex}"
+        message = {
+            "sid": sid,
+            "account_sid": account_sid,
+            "to": to,
+            "from": from_,
+            "body": body or "",
+            "status": "queued",
+            "direction": "outbound-api",
+            "num_segments": "1",
+            "num_media": "0",
+            "api_version": "2010-04-01",
+            "date_created": formatdate(usegmt=True),
+            "date_updated": formatdate(usegmt=True),
+            "date_sent": None,
+            "price": None,
+            "price_unit": "USD",
+            "error_code": None,
+            "error_message": None,
+            "messaging_service_sid": None,
+            "uri": f"/2010-04-01/Accounts/{account_sid}/Messages/{sid}.json",
+            "subresource_uris": {},
+        }
+        with self._lock:
+            self.messages[sid] = message
+            if len(self.messages) > MAX_STORED:
+                self.messages.popitem(last=False)
+            if content_sid:
+                self.contents.setdefault(content_sid, self._content(content_sid))
+        self._count("created")
+
+        callback = form.get("StatusCallback")
+        if self.callbacks and callback:
+            threading.Thread(target=self._report_statuses, args=(callback, message), daemon=True).start()
+        return 201, message
+
+    def _report_statuses(self, url, message):
+        for status in ("sent", "delivered"):
+            time.sleep(0.05)
+            params = {
+                "MessageSid": message["sid"],
+                "MessageStatus": status,
+                "To": message["to"],
+                "From": message["from"],
+                "AccountSid": message["account_sid"],
+            }
+            request = Request(url, data=urlencode(params).encode())
+            if self.validator:
+                request.add_header("X-Twilio-Signature", self.validator.compute_signature(url, params))
+            try:
+                urlopen(request, timeout=5).close()
+            except OSError as e:
+                logger.warning(f"Status callback to {url} failed: {str(e)}")
+                return
+
+    def _content(self, sid):
+        return {
+            "sid": sid,
+            "account_sid": None,
+            "friendly_name": f"fake_{sid.lower()}",
+            "language": "en",
+            "variables": {},
+            "types": {"twilio/text": {"body": f"Fake template {sid}"}},
+            "url": f"https://content.twilio.com/v1/Content/{sid}",
+        }
+
+    def handle(self, method, path, form):
+        """Route one request and return (status, payload)."""
+        self._count("requests")
+        self._delay()
+
+        match = MESSAGES_PATH.match(path)
+        if match:
+            if method == "POST" and not match["sid"]:
+                return self._injected_failure() or self.create_message(match["account"], form)
+            if method == "GET" and match["sid"]:
+                message = self.messages.get(match["sid"])
+                if message:
+                    return 200, message
+                return twilio_error(404, 20404, f"The requested resource {path} was not found")
+
+        match = CONTENT_PATH.match(path)
+        if match and method == "GET":
+            if match["sid"]:
+                return 200, self.contents.get(match["sid"]) or self._content(match["sid"])
+            contents = list(self.contents.values())
+            return 200, {"contents": contents, "meta": {"page": 0, "page_size": len(contents)}}
+
+        if path == "/_stats" and method == "GET":
+            return 200, dict(self.stats, stored=len(self.messages))
+
+        return twilio_error(404, 20404, f"The requested resource {path} was not found")
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes. With Nagle on, a keep-alive
+    # client waits out its delayed ACK (~40 ms) on every request
+    disable_nagle_algorithm = True
+    fake = None
+
+    def _dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode() if length else ""
+        form = {key: values[-1] for key, values in parse_qs(raw).items()}
+        status, payload = self.fake.handle(method, urlsplit(self.path).path, form)
+
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(host, port, fake, certfile=None, keyfile=None):
+    """With a certificate the server speaks HTTPS, so senders pay TLS handshakes as with Twilio."""
+    handler = type("BoundFakeTwilioHandler", (FakeTwilioHandler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
@@ -0,0 +1,71 @@
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.common import messaging
+
+IMPORT_SNIPPET = (
+    "import time; began = time.perf_counter(); import twilio.rest; "
+    "print(time.perf_counter() - began)"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what a process pays to import twilio.rest at startup, and per-message "
+        "latency of the pooled client against a fresh client per message."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--imports", type=int, default=5, help="Fresh interpreters to time the import in")
+        parser.add_argument("--to", help="Phone number to send test messages to. Skips the latency run if omitted")
+        parser.add_argument("--messages", type=int, default=20)
+        parser.add_argument("--body", default="Blissful Smiles latency test")
+
+    def handle(self, *args, **options):
+        self.bench_import(options["imports"])
+        if options["to"]:
+            self.bench_latency(options["to"], options["messages"], options["body"])
+
+    def bench_import(self, runs):
+        timings = [
+            float(subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], text=True))
+            for _ in range(runs)
+        ]
+        self.stdout.write(
+            f"import twilio.rest (paid at startup before, on first send now): "
+            f"median {statistics.median(timings) * 1000:.1f} ms over {runs} runs"
+        )
+
+    def bench_latency(self, to, count, body):
+        params = {"from_": settings.TWILIO_WHATSAPP_NUMBER, "to": f"whatsapp:{to}", "body": body}
+        # Both built the same way, so TWILIO_API_BASE_URL applies to both. The
+        # rate limiter is left out, it would time Redis rather than the connection
+        pooled_client = messaging.build_twilio_client()
+
+        def fresh_client_send():
+            # What every send used to cost: no shared session, new TLS handshake
+            messaging.build_twilio_client(keep_alive=False).messages.create(**params)
+
+        def pooled_send():
+            pooled_client.messages.create(**params)
+
+        # Warm up the pool so the first handshake isn't counted against it
+        pooled_send()
+        for label, send in (("fresh client", fresh_client_send), ("pooled client", pooled_send)):
+            timings = []
+            for _ in range(count):
+                began = perf_counter()
+                send()
+                timings.append(perf_counter() - began)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{label}: mean {statistics.mean(timings) * 1000:.1f} ms, "
+                f"p50 {statistics.median(timings) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms "
+                f"over {count} messages"
+            )
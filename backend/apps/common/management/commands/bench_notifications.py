@@ -0,0 +1,136 @@
+import itertools
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.appointments.models import Appointment, TreatmentPlan, TreatmentSession
+from apps.appointments.notification_service import (
+    AppointmentEvent, PrescriptionEvent, TreatmentSessionEvent, send_notification_on_whatsapp
+)
+from apps.common import messaging
+from apps.prescriptions.models import Prescription
+
+KINDS = ("appointment", "session", "prescription")
+EVENTS = {
+    "appointment": [AppointmentEvent.CREATED, AppointmentEvent.UPDATED, AppointmentEvent.CANCELLED],
+    "session": [TreatmentSessionEvent.CREATED, TreatmentSessionEvent.UPDATED, TreatmentSessionEvent.COMPLETED],
+    "prescription": [PrescriptionEvent.CREATED],
+}
+LANGUAGES = [code for code, _ in get_user_model().LANGUAGE_CHOICES]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Push appointment, session and prescription events through "
+        "send_notification_on_whatsapp and report messages/sec and latency percentiles. "
+        "Run against `manage.py fake_twilio` (TWILIO_API_BASE_URL) or MESSAGING_CLIENT=fake."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--kinds", default=",".join(KINDS), help="Comma separated subset of: " + ", ".join(KINDS))
+        parser.add_argument(
+            "--rate-limit",
+            action="store_true",
+            help="Go through the shared Redis token bucket, as production sends do",
+        )
+
+    def handle(self, *args, **options):
+        if messaging.CLIENT_KIND == "twilio" and not messaging.API_BASE_URL:
+            raise CommandError(
+                "This would message real patients' numbers through Twilio. "
+                "Set TWILIO_API_BASE_URL to a fake_twilio server or MESSAGING_CLIENT=fake."
+            )
+        kinds = [kind.strip() for kind in options["kinds"].split(",") if kind.strip()]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+
+        if not options["rate_limit"]:
+            messaging.set_client(messaging.build_client())
+
+        jobs = list(self.build_events(options["events"], kinds))
+        # Warm up the connection pool so the first handshakes aren't counted
+        for instance, event in jobs[:options["concurrency"]]:
+            send_notification_on_whatsapp(instance, event=event)
+
+        began = perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(self.send_timed, jobs))
+        elapsed = perf_counter() - began
+
+        timings = sorted(timing for timing, ok in results if ok)
+        failures = sum(1 for _, ok in results if not ok)
+        self.report(len(jobs), failures, elapsed, timings, options["concurrency"])
+
+    def build_events(self, count, kinds):
+        """Unsaved model instances, so the run measures sending and not the database."""
+        User = get_user_model()
+        start = timezone.now() + timedelta(days=1)
+        treatment_types = [code for code, _ in TreatmentPlan.TREATMENT_TYPES]
+        cycle = itertools.cycle(kinds)
+
+        for i in range(count):
+            user = User(
+                pk=i + 1,
+                phone_number=f"+9199{i:08d}",
+                first_name="Load",
+                last_name=f"Test {i}",
+                preferred_language=LANGUAGES[i % len(LANGUAGES)],
+            )
+            scheduled_at = start + timedelta(minutes=15 * i)
+            kind = next(cycle)
+            if kind == "appointment":
+                instance = Appointment(pk=i + 1, user=user, scheduled_at=scheduled_at)
+            elif kind == "session":
+                plan = TreatmentPlan(
+                    pk=i + 1,
+                    user=user,
+                    treatment_type=treatment_types[i % len(treatment_types)],
+                    total_amount=0,
+                    estimated_duration_months=1,
+                )
+                instance = TreatmentSession(
+                    pk=i + 1,
+                    treatment_plan=plan,
+                    session_number=i % 12 + 1,
+                    amount_for_session=0,
+                    scheduled_at=scheduled_at,
+                )
+            else:
+                instance = Prescription(pk=i + 1, user=user, prescription_number=i + 1)
+            events = EVENTS[kind]
+            yield instance, events[i % len(events)]
+
+    def send_timed(self, job):
+        instance, event = job
+        began = perf_counter()
+        try:
+            result = send_notification_on_whatsapp(instance, event=event)
+        except Exception as e:
+            self.stderr.write(f"{event}: {str(e)}")
+            return perf_counter() - began, False
+        return perf_counter() - began, result["status"] == "sent"
+
+    def report(self, total, failures, elapsed, timings, concurrency):
+        self.stdout.write(
+            f"{total} events with {concurrency} threads in {elapsed:.2f}s: "
+            f"{(total - failures) / elapsed:.1f} msgs/sec, {failures} failed"
+        )
+        if timings:
+            self.stdout.write(
+                f"latency: p50 {statistics.median(timings) * 1000:.1f} ms, "
+                f"p95 {percentile(timings, 0.95) * 1000:.1f} ms, "
+                f"p99 {percentile(timings, 0.99) * 1000:.1f} ms, "
+                f"max {timings[-1] * 1000:.1f} ms"
+            )
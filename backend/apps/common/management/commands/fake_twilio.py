@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.common.fake_twilio import FakeTwilio, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the Twilio Messages and Content APIs. Point "
+        "TWILIO_API_BASE_URL at it to send without reaching Twilio."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=float, default=50, help="Added to every request")
+        parser.add_argument("--jitter-ms", type=float, default=20, help="Random extra latency, up to this much")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of sends that fail with a 500")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of sends rejected with a 429")
+        parser.add_argument(
+            "--callbacks",
+            action="store_true",
+            help=(
+                "POST sent/delivered status callbacks to each message's StatusCallback, "
+                "signed with TWILIO_AUTH_TOKEN"
+            ),
+        )
+        parser.add_argument(
+            "--certfile",
+            help="Serve HTTPS with this certificate; clients must trust it, e.g. via REQUESTS_CA_BUNDLE",
+        )
+        parser.add_argument("--keyfile", help="Private key for --certfile, if it is not in the same file")
+
+    def handle(self, *args, **options):
+        fake = FakeTwilio(
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"],
+            callbacks=options["callbacks"],
+            auth_token=settings.TWILIO_AUTH_TOKEN,
+        )
+        server = make_server(options["host"], options["port"], fake, options["certfile"], options["keyfile"])
+        scheme = "https" if options["certfile"] else "http"
+        self.stdout.write(f"Fake Twilio listening on {scheme}://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stopped. {fake.stats}")
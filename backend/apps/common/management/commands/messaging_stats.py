@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from apps.common.models import OutboxMessage
+from apps.common.ratelimit import get_stats
+
+
+class Command(BaseCommand):
+    help = "Show send-rate limiter metrics and the outbox backlog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sender", default=settings.TWILIO_WHATSAPP_NUMBER)
+
+    def handle(self, *args, **options):
+        stats = get_stats(options["sender"])
+        self.stdout.write(
+            f"{stats['sender']}: {stats['waiting']} waiting (max {stats['max_depth']}), "
+            f"{stats['acquired']} sent, {stats['rejected']} rejected, "
+            f"avg wait {stats['avg_wait_ms']:.1f} ms"
+        )
+
+        backlog = OutboxMessage.objects.values("status").annotate(count=Count("id")).order_by("status")
+        for row in backlog:
+            self.stdout.write(f"outbox {row['status']}: {row['count']}")
@@ -0,0 +1,134 @@
+import itertools
+import logging
+import threading
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .ratelimit import acquire
+
+logger = logging.getLogger(__name__)
+
+# "twilio" sends for real, "fake" records messages in memory (local dev and tests)
+CLIENT_KIND = getattr(settings, "MESSAGING_CLIENT", "twilio")
+# Connections kept alive per process, sized for the outbox sender threads
+POOL_SIZE = getattr(settings, "MESSAGING_POOL_SIZE", 10)
+TIMEOUT = getattr(settings, "MESSAGING_TIMEOUT", 10)
+# Public URL of whatsapp_client's /twilio/status endpoint
+STATUS_CALLBACK_URL = getattr(settings, "TWILIO_STATUS_CALLBACK_URL", None)
+# Send Twilio API calls here instead, e.g. http://localhost:8765 for `manage.py fake_twilio`
+API_BASE_URL = getattr(settings, "TWILIO_API_BASE_URL", None)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class FakeMessages:
+    def __init__(self):
+        self.sent = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            sid = f"SMfake{next(self._ids):026d}"
+            self.sent.append(dict(kwargs, sid=sid))
+        logger.info(f"[Fake WhatsApp] {kwargs.get('to')}: {kwargs.get('body') or kwargs.get('content_sid')}")
+        return SimpleNamespace(sid=sid, status="queued", **kwargs)
+
+
+class FakeClient:
+    """Stands in for twilio.rest.Client; sent messages are kept in `messages.sent`."""
+
+    def __init__(self):
+        self.messages = FakeMessages()
+
+
+class RateLimitedMessages:
+    def __init__(self, messages):
+        self._messages = messages
+
+    def create(self, **kwargs):
+        # Shared per-number token bucket, so all processes together stay under Twilio's limit
+        acquire(kwargs.get("from_") or settings.TWILIO_WHATSAPP_NUMBER)
+        return self._messages.create(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class RateLimitedClient:
+    """Wraps a client so every messages.create() waits for a send slot first."""
+
+    def __init__(self, client):
+        self._client = client
+        self.messages = RateLimitedMessages(client.messages)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def build_twilio_client(keep_alive=True):
+    # twilio.rest pulls in the whole generated API tree, so only import it
+    # once a process actually sends something
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    class RebasedHttpClient(TwilioHttpClient):
+        """Keeps the request path but swaps Twilio's hosts for API_BASE_URL."""
+
+        def request(self, method, url, *args, **kwargs):
+            parts = urlsplit(url)
+            url = f"{API_BASE_URL.rstrip('/')}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            return super().request(method, url, *args, **kwargs)
+
+    http_client_class = RebasedHttpClient if API_BASE_URL else TwilioHttpClient
+    http_client = http_client_class(pool_connections=keep_alive, timeout=TIMEOUT)
+    if keep_alive:
+        # One keep-alive session per process; sized so concurrent senders
+        # don't open and drop extra TLS connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        http_client.session.mount("https://", adapter)
+        http_client.session.mount("http://", adapter)
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+
+
+def build_client():
+    if CLIENT_KIND == "fake":
+        return FakeClient()
+    return build_twilio_client()
+
+
+def get_client():
+    """The process-wide messaging client, built on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RateLimitedClient(build_client())
+    return _client
+
+
+def set_client(client):
+    """Swap the client, e.g. for a FakeClient in tests. Pass None to rebuild lazily."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def send_whatsapp(to, body="", content_sid="", **kwargs):
+    """Send a WhatsApp message to a bare phone number and return the Twilio message."""
+    params = {
+        "from_": settings.TWILIO_WHATSAPP_NUMBER,
+        "to": f"whatsapp:{to}",
+        **kwargs,
+    }
+    if STATUS_CALLBACK_URL:
+        params.setdefault("status_callback", STATUS_CALLBACK_URL)
+    if content_sid:
+        params["content_sid"] = content_sid
+    else:
+        params["body"] = body
+    return get_client().messages.create(**params)
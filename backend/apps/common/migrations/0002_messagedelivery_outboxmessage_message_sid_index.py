@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['message_sid'], name='common_outb_message_19b3e0_idx'),
+        ),
+        migrations.CreateModel(
+            name='MessageDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_sid', models.CharField(max_length=64, unique=True)),
+                ('to', models.CharField(blank=True, max_length=32)),
+                ('status', models.CharField(choices=[('accepted', 'Accepted'), ('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read'), ('undelivered', 'Undelivered'), ('failed', 'Failed')], max_length=12)),
+                ('error_code', models.CharField(blank=True, max_length=10)),
+                ('error_message', models.TextField(blank=True)),
+                ('status_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('outbox_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='common.outboxmessage')),
+            ],
+            options={
+                'verbose_name_plural': 'Message deliveries',
+                'ordering': ['-status_at'],
+                'indexes': [models.Index(fields=['status', 'status_at'], name='common_mess_status_706f7d_idx')],
+            },
+        ),
+    ]
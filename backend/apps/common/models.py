@@ -1,3 +1,100 @@
 from django.db import models
 
-# Create your models here.
+
+class OutboxMessage(models.Model):
+    """
+    A WhatsApp message waiting to be delivered. Rows are written in the same
+    transaction as the change that triggered them and sent by a Celery worker.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+        # Replaced by a later message for the same patient and object
+        ("superseded", "Superseded"),
+    ]
+
+    to = models.CharField(max_length=32)
+    body = models.TextField(blank=True)
+    # Approved WhatsApp template, sent instead of a free-form body
+    content_sid = models.CharField(max_length=64, blank=True)
+    event = models.CharField(max_length=64, blank=True)
+    # "app_label.model" and pk of the object the message is about
+    object_type = models.CharField(max_length=100, blank=True)
+    object_id = models.PositiveBigIntegerField(null=True, blank=True)
+    # Messages sharing a key are debounced: a newer one supersedes any still pending
+    coalesce_key = models.CharField(max_length=150, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    message_sid = models.CharField(max_length=64, blank=True)
+
+    available_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["message_sid"]),
+            models.Index(fields=["coalesce_key", "status"]),
+        ]
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.event or 'message'} to {self.to} ({self.status})"
+
+
+class MessageDelivery(models.Model):
+    """Latest delivery status Twilio reported for a sent message."""
+    STATUS_CHOICES = [
+        ("accepted", "Accepted"),
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("delivered", "Delivered"),
+        ("read", "Read"),
+        ("undelivered", "Undelivered"),
+        ("failed", "Failed"),
+    ]
+
+    message_sid = models.CharField(max_length=64, unique=True)
+    outbox_message = models.ForeignKey(
+        OutboxMessage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="deliveries"
+    )
+    to = models.CharField(max_length=32, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES)
+    error_code = models.CharField(max_length=10, blank=True)
+    error_message = models.TextField(blank=True)
+    # When Twilio reported the current status
+    status_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Message deliveries"
+        indexes = [
+            models.Index(fields=["status", "status_at"]),
+        ]
+        ordering = ["-status_at"]
+
+    def __str__(self):
+        return f"{self.message_sid} ({self.status})"
+
+
+class Counter(models.Model):
+    """
+    Last number handed out for a named sequence, e.g. the sessions of one
+    treatment plan. Advanced only through apps.common.counters.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
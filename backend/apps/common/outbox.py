@@ -0,0 +1,256 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .messaging import send_whatsapp
+from .ratelimit import is_throttled_error
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, "OUTBOX_BATCH_SIZE", 100)
+CONCURRENCY = getattr(settings, "OUTBOX_CONCURRENCY", 8)
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = timedelta(seconds=30)
+# Throttled sends go back to the queue without using up an attempt
+THROTTLE_DELAY = timedelta(seconds=15)
+# A message left in "sending" this long belongs to a worker that died mid-batch
+SENDING_TIMEOUT = timedelta(minutes=5)
+# Bound a single drain run so one task doesn't hog a worker forever
+MAX_BATCHES_PER_RUN = 50
+# Coalesced messages wait this long for a newer version before they are sent
+DEBOUNCE = timedelta(seconds=getattr(settings, "NOTIFICATION_DEBOUNCE_SECONDS", 60))
+# Twilio's limit for a WhatsApp body; merged messages are split to stay under it
+MAX_BODY_LENGTH = 1600
+
+
+def object_type_of(obj):
+    return f"{obj._meta.app_label}.{obj._meta.model_name}"
+
+
+def build_message(to, body="", event="", obj=None, content_sid=""):
+    """An unsaved outbox row, for callers that insert many at once."""
+    return OutboxMessage(
+        to=to,
+        body=body,
+        content_sid=content_sid,
+        event=event,
+        object_type=object_type_of(obj) if obj is not None else "",
+        object_id=obj.pk if obj is not None else None,
+        available_at=timezone.now(),
+    )
+
+
+def enqueue(to, body="", event="", obj=None, content_sid="", coalesce_key=""):
+    """
+    Write a message to the outbox inside the caller's transaction. The worker is
+    woken once the transaction commits, so rolled back changes send nothing.
+
+    With a coalesce_key the message is held back for DEBOUNCE. Retire the
+    older versions with pending_events() and supersede() in the same
+    transaction, so only the newest one goes out.
+    """
+    message = build_message(to, body=body, event=event, obj=obj, content_sid=content_sid)
+    if coalesce_key and DEBOUNCE:
+        message.coalesce_key = coalesce_key
+        message.available_at += DEBOUNCE
+    message.save()
+    transaction.on_commit(schedule_drain)
+    return message
+
+
+def pending_events(coalesce_key):
+    """
+    Lock the messages for a key that are still waiting to be sent and return
+    {id: event}, oldest first. Call inside transaction.atomic() and pass the
+    ids to supersede() once their replacement is queued. Messages a worker
+    already claimed are left alone.
+    """
+    if not coalesce_key or not DEBOUNCE:
+        return {}
+    # Locks the rows, so a concurrent claim_batch either got them first or skips them
+    return dict(
+        OutboxMessage.objects
+        .select_for_update()
+        .filter(coalesce_key=coalesce_key, status="pending")
+        .order_by("id")
+        .values_list("id", "event")
+    )
+
+
+def supersede(message_ids):
+    """Retire pending messages that a newer message replaces."""
+    if message_ids:
+        OutboxMessage.objects.filter(id__in=list(message_ids), status="pending").update(status="superseded")
+
+
+def enqueue_many(messages):
+    if not messages:
+        return []
+    created = OutboxMessage.objects.bulk_create(messages)
+    transaction.on_commit(schedule_drain)
+    return created
+
+
+def schedule_drain():
+    from .tasks import drain_outbox
+
+    try:
+        drain_outbox.delay()
+    except Exception as e:
+        # The periodic drain picks the messages up
+        logger.warning(f"Could not schedule outbox drain: {str(e)}")
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """
+    Lock a batch of due messages, mark them as sending and return them. Rows
+    locked by another worker are skipped, so several workers can drain at once.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending", available_at__lte=now)
+                | Q(status="sending", available_at__lte=now - SENDING_TIMEOUT)
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # While sending, available_at records when the batch was claimed
+        OutboxMessage.objects.filter(id__in=ids).update(
+            status="sending",
+            available_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(OutboxMessage.objects.filter(id__in=ids))
+
+
+def group_messages(messages):
+    """
+    Split a batch into groups sent as one WhatsApp message each. Coalesced
+    messages due for the same number are merged, so edits to several sessions
+    of a plan reach the patient together.
+    """
+    groups = []
+    open_groups = {}
+    for message in messages:
+        if not message.coalesce_key or message.content_sid:
+            groups.append([message])
+            continue
+        group = open_groups.get(message.to)
+        if group is not None and len(merged_body(group + [message])) <= MAX_BODY_LENGTH:
+            group.append(message)
+            continue
+        open_groups[message.to] = [message]
+        groups.append(open_groups[message.to])
+    return groups
+
+
+def merged_body(group):
+    return "\n\n".join(message.body for message in group)
+
+
+def deliver(group):
+    """Send a group of messages as one through Twilio and return its SID."""
+    first = group[0]
+    return send_whatsapp(first.to, body=merged_body(group), content_sid=first.content_sid).sid
+
+
+def _deliver_safely(group):
+    try:
+        return group, deliver(group), None
+    except Exception as e:
+        return group, None, e
+
+
+def send_batch(messages):
+    """Send a claimed batch concurrently and record the outcome with one bulk update."""
+    groups = group_messages(messages)
+    with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(groups))) as executor:
+        results = [
+            (message, sid, error)
+            for group, sid, error in executor.map(_deliver_safely, groups)
+            for message in group
+        ]
+
+    now = timezone.now()
+    sent = []
+    throttled = 0
+    for message, sid, error in results:
+        if error is None:
+            message.status = "sent"
+            message.message_sid = sid or ""
+            message.sent_at = now
+            message.last_error = ""
+            sent.append(message)
+            continue
+
+        message.last_error = str(error)
+        if is_throttled_error(error):
+            # Backpressure, not a failure: keep it pending and try again shortly
+            message.status = "pending"
+            message.attempts -= 1
+            message.available_at = now + THROTTLE_DELAY
+            throttled += 1
+            continue
+
+        logger.error(f"Failed to send outbox message {message.pk} to {message.to}: {error}")
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = "failed"
+        else:
+            message.status = "pending"
+            message.available_at = now + RETRY_BACKOFF * 2 ** (message.attempts - 1)
+
+    if throttled:
+        logger.warning(f"{throttled} outbox messages throttled, retrying in {THROTTLE_DELAY.seconds}s")
+
+    OutboxMessage.objects.bulk_update(
+        messages, ["status", "attempts", "message_sid", "sent_at", "last_error", "available_at"]
+    )
+    mark_notified(sent, now)
+    return len(sent)
+
+
+def mark_notified(messages, when):
+    """Stamp notified_at / notification_sent on the objects the messages were about."""
+    by_type = {}
+    for message in messages:
+        if message.object_type and message.object_id:
+            by_type.setdefault(message.object_type, set()).add(message.object_id)
+
+    for object_type, ids in by_type.items():
+        try:
+            model = apps.get_model(object_type)
+        except LookupError:
+            continue
+        field_names = {field.name for field in model._meta.concrete_fields}
+        updates = {}
+        if "notified_at" in field_names:
+            updates["notified_at"] = when
+        if "notification_sent" in field_names:
+            updates["notification_sent"] = True
+        if updates:
+            # Queryset update, so no signals and no second round of notifications
+            model.objects.filter(pk__in=ids).update(**updates)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Send due messages batch by batch. Returns the number of messages sent."""
+    sent = 0
+    for _ in range(MAX_BATCHES_PER_RUN):
+        batch = claim_batch(batch_size)
+        if not batch:
+            break
+        sent += send_batch(batch)
+    return sent
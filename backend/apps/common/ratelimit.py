@@ -0,0 +1,134 @@
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Twilio's per-sender throughput. Burst lets a quiet sender send a few at once.
+RATE_PER_SECOND = getattr(settings, "MESSAGING_RATE_PER_SECOND", 20)
+BURST = getattr(settings, "MESSAGING_BURST", 20)
+# Backpressure: callers queue for a token, but only this many per sender and
+# only for this long, after which they get RateLimitExceeded
+MAX_WAITERS = getattr(settings, "MESSAGING_MAX_WAITERS", 200)
+MAX_WAIT_SECONDS = getattr(settings, "MESSAGING_MAX_WAIT_SECONDS", 30)
+
+KEY_PREFIX = "ratelimit:whatsapp:"
+
+# whatsapp_client/twilio_client.py carries a copy of this script and of
+# acquire(), since it is deployed without this package. Change both together;
+# a test in apps/common/tests.py fails if the scripts or key prefixes differ.
+
+# Refill by elapsed time and take one token. Returns 0 when a token was taken,
+# otherwise the milliseconds until one will be available. Uses the Redis clock
+# so every process agrees on time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+_script = None
+
+
+class RateLimitExceeded(Exception):
+    """Too many senders queued for the number, or no token within MAX_WAIT_SECONDS."""
+
+
+def _take_token(r, sender):
+    global _script
+    if _script is None:
+        _script = r.register_script(TOKEN_BUCKET_SCRIPT)
+    return _script(keys=[f"{KEY_PREFIX}{sender}:bucket"], args=[RATE_PER_SECOND, BURST])
+
+
+def acquire(sender):
+    """
+    Block until `sender` may send one more message. Returns the seconds waited.
+    Fails open if Redis is unavailable; Twilio's own 429s are still handled by
+    the outbox.
+    """
+    began = time.monotonic()
+    try:
+        r = get_redis()
+        waiting_key = f"{KEY_PREFIX}{sender}:waiting"
+        stats_key = f"{KEY_PREFIX}{sender}:stats"
+        pipe = r.pipeline(transaction=False)
+        pipe.incr(waiting_key)
+        # A process killed while waiting can't decrement; let stale counts decay
+        pipe.expire(waiting_key, MAX_WAIT_SECONDS * 2)
+        depth = pipe.execute()[0]
+    except redis.RedisError as e:
+        logger.warning(f"Rate limiter unavailable, sending unthrottled: {str(e)}")
+        return 0.0
+
+    try:
+        if depth > MAX_WAITERS:
+            r.hincrby(stats_key, "rejected", 1)
+            raise RateLimitExceeded(f"{depth - 1} messages already waiting for {sender}")
+        if depth > int(r.hget(stats_key, "max_depth") or 0):
+            r.hset(stats_key, "max_depth", depth)
+
+        while True:
+            wait_ms = _take_token(r, sender)
+            if not wait_ms:
+                break
+            if time.monotonic() - began + wait_ms / 1000 > MAX_WAIT_SECONDS:
+                r.hincrby(stats_key, "rejected", 1)
+                raise RateLimitExceeded(f"No send slot for {sender} within {MAX_WAIT_SECONDS}s")
+            time.sleep(wait_ms / 1000)
+
+        waited = time.monotonic() - began
+        pipe = r.pipeline(transaction=False)
+        pipe.hincrby(stats_key, "acquired", 1)
+        pipe.hincrby(stats_key, "wait_ms_total", int(waited * 1000))
+        pipe.execute()
+        if waited > 1:
+            logger.info(f"Waited {waited:.1f}s for a send slot on {sender} (queue depth {depth})")
+        return waited
+    except redis.RedisError as e:
+        logger.warning(f"Rate limiter unavailable, sending unthrottled: {str(e)}")
+        return time.monotonic() - began
+    finally:
+        try:
+            r.decr(waiting_key)
+        except redis.RedisError:
+            pass
+
+
+def get_stats(sender):
+    """Queue depth and wait-time metrics for a sender number."""
+    r = get_redis()
+    stats = r.hgetall(f"{KEY_PREFIX}{sender}:stats")
+    acquired = int(stats.get("acquired", 0))
+    wait_ms_total = int(stats.get("wait_ms_total", 0))
+    return {
+        "sender": sender,
+        "waiting": int(r.get(f"{KEY_PREFIX}{sender}:waiting") or 0),
+        "max_depth": int(stats.get("max_depth", 0)),
+        "acquired": acquired,
+        "rejected": int(stats.get("rejected", 0)),
+        "avg_wait_ms": wait_ms_total / acquired if acquired else 0.0,
+    }
+
+
+def is_throttled_error(error):
+    """True for our own backpressure and for Twilio 429 responses."""
+    return isinstance(error, RateLimitExceeded) or getattr(error, "status", None) == 429
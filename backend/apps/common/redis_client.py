@@ -0,0 +1,34 @@
+import redis
+from django.conf import settings
+
+
+def _connect(**options):
+    # Short timeouts, so an unreachable Redis fails fast instead of after the OS TCP timeout
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        **options,
+    )
+
+
+_client = None
+
+
+def get_redis():
+    """Shared Redis connection. Created on first use, one connection pool per process."""
+    global _client
+    if _client is None:
+        _client = _connect(decode_responses=True)
+    return _client
+
+
+_binary_client = None
+
+
+def get_binary_redis():
+    """Like get_redis(), but returns bytes, for binary payloads such as PDFs."""
+    global _binary_client
+    if _binary_client is None:
+        _binary_client = _connect()
+    return _binary_client
@@ -0,0 +1,23 @@
+import logging
+
+from celery import shared_task
+
+from .deliveries import flush_statuses
+from .outbox import drain
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def drain_outbox():
+    """Send pending WhatsApp messages from the outbox."""
+    sent = drain()
+    if sent:
+        logger.info(f"Outbox drained, {sent} messages sent")
+    return sent
+
+
+@shared_task(ignore_result=True)
+def flush_delivery_statuses():
+    """Persist buffered Twilio status callbacks."""
+    return flush_statuses()
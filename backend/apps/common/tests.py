@@ -1,3 +1,260 @@
-from django.test import TestCase
+import ast
+import threading
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from twilio.request_validator import RequestValidator
+
+from . import counters, deliveries, outbox, ratelimit, redis_client
+from .fake_twilio import FakeTwilio
+from .counters import reserve
+from .models import Counter, MessageDelivery, OutboxMessage
+from .ratelimit import RateLimitExceeded
+
+
+def make_message(to="+919800000001", body="Hello", available_in=timedelta(0), **fields):
+    fields.setdefault("available_at", timezone.now() + available_in)
+    return OutboxMessage.objects.create(to=to, body=body, **fields)
+
+
+class ClaimBatchTests(TestCase):
+    def test_claims_due_pending_messages_only(self):
+        due = make_message()
+        make_message(available_in=timedelta(minutes=5))
+        make_message(status="sent")
+
+        claimed = outbox.claim_batch()
+
+        self.assertEqual([message.pk for message in claimed], [due.pk])
+        due.refresh_from_db()
+        self.assertEqual(due.status, "sending")
+        self.assertEqual(due.attempts, 1)
+        self.assertEqual(outbox.claim_batch(), [])
+
+    def test_reclaims_messages_of_a_dead_worker(self):
+        stale = make_message(status="sending", available_in=-outbox.SENDING_TIMEOUT - timedelta(seconds=1))
+        make_message(status="sending")
+        self.assertEqual([message.pk for message in outbox.claim_batch()], [stale.pk])
+
+    def test_respects_the_limit_in_id_order(self):
+        messages = [make_message() for _ in range(3)]
+        self.assertEqual([message.pk for message in outbox.claim_batch(limit=2)], [m.pk for m in messages[:2]])
+
+
+@mock.patch("apps.common.outbox.send_whatsapp")
+class SendBatchTests(TestCase):
+    def test_sent_messages_record_the_sid(self, send_whatsapp):
+        send_whatsapp.return_value = SimpleNamespace(sid="SM1")
+        message = make_message()
+        self.assertEqual(outbox.send_batch(outbox.claim_batch()), 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.message_sid), ("sent", "SM1"))
+        self.assertIsNotNone(message.sent_at)
+
+    def test_failures_back_off_then_give_up(self, send_whatsapp):
+        send_whatsapp.side_effect = RuntimeError("boom")
+        message = make_message()
+        outbox.send_batch(outbox.claim_batch())
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.last_error), ("pending", 1, "boom"))
+        self.assertGreater(message.available_at, timezone.now() + outbox.RETRY_BACKOFF - timedelta(seconds=5))
+
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            attempts=outbox.MAX_ATTEMPTS - 1, available_at=timezone.now()
+        )
+        outbox.send_batch(outbox.claim_batch())
+        message.refresh_from_db()
+        self.assertEqual(message.status, "failed")
+
+    def test_throttled_sends_stay_pending_without_using_an_attempt(self, send_whatsapp):
+        send_whatsapp.side_effect = RateLimitExceeded("busy")
+        message = make_message()
+        outbox.send_batch(outbox.claim_batch())
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("pending", 0))
+
+
+class RateLimitCopyTests(SimpleTestCase):
+    """The WhatsApp bot carries its own copy of the limiter; both must agree."""
+
+    bot_client = Path(settings.BASE_DIR).parent / "whatsapp_client" / "twilio_client.py"
+
+    def bot_constants(self):
+        if not self.bot_client.exists():
+            self.skipTest("whatsapp_client is not checked out next to the backend")
+        tree = ast.parse(self.bot_client.read_text())
+        return {
+            target.id: node.value.value
+            for node in tree.body
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+            for target in node.targets
+            if isinstance(target, ast.Name)
+        }
+
+    def test_bot_uses_the_same_bucket(self):
+        constants = self.bot_constants()
+        self.assertEqual(constants["KEY_PREFIX"], ratelimit.KEY_PREFIX)
+        self.assertEqual(constants["TOKEN_BUCKET_SCRIPT"], ratelimit.TOKEN_BUCKET_SCRIPT)
+
+
+class LatestPerMessageTests(SimpleTestCase):
+    def test_keeps_the_furthest_status_whatever_the_arrival_order(self):
+        latest = deliveries.latest_per_message([
+            {"sid": "SM1", "status": "delivered", "at": 3},
+            {"sid": "SM1", "status": "sent", "at": 5},
+            {"sid": "SM2", "status": "queued", "at": 1},
+            {"sid": "SM1", "status": "read", "at": 4},
+        ])
+        self.assertEqual({sid: item["status"] for sid, item in latest.items()}, {"SM1": "read", "SM2": "queued"})
+
+    def test_later_report_wins_between_equal_ranks(self):
+        latest = deliveries.latest_per_message([
+            {"sid": "SM1", "status": "failed", "at": 2},
+            {"sid": "SM1", "status": "delivered", "at": 1},
+        ])
+        self.assertEqual(latest["SM1"]["status"], "failed")
+
+    def test_parse_callback_drops_junk(self):
+        self.assertIsNone(deliveries.parse_callback("not json"))
+        self.assertIsNone(deliveries.parse_callback('{"sid": "SM1", "status": "bogus"}'))
+        self.assertEqual(deliveries.parse_callback('{"sid": "SM1", "status": "sent"}')["sid"], "SM1")
+
+
+class SaveStatusesTests(TestCase):
+    def test_upserts_and_links_the_outbox_row(self):
+        message = make_message(status="sent", message_sid="SM1")
+        deliveries.save_statuses({"SM1": {"sid": "SM1", "status": "sent", "to": "whatsapp:+919800000001", "at": 1}})
+        deliveries.save_statuses({"SM1": {"sid": "SM1", "status": "delivered", "at": 2}})
+
+        delivery = MessageDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.outbox_message_id), ("delivered", message.pk))
+
+    def test_never_moves_a_status_down(self):
+        deliveries.save_statuses({"SM1": {"sid": "SM1", "status": "read", "at": 2}})
+        self.assertEqual(deliveries.save_statuses({"SM1": {"sid": "SM1", "status": "sent", "at": 3}}), 0)
+        self.assertEqual(MessageDelivery.objects.get().status, "read")
+
+
+class GroupMessagesTests(SimpleTestCase):
+    def message(self, to="+919800000001", body="Hello", coalesce_key="1:appointments.appointment:1", **fields):
+        return OutboxMessage(to=to, body=body, coalesce_key=coalesce_key, **fields)
+
+    def test_coalesced_messages_for_a_number_merge(self):
+        first, other_number, second = (
+            self.message(body="one"),
+            self.message(to="+919800000002"),
+            self.message(body="two", coalesce_key="1:appointments.treatmentsession:2"),
+        )
+        groups = outbox.group_messages([first, other_number, second])
+        self.assertEqual(groups, [[first, second], [other_number]])
+        self.assertEqual(outbox.merged_body(groups[0]), "one\n\ntwo")
+
+    def test_plain_and_template_messages_go_alone(self):
+        messages = [self.message(coalesce_key=""), self.message(coalesce_key=""), self.message(content_sid="HX1")]
+        self.assertEqual(outbox.group_messages(messages), [[m] for m in messages])
+
+    def test_groups_stay_under_the_body_limit(self):
+        half = "x" * (outbox.MAX_BODY_LENGTH // 2)
+        messages = [self.message(body=half) for _ in range(3)]
+        groups = outbox.group_messages(messages)
+        self.assertEqual([len(group) for group in groups], [1, 1, 1])
+        self.assertTrue(all(len(outbox.merged_body(group)) <= outbox.MAX_BODY_LENGTH for group in groups))
+
+
+class SupersedeTests(TestCase):
+    def test_retires_pending_messages_of_the_key_only(self):
+        key = "1:appointments.appointment:1"
+        first = make_message(coalesce_key=key, event="appointment_created")
+        make_message(coalesce_key=key, event="appointment_updated", status="sending")
+        other = make_message(coalesce_key="1:appointments.appointment:2")
+
+        with transaction.atomic():
+            pending = outbox.pending_events(key)
+            self.assertEqual(pending, {first.pk: "appointment_created"})
+            outbox.supersede(pending)
+        first.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((first.status, other.status), ("superseded", "pending"))
+        with transaction.atomic():
+            self.assertEqual(outbox.pending_events(key), {})
+
+
+class ReserveTests(TestCase):
+    def test_hands_out_consecutive_numbers(self):
+        self.assertEqual(reserve("tests:a"), 1)
+        self.assertEqual(reserve("tests:a", count=3), 2)
+        self.assertEqual(reserve("tests:a"), 5)
+        self.assertEqual(reserve("tests:b"), 1)
+
+    def test_seed_is_only_read_when_the_counter_is_created(self):
+        seed = mock.Mock(return_value=41)
+        self.assertEqual(reserve("tests:a", seed=seed), 42)
+        self.assertEqual(reserve("tests:a", seed=seed), 43)
+        seed.assert_called_once_with()
+
+    def test_locking_fallback_matches(self):
+        with mock.patch.object(counters, "RETURNING_VENDORS", set()):
+            self.assertEqual(reserve("tests:a", count=2, seed=lambda: 10), 11)
+            self.assertEqual(reserve("tests:a"), 13)
+        self.assertEqual(Counter.objects.get(name="tests:a").value, 13)
+
+    def test_rejects_empty_reservations(self):
+        with self.assertRaises(ValueError):
+            reserve("tests:a", count=0)
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite serialises writers anyway")
+class ConcurrentReserveTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_concurrent_callers_never_share_a_number(self):
+        barrier = threading.Barrier(self.THREADS)
+        numbers = []
+
+        def take():
+            try:
+                barrier.wait()
+                numbers.extend(reserve("tests:concurrent") for _ in range(5))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=take) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(numbers), list(range(1, self.THREADS * 5 + 1)))
+
+
+class FakeTwilioCallbackTests(SimpleTestCase):
+    @mock.patch("apps.common.fake_twilio.time.sleep")
+    @mock.patch("apps.common.fake_twilio.urlopen")
+    def test_status_callbacks_are_signed_like_twilio(self, urlopen, _):
+        url = "https://bot.example.com/twilio/status"
+        message = {"sid": "SM1", "to": "whatsapp:+919800000001", "from": "whatsapp:+14155238886", "account_sid": "AC1"}
+        FakeTwilio(callbacks=True, auth_token="secret")._report_statuses(url, message)
+
+        validator = RequestValidator("secret")
+        for call in urlopen.call_args_list:
+            request = call.args[0]
+            params = {key: values[0] for key, values in parse_qs(request.data.decode()).items()}
+            self.assertTrue(validator.validate(url, params, request.get_header("X-twilio-signature")))
+        self.assertEqual(urlopen.call_count, 2)
+
+
+class RedisClientTests(SimpleTestCase):
+    @override_settings(REDIS_URL="redis://10.255.255.1:6379/0", REDIS_CONNECT_TIMEOUT=0.2, REDIS_SOCKET_TIMEOUT=0.3)
+    @mock.patch.object(redis_client, "_client", None)
+    @mock.patch.object(redis_client, "_binary_client", None)
+    def test_clients_give_up_quickly(self):
+        for client in (redis_client.get_redis(), redis_client.get_binary_redis()):
+            options = client.connection_pool.connection_kwargs
+            self.assertEqual((options["socket_connect_timeout"], options["socket_timeout"]), (0.2, 0.3))
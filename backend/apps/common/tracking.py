@@ -0,0 +1,83 @@
+_MISSING = object()
+
+
+class FieldTrackerMixin:
+    """
+    Remembers field values as they were loaded from the database, so saves and
+    signals can tell what changed without fetching the row again.
+
+    Put it before models.Model in the bases. Instances that were not loaded from
+    the database (new or hand-built objects) report no changes.
+    """
+    # Field names to track; None tracks every concrete field except the pk
+    tracked_fields = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _tracked_attnames(self):
+        return [
+            field.attname
+            for field in self._meta.concrete_fields
+            if not field.primary_key and (self.tracked_fields is None or field.name in self.tracked_fields)
+        ]
+
+    def _snapshot(self):
+        # Deferred fields are not in __dict__ and stay untracked until loaded
+        self._loaded_values = {
+            attname: self.__dict__[attname]
+            for attname in self._tracked_attnames()
+            if attname in self.__dict__
+        }
+
+    def _attname(self, field):
+        return self._meta.get_field(field).attname
+
+    def previous(self, field, default=None):
+        """Value of `field` when the instance was loaded or last saved."""
+        value = getattr(self, "_loaded_values", {}).get(self._attname(field), _MISSING)
+        return default if value is _MISSING else value
+
+    def has_changed(self, field):
+        attname = self._attname(field)
+        loaded = getattr(self, "_loaded_values", {})
+        if attname not in loaded:
+            return False
+        return loaded[attname] != self.__dict__.get(attname)
+
+    def changed_fields(self):
+        """Attribute names (user_id rather than user) of fields that differ from the snapshot."""
+        loaded = getattr(self, "_loaded_values", {})
+        return {
+            attname for attname, value in loaded.items()
+            if value != self.__dict__.get(attname)
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have already seen the old values by now
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._snapshot()
+            return
+        loaded = getattr(self, "_loaded_values", {})
+        for field in update_fields:
+            attname = self._attname(field)
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+
+    def mark_saved(self, **values):
+        """Set fields that were already written by other means, e.g. a queryset update."""
+        loaded = getattr(self, "_loaded_values", None)
+        for field, value in values.items():
+            attname = self._attname(field)
+            setattr(self, attname, value)
+            if loaded is not None:
+                loaded[attname] = value
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot()
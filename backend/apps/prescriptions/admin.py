@@ -6,10 +6,8 @@ from .models import Medicine, Prescription, PrescriptionItem
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
-from weasyprint import HTML 
+from .services.pdf import generate_prescription_pdf
 from django.templatetags.static import static
-from django.conf import settings
-from pathlib import Path
 
 @admin.register(Medicine)
 class MedicineAdmin(ModelAdmin):
@@ -75,21 +73,7 @@ class PrescriptionAdmin(ModelAdmin):
 
     def download_prescription_pdf(self, request, pk):
         prescription = self.get_object(request, pk)
-
-        # Get the static file path instead of URL
-        image_path = Path(settings.STATIC_ROOT) / "prescriptions" / "template.png"
-
-        background_image_url = f"file://{image_path}" if image_path.exists() else ""
-
-        html = render_to_string(
-            "prescriptions/prescription_pdf.html",
-            {
-                "prescription": prescription,
-                "background_image": background_image_url
-            }
-        )
-
-        pdf = HTML(string=html).write_pdf()
+        pdf = generate_prescription_pdf(prescription)
 
         response = HttpResponse(content_type='application/pdf')
         response["Content-Disposition"] = (
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.prescriptions.services.pdf_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Show prescription PDF cache hit rate and render times"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters after printing them")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+        avg_render = f"{stats['avg_render_ms']:.1f} ms" if stats["avg_render_ms"] is not None else "n/a"
+        self.stdout.write(
+            f"{stats['backend']}: {stats['hits']} hits, {stats['misses']} misses, "
+            f"hit rate {hit_rate}, avg render {avg_render}, "
+            f"{stats['entries']} cached PDFs ({stats['bytes']} bytes)"
+        )
+        if options["reset"]:
+            reset_stats()
+            self.stdout.write("Counters reset")
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from apps.common.counters import reserve
 
 User = settings.AUTH_USER_MODEL
 
@@ -58,13 +59,19 @@ class Prescription(models.Model):
     class Meta:
         ordering = ['-issued_at']
 
+    @staticmethod
+    def reserve_numbers(user_id, count=1):
+        """First of `count` consecutive prescription numbers for the patient."""
+        def highest_existing():
+            return Prescription.objects.filter(user_id=user_id).aggregate(
+                highest=models.Max('prescription_number')
+            )['highest'] or 0
+
+        return reserve(f"prescriptions.prescription:{user_id}", count, seed=highest_existing)
+
     def save(self, *args, **kwargs):
         if not self.prescription_number:
-            last_prescription = Prescription.objects.filter(user=self.user).order_by('-prescription_number').first()
-            if last_prescription:
-                self.prescription_number = last_prescription.prescription_number + 1
-            else:
-                self.prescription_number = 1
+            self.prescription_number = Prescription.reserve_numbers(self.user_id)
         super().save(*args, **kwargs)
 
     def __str__(self):
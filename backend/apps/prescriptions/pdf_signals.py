@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Prescription, PrescriptionItem
+from .services import pdf_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_prerender(prescription_id):
+    from .tasks import prerender_prescription_pdf
+
+    try:
+        prerender_prescription_pdf.delay(prescription_id)
+    except Exception as e:
+        # The first request for the PDF renders it instead
+        logger.warning(f"Could not schedule PDF render for prescription {prescription_id}: {str(e)}")
+
+
+def render_pdf_on_commit(prescription_id):
+    """
+    Have a worker render the PDF once the prescription and its items are
+    committed. The cache is keyed by content, so the stale PDF is never
+    served and is replaced when the new one is stored. Several items saved
+    in one transaction queue several tasks; all but the first find the PDF
+    cached or being rendered and skip it.
+    """
+    transaction.on_commit(lambda: schedule_prerender(prescription_id))
+
+
+@receiver(post_save, sender=Prescription)
+def render_prescription_pdf(sender, instance, **kwargs):
+    render_pdf_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=PrescriptionItem)
+@receiver(post_delete, sender=PrescriptionItem)
+def render_prescription_pdf_for_item(sender, instance, **kwargs):
+    render_pdf_on_commit(instance.prescription_id)
+
+
+@receiver(post_delete, sender=Prescription)
+def drop_prescription_pdf(sender, instance, **kwargs):
+    prescription_id = instance.pk
+    transaction.on_commit(lambda: pdf_cache.invalidate(prescription_id))
@@ -1,12 +1,12 @@
 from pathlib import Path
 from django.conf import settings
 from django.template.loader import render_to_string
-from django.conf import settings
-from django.template.loader import render_to_string
 from weasyprint import HTML
 
+from . import pdf_cache
 
-def generate_prescription_pdf(prescription):
+
+def render_prescription_pdf(prescription):
     image_path = Path(settings.STATIC_ROOT) / "prescriptions" / "template.png"
     background_image_url = f"file://{image_path}" if image_path.exists() else ""
 
@@ -21,3 +21,7 @@ def generate_prescription_pdf(prescription):
     pdf_bytes = HTML(string = html).write_pdf()
     return pdf_bytes
 
+
+def generate_prescription_pdf(prescription):
+    """The prescription's PDF, rendered only when its content has changed."""
+    return pdf_cache.get_or_render(prescription, render_prescription_pdf)
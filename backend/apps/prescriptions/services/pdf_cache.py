@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from time import perf_counter
+
+import redis
+from django.conf import settings
+from django.template.loader import get_template
+
+from apps.common.redis_client import get_binary_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Bump when the PDF output changes without the template file changing,
+# e.g. a WeasyPrint upgrade or new context passed to the template
+TEMPLATE_VERSION = 1
+TEMPLATE_NAME = "prescriptions/prescription_pdf.html"
+BACKGROUND_IMAGE = Path(settings.STATIC_ROOT) / "prescriptions" / "template.png"
+
+# "filesystem", "redis" or "none"
+BACKEND = getattr(settings, "PRESCRIPTION_PDF_CACHE", "filesystem")
+CACHE_DIR = Path(getattr(settings, "PRESCRIPTION_PDF_CACHE_DIR", Path(settings.BASE_DIR) / "var" / "prescription_pdfs"))
+REDIS_TTL = 60 * 60 * 24 * 7
+REDIS_PREFIX = "prescriptions:pdf:"
+STATS_KEY = "prescriptions:pdf-cache:stats"
+# Held while a worker pre-renders one version, so duplicate tasks skip it
+RENDER_LOCK_TIMEOUT = 120
+
+
+@lru_cache(maxsize=1)
+def template_digest():
+    """Hash of the template source and background image, computed once per process."""
+    digest = hashlib.sha256(str(TEMPLATE_VERSION).encode())
+    origin = get_template(TEMPLATE_NAME).origin.name
+    digest.update(Path(origin).read_bytes())
+    if BACKGROUND_IMAGE.exists():
+        stat = BACKGROUND_IMAGE.stat()
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def fingerprint(prescription):
+    """Hash of everything the PDF shows. One query for the items."""
+    items = list(
+        prescription.items
+        .order_by("pk")
+        .values_list("medicine__name", "morning", "afternoon", "evening", "duration_days", "before_after_food")
+    )
+    user = prescription.user
+    payload = [
+        template_digest(),
+        prescription.pk,
+        user.first_name,
+        user.last_name,
+        prescription.issued_at.isoformat() if prescription.issued_at else None,
+        prescription.doctor_name,
+        prescription.notes,
+        items,
+    ]
+    return hashlib.sha256(json.dumps(payload, default=str).encode()).hexdigest()
+
+
+class FileSystemStore:
+    """PDFs as files named <prescription id>-<fingerprint>.pdf"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _path(self, prescription_id, digest):
+        return self.directory / f"{prescription_id}-{digest}.pdf"
+
+    def get(self, prescription_id, digest):
+        try:
+            return self._path(prescription_id, digest).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, prescription_id, digest, pdf):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.delete(prescription_id)
+        # Write then rename, so readers never see a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(pdf)
+        os.replace(tmp_path, self._path(prescription_id, digest))
+
+    def open(self, prescription_id, digest):
+        """The cached file opened for streaming, or None."""
+        try:
+            return self._path(prescription_id, digest).open("rb")
+        except FileNotFoundError:
+            return None
+
+    def delete(self, prescription_id):
+        for path in self.directory.glob(f"{prescription_id}-*.pdf"):
+            path.unlink(missing_ok=True)
+
+    def size(self):
+        files = list(self.directory.glob("*.pdf")) if self.directory.exists() else []
+        return {"entries": len(files), "bytes": sum(path.stat().st_size for path in files)}
+
+
+class RedisStore:
+    """PDFs as Redis strings that expire after a week without use"""
+
+    def _key(self, prescription_id, digest):
+        return f"{REDIS_PREFIX}{prescription_id}:{digest}"
+
+    def get(self, prescription_id, digest):
+        r = get_binary_redis()
+        key = self._key(prescription_id, digest)
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.expire(key, REDIS_TTL)
+        return pipe.execute()[0]
+
+    def put(self, prescription_id, digest, pdf):
+        self.delete(prescription_id)
+        get_binary_redis().set(self._key(prescription_id, digest), pdf, ex=REDIS_TTL)
+
+    def delete(self, prescription_id):
+        r = get_binary_redis()
+        keys = list(r.scan_iter(match=f"{REDIS_PREFIX}{prescription_id}:*"))
+        if keys:
+            r.delete(*keys)
+
+    def size(self):
+        r = get_binary_redis()
+        keys = list(r.scan_iter(match=f"{REDIS_PREFIX}*"))
+        return {"entries": len(keys), "bytes": sum(r.strlen(key) for key in keys)}
+
+
+def get_store():
+    if BACKEND == "redis":
+        return RedisStore()
+    if BACKEND == "filesystem":
+        return FileSystemStore(CACHE_DIR)
+    return None
+
+
+def _record(**counts):
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for field, amount in counts.items():
+            pipe.hincrby(STATS_KEY, field, int(amount))
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def get_or_render(prescription, render):
+    """
+    The cached PDF for the prescription's current content, or render(prescription)
+    on a miss. A cache that can't be read or written never fails the request.
+    """
+    store = get_store()
+    if store is None:
+        return render(prescription)
+
+    digest = fingerprint(prescription)
+    try:
+        pdf = store.get(prescription.pk, digest)
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"Prescription PDF cache unavailable: {str(e)}")
+        pdf = None
+    if pdf is not None:
+        _record(hits=1)
+        return pdf
+
+    began = perf_counter()
+    pdf = render(prescription)
+    _record(misses=1, render_ms=(perf_counter() - began) * 1000)
+    try:
+        store.put(prescription.pk, digest, pdf)
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"Could not cache PDF for prescription {prescription.pk}: {str(e)}")
+    return pdf
+
+
+def open_cached(prescription):
+    """
+    The cached PDF as an open file, for streaming without loading it into
+    memory, or None when it isn't on disk (yet).
+    """
+    store = get_store()
+    if not isinstance(store, FileSystemStore):
+        return None
+    try:
+        pdf_file = store.open(prescription.pk, fingerprint(prescription))
+    except OSError as e:
+        logger.warning(f"Prescription PDF cache unavailable: {str(e)}")
+        return None
+    if pdf_file is not None:
+        _record(hits=1)
+    return pdf_file
+
+
+def prerender(prescription, render):
+    """Render and store the PDF unless it is cached or another worker is on it."""
+    store = get_store()
+    if store is None:
+        return False
+    digest = fingerprint(prescription)
+    if store.get(prescription.pk, digest) is not None:
+        return False
+
+    lock_key = f"prescriptions:pdf-render:{prescription.pk}:{digest}"
+    try:
+        if not get_redis().set(lock_key, 1, nx=True, ex=RENDER_LOCK_TIMEOUT):
+            return False
+    except redis.RedisError:
+        pass
+    try:
+        get_or_render(prescription, render)
+    finally:
+        try:
+            get_redis().delete(lock_key)
+        except redis.RedisError:
+            pass
+    return True
+
+
+def invalidate(prescription_id):
+    """Drop cached PDFs of a prescription. Its next request renders a fresh one."""
+    store = get_store()
+    if store is None:
+        return
+    try:
+        store.delete(prescription_id)
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"Could not invalidate PDF for prescription {prescription_id}: {str(e)}")
+
+
+def get_stats():
+    """Hit rate and average render time since the counters were last reset."""
+    stats = get_redis().hgetall(STATS_KEY)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    store = get_store()
+    return {
+        "backend": BACKEND,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "avg_render_ms": round(int(stats.get("render_ms", 0)) / misses, 1) if misses else None,
+        **(store.size() if store else {"entries": 0, "bytes": 0}),
+    }
+
+
+def reset_stats():
+    get_redis().delete(STATS_KEY)
@@ -0,0 +1,21 @@
+import logging
+
+from celery import shared_task
+
+from .models import Prescription
+from .services.pdf import render_prescription_pdf
+from .services import pdf_cache
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def prerender_prescription_pdf(prescription_id):
+    """Render a prescription's PDF into the cache before anyone asks for it."""
+    prescription = Prescription.objects.select_related("user").filter(pk=prescription_id).first()
+    if prescription is None:
+        return False
+    rendered = pdf_cache.prerender(prescription, render_prescription_pdf)
+    if rendered:
+        logger.info(f"Pre-rendered PDF for prescription {prescription_id}")
+    return rendered
@@ -1,3 +1,74 @@
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from . import pdf_signals
+from .models import Medicine, Prescription, PrescriptionItem
+from .services import pdf_cache
+
+User = get_user_model()
+
+
+class PdfCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("+919800000001", first_name="Asha", last_name="Patil")
+        self.medicine = Medicine.objects.create(name="Amoxicillin 500mg")
+        self.prescription = Prescription.objects.create(user=self.user, doctor_name="Dr. Rao", notes="After meals")
+        self.item = PrescriptionItem.objects.create(
+            prescription=self.prescription, medicine=self.medicine, morning=True,
+            before_after_food="after", duration_days=5,
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, value in (("BACKEND", "filesystem"), ("CACHE_DIR", directory.name)):
+            patcher = mock.patch.object(pdf_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.render = mock.Mock(side_effect=lambda prescription: f"pdf {prescription.notes}".encode())
+
+    def test_fingerprint_follows_what_the_pdf_shows(self):
+        digest = pdf_cache.fingerprint(self.prescription)
+        self.assertEqual(pdf_cache.fingerprint(Prescription.objects.get(pk=self.prescription.pk)), digest)
+
+        self.item.evening = True
+        self.item.save()
+        after_item = pdf_cache.fingerprint(self.prescription)
+        self.assertNotEqual(after_item, digest)
+
+        Medicine.objects.filter(pk=self.medicine.pk).update(name="Amoxicillin 250mg")
+        self.assertNotEqual(pdf_cache.fingerprint(self.prescription), after_item)
+
+        other = Prescription.objects.create(user=self.user, doctor_name="Dr. Rao", notes="After meals")
+        self.assertNotEqual(pdf_cache.fingerprint(other), pdf_cache.fingerprint(self.prescription))
+
+    def test_renders_once_per_version(self):
+        self.assertEqual(pdf_cache.get_or_render(self.prescription, self.render), b"pdf After meals")
+        self.assertEqual(pdf_cache.get_or_render(self.prescription, self.render), b"pdf After meals")
+        self.assertEqual(self.render.call_count, 1)
+        with pdf_cache.open_cached(self.prescription) as pdf_file:
+            self.assertEqual(pdf_file.read(), b"pdf After meals")
+
+        self.prescription.notes = "Before meals"
+        self.prescription.save()
+        self.assertIsNone(pdf_cache.open_cached(self.prescription))
+        self.assertEqual(pdf_cache.get_or_render(self.prescription, self.render), b"pdf Before meals")
+        # The old version was replaced, not kept alongside
+        self.assertEqual(pdf_cache.get_store().size()["entries"], 1)
+
+    def test_prerender_skips_cached_versions(self):
+        self.assertTrue(pdf_cache.prerender(self.prescription, self.render))
+        self.assertFalse(pdf_cache.prerender(self.prescription, self.render))
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_invalidate_drops_every_version(self):
+        pdf_cache.get_or_render(self.prescription, self.render)
+        pdf_cache.invalidate(self.prescription.pk)
+        self.assertEqual(pdf_cache.get_store().size()["entries"], 0)
+
+    def test_item_changes_schedule_a_render_after_commit(self):
+        with mock.patch.object(pdf_signals, "schedule_prerender") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.item.delete()
+        schedule.assert_called_once_with(self.prescription.pk)
@@ -3,7 +3,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from .throttles import WhatsAppPrescriptionThrottle
 
 from .serializers import PrescriptionSerializer
@@ -11,7 +11,10 @@ from ..appointments.models import Appointment
 from .models import Prescription
 from .services.send import send_pdf_on_whatsapp 
 from .services.pdf import generate_prescription_pdf
+from .services import pdf_cache
+import logging
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class Prescriptions(APIView):
     # throttle_classes = [WhatsAppPrescriptionThrottle]
@@ -38,6 +41,7 @@ class Prescriptions(APIView):
         prescription = (
             Prescription.objects
             .filter(user=user)
+            .select_related("user")
             .order_by("-issued_at")
             .first()
         )
@@ -130,12 +134,21 @@ class PrescriptionPDFView(APIView):
                 {"error": "No prescription found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        filename = f"prescription_{prescription.id}.pdf"
+        # Normally rendered by a worker when the prescription was saved
+        pdf_file = pdf_cache.open_cached(prescription)
+        if pdf_file is not None:
+            return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
+
+        # The Redis store can't be streamed from and is read below instead
+        if pdf_cache.BACKEND == "filesystem":
+            logger.warning(f"PDF for prescription {prescription.id} was not pre-rendered, rendering now")
         try:
             pdf = generate_prescription_pdf(prescription)
 
             response = HttpResponse(content_type='application/pdf')
             response['Content-Disposition'] = (
-                f'attachment; filename="prescription_{prescription.id}.pdf"'
+                f'attachment; filename="{filename}"'
             )
             response.write(pdf)
             return response  # Added missing return statement
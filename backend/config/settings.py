@@ -41,6 +41,15 @@ if DEV_MODE == "True":
             "PORT": 5432,
         }
     }
+    # Local dev without docker. Appointment overlaps are then checked in
+    # Appointment.clean() since SQLite has no exclusion constraints.
+    if os.getenv("USE_SQLITE") == "True":
+        DATABASES = {
+            "default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": BASE_DIR / "db.sqlite3",
+            }
+        }
 else:
     DEBUG = False
     DATABASE_URL = os.getenv("DATABASE_URL")
@@ -97,15 +106,75 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = "accounts.User"
 
-CELERY_BROKER_URL = "redis://redis:6379/0"
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
+
+# Redis for shared state between web and worker processes (slot holds, queues, rate limits)
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Seconds. Callers fail open when Redis is down, which only helps if they find out quickly
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 1))
+
+# How long a slot hold keeps a slot reserved during checkout
+SLOT_HOLD_SECONDS = int(os.getenv("SLOT_HOLD_SECONDS", 300))
+
+# Shared cache. Falls back to per-process memory when Redis isn't configured.
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL")
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 
+# Safety net for outbox messages whose on-commit wake-up was lost
+CELERY_BEAT_SCHEDULE = {
+    "drain-outbox": {
+        "task": "apps.common.tasks.drain_outbox",
+        "schedule": 30.0,
+    },
+    "flush-delivery-statuses": {
+        "task": "apps.common.tasks.flush_delivery_statuses",
+        "schedule": 5.0,
+    },
+    "send-reminders": {
+        "task": "apps.appointments.tasks.send_reminders",
+        "schedule": 300.0,
+    },
+}
+
+# WhatsApp outbox: messages claimed per batch and sent concurrently per worker
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", 8))
+# Change notifications wait this long for further edits to the same object; 0 sends right away
+NOTIFICATION_DEBOUNCE_SECONDS = int(os.getenv("NOTIFICATION_DEBOUNCE_SECONDS", 60))
+
+# Rendered prescription PDFs: "filesystem", "redis" or "none" to always render
+PRESCRIPTION_PDF_CACHE = os.getenv("PRESCRIPTION_PDF_CACHE", "filesystem")
+PRESCRIPTION_PDF_CACHE_DIR = os.getenv("PRESCRIPTION_PDF_CACHE_DIR", BASE_DIR / "var" / "prescription_pdfs")
+
 # Twilio Settings (for future use)
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = "whatsapp:+14155238886"
 TWILIO_PHONE_NUMBER = "+19302079230"
+# Approved WhatsApp template for new prescriptions (same SID as whatsapp_client)
+T2_PRESCRIPTION_SID = os.getenv("T2_PRESCRIPTION_SID")
+
+# "fake" logs messages instead of calling Twilio
+MESSAGING_CLIENT = os.getenv("MESSAGING_CLIENT", "twilio")
+# Delivery updates for sent messages, e.g. https://<whatsapp_client>/twilio/status
+TWILIO_STATUS_CALLBACK_URL = os.getenv("TWILIO_STATUS_CALLBACK_URL")
+# Point the Twilio client elsewhere, e.g. http://localhost:8765 for `manage.py fake_twilio`
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+MESSAGING_POOL_SIZE = int(os.getenv("MESSAGING_POOL_SIZE", max(10, OUTBOX_CONCURRENCY)))
+# Per sender number token bucket shared by every process through Redis
+MESSAGING_RATE_PER_SECOND = float(os.getenv("MESSAGING_RATE_PER_SECOND", 20))
+MESSAGING_BURST = int(os.getenv("MESSAGING_BURST", 20))
+MESSAGING_MAX_WAITERS = int(os.getenv("MESSAGING_MAX_WAITERS", 200))
+MESSAGING_MAX_WAIT_SECONDS = int(os.getenv("MESSAGING_MAX_WAIT_SECONDS", 30))
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -1,14 +1,19 @@
 import json
 import os
+import time
 from fastapi import FastAPI, Form, Response, Request
-from twilio.rest import Client
 from redis import Redis
 from dotenv import load_dotenv
 from fastapi import FastAPI, Form, Response, HTTPException
 import httpx
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from twilio.request_validator import RequestValidator
 
 load_dotenv()
 
+from twilio_client import send_message
+
 app = FastAPI()
 
 T1_STANDARD_SID = os.getenv("T1_STANDARD_SID")
@@ -25,8 +30,22 @@ FASTAPI_DOMAIN = os.getenv("FASTAPI_DOMAIN")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 
-redis_client = Redis(host='localhost', port=6379, db=0, decode_responses=True)
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Shared with the backend, which persists the buffered status callbacks
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATUS_QUEUE_KEY = "twilio:status-callbacks"
+
+redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+# Status callbacks are signed with the account's auth token. Without a token
+# nothing can be verified, so every callback is rejected.
+request_validator = RequestValidator(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else None
+
+
+def signed_url(request: Request):
+    """The URL Twilio signed: the public one behind ngrok or a proxy."""
+    if not FASTAPI_DOMAIN:
+        return str(request.url)
+    query = f"?{request.url.query}" if request.url.query else ""
+    return f"{FASTAPI_DOMAIN}{request.url.path}{query}"
 
 
 @app.post("/twilio/status")
@@ -36,8 +55,21 @@ async def twilio_status(request: Request):
     Useful to debug why a Content SID didn't render/deliver.
     """
     form = await request.form()
-    # Twilio sends fields like: MessageSid, MessageStatus, ErrorCode, ErrorMessage (varies by channel)
-    print("TWILIO STATUS:", dict(form))
+    # Statuses end up in MessageDelivery, so only take them from Twilio
+    signature = request.headers.get("X-Twilio-Signature", "")
+    if request_validator is None or not request_validator.validate(signed_url(request), dict(form), signature):
+        print("Rejected status callback with a missing or invalid signature")
+        return Response(status_code=403)
+    # Twilio sends fields like: MessageSid, MessageStatus, ErrorCode, ErrorMessage (varies by channel).
+    # Only buffer here so bursts stay cheap; the backend flushes the list to MessageDelivery in batches.
+    redis_client.rpush(STATUS_QUEUE_KEY, json.dumps({
+        "sid": form.get("MessageSid"),
+        "status": form.get("MessageStatus"),
+        "to": form.get("To"),
+        "error_code": form.get("ErrorCode"),
+        "error_message": form.get("ErrorMessage"),
+        "at": time.time(),
+    }))
     return Response(status_code=200)
 
 async def check_prescription(patient_id: str):
@@ -62,20 +94,34 @@ async def check_prescription(patient_id: str):
 @app.get("/fetch-prescription/{rx_id}")
 async def fetch_prescription(rx_id: str, patient_id: str):
     clean_phone = patient_id.replace("whatsapp:", "")
-    async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(
-            f"{DJANGO_BACKEND_URL}/prescriptions/send_pdf/",
-            params={"source": "whatsapp", "phone_number": clean_phone}
-        )
+    # Stream the backend's pre-rendered file through instead of buffering it
+    http_client = httpx.AsyncClient()
+    request = http_client.build_request(
+        "GET",
+        f"{DJANGO_BACKEND_URL}/prescriptions/send_pdf/",
+        params={"source": "whatsapp", "phone_number": clean_phone}
+    )
+    response = await http_client.send(request, stream=True)
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=404, detail="Prescription not found")
-        
-        return Response(
-            content=response.content,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=prescription_{rx_id}.pdf"}
-        )
+    async def close():
+        await response.aclose()
+        await http_client.aclose()
+
+    if response.status_code != 200:
+        await close()
+        raise HTTPException(status_code=404, detail="Prescription not found")
+
+    headers = {"Content-Disposition": f"attachment; filename=prescription_{rx_id}.pdf"}
+    # Raw bytes are passed on, so their length and encoding go with them
+    for name in ("Content-Length", "Content-Encoding"):
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    return StreamingResponse(
+        response.aiter_raw(),
+        media_type="application/pdf",
+        headers=headers,
+        background=BackgroundTask(close)
+    )
 
 @app.post("/whatsapp")
 async def whatsapp_webhook(
@@ -111,7 +157,7 @@ async def whatsapp_webhook(
         # Show existing user menu if they have a prescription, otherwise general menu
         target_sid = T2_EXISTING_USER_SID if has_prescription else T1_STANDARD_SID
 
-        client.messages.create(
+        await send_message(
             from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
             to=patient_id,
             content_sid=target_sid
@@ -128,7 +174,7 @@ async def whatsapp_webhook(
         if message == "show_last": 
             rx_id = redis_client.get(f"rx_id:{patient_id}")
             if not rx_id:
-                client.messages.create(
+                await send_message(
                     from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                     to=patient_id,
                     body="❌ Could not retrieve prescription. Please try again."
@@ -139,7 +185,7 @@ async def whatsapp_webhook(
             # rx_id is now just the phone number: +919175668567
             pdf_url = f"{FASTAPI_DOMAIN}/fetch-prescription/{rx_id}?patient_id={patient_id}"
 
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Here is your latest prescription.",
@@ -148,7 +194,7 @@ async def whatsapp_webhook(
             redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
         
         elif message == "btn_query":
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Looks like you have a query. We will get back to you shortly."
@@ -157,7 +203,7 @@ async def whatsapp_webhook(
         
         elif message == "btn_book":
             print("Booking appointment...")
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Additional Notes (optional): Please provide any additional notes for your appointment."
@@ -166,7 +212,7 @@ async def whatsapp_webhook(
 
         elif message == "btn_more":
             print("Showing more options...")
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 content_sid=T3_MORE_OPTIONS_SID,
@@ -178,7 +224,7 @@ async def whatsapp_webhook(
     elif state == "MORE_MENU":
         print("IN MORE MENU state...")
         if message == "btn_query":
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Looks like you have a query. We will get back to you shortly."
@@ -186,7 +232,7 @@ async def whatsapp_webhook(
             redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
 
         elif message == "btn_treatments":
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="🦷 *Our Treatment Plans*\n\n"
@@ -201,7 +247,7 @@ async def whatsapp_webhook(
             redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
 
         elif message == "btn_about":
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="ℹ️ *About Blissful Smiles*\n\n"
@@ -217,7 +263,7 @@ async def whatsapp_webhook(
         if message == "show_last": 
             rx_id = redis_client.get(f"rx_id:{patient_id}")
             if not rx_id:
-                client.messages.create(
+                await send_message(
                     from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                     to=patient_id,
                     body="❌ Could not retrieve prescription. Please try again."
@@ -228,7 +274,7 @@ async def whatsapp_webhook(
             # rx_id is now just the phone number: +919175668567
             pdf_url = f"{FASTAPI_DOMAIN}/fetch-prescription/{rx_id}?patient_id={patient_id}"
 
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Here is your latest prescription.",
@@ -237,7 +283,7 @@ async def whatsapp_webhook(
             redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
         
         elif message == "btn_query":
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Looks like you have a query. We will get back to you shortly."
@@ -246,7 +292,7 @@ async def whatsapp_webhook(
         
         elif message == "btn_book":
             print("Booking appointment...")
-            client.messages.create(
+            await send_message(
                 from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                 to=patient_id,
                 body="Additional Notes (optional): Please provide any additional notes for your appointment."
@@ -274,21 +320,21 @@ async def whatsapp_webhook(
                 )
                 
                 if response.status_code in [200, 201]:
-                    client.messages.create(
+                    await send_message(
                         from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                         to=patient_id,
                         body="✅ Your appointment request has been received! Our team will confirm your booking shortly.\n\nThank you for choosing us! 🦷"
                     )
                     redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
                 else:
-                    client.messages.create(
+                    await send_message(
                         from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                         to=patient_id,
                         body="❌ Failed to create appointment request. Please try again later."
                     )
                     redis_client.setex(f"session:{patient_id}", 3600, "MAIN_MENU")
             except Exception as e:
-                client.messages.create(
+                await send_message(
                     from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
                     to=patient_id,
                     body=f"❌ An error occurred. Please try again later. {e}"
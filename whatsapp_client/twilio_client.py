@@ -0,0 +1,194 @@
+import itertools
+import os
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from redis import Redis, RedisError
+from starlette.concurrency import run_in_threadpool
+
+# "twilio" sends for real, "fake" prints messages instead (local dev and tests)
+MESSAGING_CLIENT = os.getenv("MESSAGING_CLIENT", "twilio")
+POOL_SIZE = int(os.getenv("MESSAGING_POOL_SIZE", 10))
+# Send Twilio API calls here instead, e.g. the backend's `manage.py fake_twilio`
+API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+
+# Same token bucket and keys as the backend (apps/common/ratelimit.py), so the
+# bot and the outbox worker share one budget per sender number. This service
+# is deployed without the backend package, so the script and acquire() are a
+# copy: change both together. The backend's test suite fails if
+# TOKEN_BUCKET_SCRIPT or KEY_PREFIX differ between the two.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+RATE_PER_SECOND = float(os.getenv("MESSAGING_RATE_PER_SECOND", 20))
+BURST = int(os.getenv("MESSAGING_BURST", 20))
+MAX_WAITERS = int(os.getenv("MESSAGING_MAX_WAITERS", 200))
+MAX_WAIT_SECONDS = int(os.getenv("MESSAGING_MAX_WAIT_SECONDS", 30))
+KEY_PREFIX = "ratelimit:whatsapp:"
+
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+_client = None
+_lock = threading.Lock()
+_redis = Redis.from_url(REDIS_URL, decode_responses=True)
+_bucket = _redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def acquire(sender):
+    """
+    Wait for a send slot on `sender`. Fails open if Redis is down. Blocks, so
+    async code must go through send_message().
+    """
+    began = time.monotonic()
+    waiting_key = f"{KEY_PREFIX}{sender}:waiting"
+    stats_key = f"{KEY_PREFIX}{sender}:stats"
+    try:
+        pipe = _redis.pipeline(transaction=False)
+        pipe.incr(waiting_key)
+        pipe.expire(waiting_key, MAX_WAIT_SECONDS * 2)
+        depth = pipe.execute()[0]
+    except RedisError as e:
+        print("Rate limiter unavailable, sending unthrottled:", e)
+        return 0.0
+
+    try:
+        if depth > MAX_WAITERS:
+            _redis.hincrby(stats_key, "rejected", 1)
+            raise RateLimitExceeded(f"{depth - 1} messages already waiting for {sender}")
+        if depth > int(_redis.hget(stats_key, "max_depth") or 0):
+            _redis.hset(stats_key, "max_depth", depth)
+
+        while True:
+            wait_ms = _bucket(keys=[f"{KEY_PREFIX}{sender}:bucket"], args=[RATE_PER_SECOND, BURST])
+            if not wait_ms:
+                break
+            if time.monotonic() - began + wait_ms / 1000 > MAX_WAIT_SECONDS:
+                _redis.hincrby(stats_key, "rejected", 1)
+                raise RateLimitExceeded(f"No send slot for {sender} within {MAX_WAIT_SECONDS}s")
+            time.sleep(wait_ms / 1000)
+
+        waited = time.monotonic() - began
+        pipe = _redis.pipeline(transaction=False)
+        pipe.hincrby(stats_key, "acquired", 1)
+        pipe.hincrby(stats_key, "wait_ms_total", int(waited * 1000))
+        pipe.execute()
+        return waited
+    except RedisError as e:
+        print("Rate limiter unavailable, sending unthrottled:", e)
+        return time.monotonic() - began
+    finally:
+        try:
+            _redis.decr(waiting_key)
+        except RedisError:
+            pass
+
+
+class RateLimitedMessages:
+    def __init__(self, messages):
+        self._messages = messages
+
+    def create(self, **kwargs):
+        acquire(kwargs.get("from_") or "default")
+        return self._messages.create(**kwargs)
+
+
+class RateLimitedClient:
+    def __init__(self, client):
+        self._client = client
+        self.messages = RateLimitedMessages(client.messages)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class FakeMessages:
+    def __init__(self):
+        self.sent = []
+        self._ids = itertools.count(1)
+
+    def create(self, **kwargs):
+        sid = f"SMfake{next(self._ids):026d}"
+        self.sent.append(dict(kwargs, sid=sid))
+        print("FAKE WHATSAPP:", kwargs)
+        return SimpleNamespace(sid=sid, status="queued", **kwargs)
+
+
+class FakeClient:
+    def __init__(self):
+        self.messages = FakeMessages()
+
+
+def build_client():
+    if MESSAGING_CLIENT == "fake":
+        return FakeClient()
+
+    # Imported on first send, twilio.rest is slow to import
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    class RebasedHttpClient(TwilioHttpClient):
+        def request(self, method, url, *args, **kwargs):
+            parts = urlsplit(url)
+            url = f"{API_BASE_URL.rstrip('/')}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            return super().request(method, url, *args, **kwargs)
+
+    http_client_class = RebasedHttpClient if API_BASE_URL else TwilioHttpClient
+    http_client = http_client_class(pool_connections=True, timeout=10)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    http_client.session.mount("https://", adapter)
+    http_client.session.mount("http://", adapter)
+    return Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"), http_client=http_client)
+
+
+def get_twilio_client():
+    """
+    One Twilio client with a keep-alive connection pool per process, built on
+    first use. Every send waits for a slot in the shared per-number bucket.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = RateLimitedClient(build_client())
+    return _client
+
+
+def set_twilio_client(client):
+    global _client
+    _client = client
+
+
+async def send_message(**kwargs):
+    """
+    Send on a worker thread, so waiting for a send slot (up to
+    MAX_WAIT_SECONDS) or for Twilio never blocks the event loop. Returns None
+    when the limiter refused the send.
+    """
+    try:
+        return await run_in_threadpool(get_twilio_client().messages.create, **kwargs)
+    except RateLimitExceeded as e:
+        print("WhatsApp send dropped, rate limited:", e)
+        return None